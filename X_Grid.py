@@ -2,23 +2,32 @@ import sys
 import os
 import fiona
 import math
+import codecs
+import re
+import json
+import shutil
+import hashlib
+import threading
+import time
+import numpy as np
 from fiona.errors import FionaError
 import sqlite3
 import xml.etree.ElementTree as ET
 from PyQt6.QtWidgets import (
-    QApplication, QGraphicsView, QGraphicsScene, QMainWindow, QPushButton,
+    QApplication, QGraphicsView, QGraphicsScene, QGraphicsItem, QGraphicsItemGroup, QGraphicsPathItem,
+    QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsPolygonItem, QGraphicsLineItem, QGraphicsPixmapItem, QMainWindow, QPushButton,
     QFileDialog, QMessageBox, QWidget, QVBoxLayout, QHBoxLayout, QLabel,
     QListWidget, QListWidgetItem, QDialog, QDialogButtonBox, QCheckBox, QFrame,
-    QLineEdit
+    QLineEdit, QRadioButton, QComboBox, QProgressDialog
 )
-from PyQt6.QtCore import Qt, QRectF, QPointF, pyqtSignal, QMarginsF, QSizeF, QPoint
+from PyQt6.QtCore import Qt, QRectF, QPointF, QLineF, pyqtSignal, QMarginsF, QSizeF, QPoint, QObject, QRunnable, QThreadPool
 from PyQt6.QtGui import (
     QColor, QPen, QBrush, QFont, QPolygonF, QPainter,
-    QCursor, QPainterPath, QPageLayout, QPageSize, QFontMetrics
+    QCursor, QPainterPath, QPageLayout, QPageSize, QFontMetrics, QImage, QPixmap, QStaticText, QTransform, QPdfWriter
 )
-from PyQt6.QtPrintSupport import QPrinter
 
-from shapely.geometry import Polygon, MultiPolygon, shape, box
+import shapely
+from shapely.geometry import box
 from shapely.ops import unary_union
 from shapely.affinity import rotate
 
@@ -43,6 +52,981 @@ def _parse_any_color_string(color_value, default_color=QColor(0, 0, 0)):
     if QColor.isValidColor(color_str): return QColor(color_str)
     return default_color
 
+def _resolve_feature_style(props):
+    final_style = DEFAULT_STYLE_INFO.copy()
+
+    fill_color_prop = props.get('fill_color')
+    if fill_color_prop is not None:
+        prop_val_str = str(fill_color_prop).strip()
+        if not prop_val_str: 
+            final_style['fill_color'] = QColor(Qt.GlobalColor.transparent)
+        else:
+            new_color = _parse_any_color_string(prop_val_str)
+            if new_color.isValid(): 
+                final_style['fill_color'] = new_color
+
+    style_key = props.get('strk_style') or props.get('stroke_dash_type') or props.get('stroke_style')
+    if style_key is not None:
+        style_val = str(style_key).lower()
+        pen_style_map = {
+            'solid': Qt.PenStyle.SolidLine, 'dot': Qt.PenStyle.DotLine,
+            'dash': Qt.PenStyle.DashLine, 'dashdot': Qt.PenStyle.DashDotLine,
+            'dashdotdot': Qt.PenStyle.DashDotDotLine, 'custom': Qt.PenStyle.CustomDashLine,
+            'none': Qt.PenStyle.NoPen, 'no': Qt.PenStyle.NoPen
+        }
+        final_style['pen_style'] = pen_style_map.get(style_val, Qt.PenStyle.SolidLine)
+
+    if final_style['pen_style'] != Qt.PenStyle.NoPen:
+        line_color_prop = props.get('strk_color') or props.get('stroke_color') or props.get('color')
+        if line_color_prop is not None:
+            new_line_color = _parse_any_color_string(str(line_color_prop))
+            if new_line_color.isValid(): 
+                final_style['line_color'] = new_line_color
+
+        line_width_prop = props.get('strk_width') or props.get('stroke_width')
+        if line_width_prop is not None:
+            try: 
+                final_style['line_width'] = float(line_width_prop)
+            except (ValueError, TypeError): 
+                pass
+        if props.get('strk_unit'): final_style['line_width_unit'] = props['strk_unit']
+
+        pattern_prop = props.get('dash_pattn') or props.get('dash_pattern')
+        if final_style.get('pen_style') == Qt.PenStyle.CustomDashLine and pattern_prop:
+            final_style['dash_pattern'] = []
+            try:
+                pattern_str = str(pattern_prop).strip().replace('[','').replace(']','')
+                scale_factor = final_style.get('line_width', 1.0)
+                pattern_list = [float(p.strip()) * scale_factor for p in pattern_str.split(',')]
+                if pattern_list: 
+                    final_style['dash_pattern'] = pattern_list
+            except (ValueError, TypeError, AttributeError):
+                final_style['dash_pattern'] = []
+                final_style['pen_style'] = Qt.PenStyle.SolidLine
+
+    current_fill_color = final_style['fill_color']
+    if current_fill_color.alpha() != 0:
+        current_fill_color.setAlpha(200)
+        final_style['fill_color'] = current_fill_color
+
+    return final_style
+
+# スタイルに関係する属性（この組み合わせごとにスタイルを1回だけ解決する）
+STYLE_KEY_COLUMNS = ('fill_color', 'strk_style', 'stroke_dash_type', 'stroke_style', 'strk_color', 'stroke_color', 'color', 'strk_width', 'stroke_width', 'dash_pattn', 'dash_pattern')
+# X_Grid Styler が書き出す列。これが揃っていれば QGIS のスタイルより属性を優先する（color などの一般的な列名だけでは判定しない）
+STYLER_COLUMNS = ('fill_color', 'strk_color', 'strk_width', 'strk_style')
+
+def _build_style_table(store, layer_style=None):
+    # 属性の組み合わせごとのスタイル表。フィーチャは表の添字だけを持ち、ブラシは読み込み時に作って共有する
+    # X_Grid Styler の属性が揃っていればそれを使い、無ければ GPKG に保存された QGIS のスタイル (layer_style) の分類で決める
+    columns = [(name, store['columns'][name]) for name in STYLE_KEY_COLUMNS if name in store['columns']]
+    if not layer_style or all(name in store['columns'] for name in STYLER_COLUMNS): resolve = lambda key: _resolve_feature_style({name: value for (name, _), value in zip(columns, key)})
+    else:
+        columns = [(name, store['columns'].get(name)) for name in layer_style['fields']]
+        resolve = lambda key: _resolve_feature_style(_match_layer_style(layer_style, dict(zip(layer_style['fields'], key))))
+    indices, styles, style_keys = np.zeros(store['count'], dtype=np.int32), [], {}
+    for index in range(store['count']):
+        key = tuple(_store_value(column, index) if column is not None else None for _, column in columns)
+        if key not in style_keys:
+            style_keys[key] = len(styles)
+            styles.append(resolve(key))
+        indices[index] = style_keys[key]
+    return _make_style_table(indices, styles)
+
+def _make_style_table(indices, styles):
+    brushes = []
+    for style in styles:
+        brush = QBrush(style['fill_color'])
+        brush.setStyle(Qt.BrushStyle.SolidPattern if style['fill_color'].alpha() != 0 else Qt.BrushStyle.NoBrush)
+        brushes.append(brush)
+    return {'indices': indices, 'styles': styles, 'brushes': brushes, 'pens': {}}
+
+def _qml_properties(element):
+    # QGIS 3 の <Option type="Map"> と旧形式の <prop k= v=> の両方に対応
+    properties = {prop.get('k'): prop.get('v') for prop in element.findall('prop')}
+    for option_map in element.findall("Option[@type='Map']"):
+        properties.update({option.get('name'): option.get('value') for option in option_map.findall('Option') if option.get('name')})
+    return properties
+
+def _qml_color(value):
+    # "r,g,b,a" または QGIS 3.34 以降の "r,g,b,a,rgb:..." を X_Grid Styler と同じ #AARRGGBB 形式にする
+    parts = (value or '').split(',')
+    try: return QColor(*[int(part) for part in parts[:4]]).name(QColor.NameFormat.HexArgb) if len(parts) >= 4 else ''
+    except ValueError: return ''
+
+# QML の線幅の単位 → (mm への換算係数, X_Grid の単位)。地図単位はメートルとして縮尺で換算する
+QML_WIDTH_UNITS = {'MM': (1.0, 'MM'), 'Point': (25.4 / 72, 'MM'), 'Inch': (25.4, 'MM'), 'Pixel': (1.0, 'PIXEL'), 'MapUnit': (1.0, 'MAPUNIT'), 'RenderMetersInMapUnits': (1.0, 'MAPUNIT')}
+
+def _qml_symbol_properties(symbol):
+    # X_Grid Styler がシンボルから書き出す属性と同じ内容を作る（単純塗りつぶし・単純ラインのみ対応）。線幅の単位は strk_unit で渡す
+    props = {"fill_color": "", "strk_color": "", "strk_width": "0.0", "strk_style": "solid", "dash_pattn": "", "strk_unit": "MM"}
+    for symbol_layer in symbol.findall('layer'):
+        if symbol_layer.get('enabled', '1') == '0': continue
+        layer_props, layer_class = _qml_properties(symbol_layer), symbol_layer.get('class')
+        if layer_class == 'SimpleFill':
+            if layer_props.get('style', 'solid') != 'no' and QColor(_qml_color(layer_props.get('color'))).alpha() > 0: props['fill_color'] = _qml_color(layer_props.get('color'))
+            stroke_color, stroke_style, stroke_width, width_unit = _qml_color(layer_props.get('outline_color')), layer_props.get('outline_style', 'solid'), layer_props.get('outline_width', '0.26'), layer_props.get('outline_width_unit')
+        elif layer_class == 'SimpleLine':
+            stroke_color, stroke_style, stroke_width, width_unit = _qml_color(layer_props.get('line_color') or layer_props.get('color')), layer_props.get('line_style', 'solid'), layer_props.get('line_width', '0.26'), layer_props.get('line_width_unit')
+        else: continue
+        factor, unit = QML_WIDTH_UNITS.get(width_unit or 'MM', (1.0, 'MM'))
+        try: stroke_width = str(float(stroke_width) * factor)
+        except ValueError: pass
+        if stroke_style == 'no' or not stroke_color or QColor(stroke_color).alpha() == 0:
+            props.update({'strk_style': "none", 'strk_color': "", 'strk_width': "0.0", 'dash_pattn': ""})
+        else:
+            props.update({'strk_color': stroke_color, 'strk_width': stroke_width, 'strk_style': stroke_style.replace(' ', ''), 'strk_unit': unit})
+            props['dash_pattn'] = ",".join((layer_props.get('customdash') or '').split(';')) if layer_props.get('use_custom_dash') == '1' else ""
+    return props
+
+QML_FIELD_PATTERN = r'(?:"([^"]+)"|(\w+))'
+QML_VALUE_PATTERN = r"'((?:[^']|'')*)'|(-?\d+(?:\.\d+)?)"
+
+def _parse_qml_filter(expression):
+    # ルールの式は「"列" = 値」「"列" IN (値, ...)」「ELSE」だけを解釈する。戻り値は (列名, 値の集合)、全件一致は None
+    expression = (expression or '').strip()
+    if not expression: return None
+    if expression.upper() == 'ELSE': return 'ELSE'
+    match = re.fullmatch(QML_FIELD_PATTERN + r'\s*(=|IN)\s*(.+)', expression, re.IGNORECASE | re.DOTALL)
+    if not match: raise ValueError(f"未対応のルール式: {expression}")
+    field, operator, values_text = match.group(1) or match.group(2), match.group(3).upper(), match.group(4).strip()
+    if operator == 'IN':
+        if not (values_text.startswith('(') and values_text.endswith(')')): raise ValueError(f"未対応のルール式: {expression}")
+        values_text = values_text[1:-1]
+    values = [quoted.replace("''", "'") if number == '' else number for quoted, number in re.findall(QML_VALUE_PATTERN, values_text)]
+    if not values or (operator == '=' and len(values) != 1): raise ValueError(f"未対応のルール式: {expression}")
+    return field, {_category_key(value) for value in values}
+
+def _category_key(value):
+    # 属性値と QML の分類値を文字列で比較する（数値列の 1.0 と分類値 "1" を同じとみなす）
+    if value is None: return None
+    if isinstance(value, str):
+        try: value = float(value) if re.fullmatch(r'-?\d+(?:\.\d+)?', value.strip()) else value
+        except ValueError: pass
+    if isinstance(value, float) and value.is_integer(): return str(int(value))
+    return str(value)
+
+def _parse_qml_renderer(qml_text):
+    # QML の単一シンボル・分類・ルールによる定義を {'fields', 'rules', 'else', 'default'} の小さな表にする
+    renderer = ET.fromstring(qml_text).find('.//renderer-v2')
+    if renderer is None: return None
+    symbols = {symbol.get('name'): _qml_symbol_properties(symbol) for symbol in renderer.findall('./symbols/symbol')}
+    renderer_type, rules, else_props, default_props = renderer.get('type'), [], None, None
+    if renderer_type == 'singleSymbol': default_props = symbols.get('0')
+    elif renderer_type == 'categorizedSymbol':
+        field = renderer.get('attr', '').strip()
+        match = re.fullmatch(QML_FIELD_PATTERN, field)
+        if not match: raise ValueError(f"式による分類には未対応です: {field}")
+        field = match.group(1) or match.group(2)
+        for category in renderer.findall('./categories/category'):
+            props = symbols.get(category.get('symbol')) if category.get('render', 'true') != 'false' else {'strk_style': 'none', 'fill_color': ''}
+            if props is None: continue
+            # 値が空の分類は「その他すべての値」
+            if category.get('value', '') == '': else_props = props
+            else: rules.append(([(field, {_category_key(category.get('value'))})], props))
+    elif renderer_type == 'RuleRenderer':
+        def walk(rule_element, conditions):
+            for rule in rule_element.findall('rule'):
+                if rule.get('active', '1') == '0': continue
+                try: condition = 'ELSE' if rule.get('isElse') == '1' else _parse_qml_filter(rule.get('filter'))
+                except ValueError as e: print(f"警告: {e}"); continue
+                nonlocal else_props
+                if condition == 'ELSE':
+                    if rule.get('symbol') in symbols and else_props is None: else_props = symbols[rule.get('symbol')]
+                    continue
+                rule_conditions = conditions + ([condition] if condition else [])
+                if rule.get('symbol') in symbols: rules.append((rule_conditions, symbols[rule.get('symbol')]))
+                walk(rule, rule_conditions)
+        walk(renderer.find('rules'), [])
+    else: raise ValueError(f"未対応のレンダラーです: {renderer_type}")
+    fields = sorted({field for conditions, _ in rules for field, _ in conditions})
+    return {'fields': fields, 'rules': rules, 'else': else_props, 'default': default_props}
+
+def _match_layer_style(layer_style, values):
+    # 最初に一致した分類・ルールのスタイル（X_Grid Styler 形式の属性辞書）を返す
+    keys = {field: _category_key(value) for field, value in values.items()}
+    for conditions, props in layer_style['rules']:
+        if all(keys.get(field) in allowed for field, allowed in conditions): return props
+    return layer_style['else'] or layer_style['default'] or {}
+
+def _read_gpkg_layer_style(file_path, layer_name):
+    # QGIS が GPKG の layer_styles テーブルに保存したスタイル（既定のもの、無ければ最新）をレイヤごとに1回だけ読む
+    if layer_name is None or not file_path.lower().endswith('.gpkg'): return None
+    try:
+        connection = sqlite3.connect(file_path)
+        try:
+            if not connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'layer_styles'").fetchone(): return None
+            row = connection.execute("SELECT styleQML FROM layer_styles WHERE f_table_name = ? AND styleQML IS NOT NULL ORDER BY useAsDefault DESC, update_time DESC LIMIT 1", (layer_name,)).fetchone()
+        finally: connection.close()
+        return _parse_qml_renderer(row[0]) if row and row[0] else None
+    except (sqlite3.Error, ET.ParseError, ValueError) as e:
+        print(f"警告: レイヤ '{layer_name}' の QGIS スタイルを読み込めませんでした。理由: {e}")
+        return None
+
+# 簡略化の段階（シーン座標での許容誤差をセル辺長に対する比で表す）。画面上で半ピクセル以下になる最も粗い段階を使う
+LOD_CELL_FRACTIONS = (1 / 64, 1 / 16, 1 / 4, 1)
+LOD_PIXEL_TOLERANCE = 0.5
+
+def _select_lod_tolerance(view_scale, cell_size):
+    if view_scale <= 0: return None
+    tolerance = LOD_PIXEL_TOLERANCE / view_scale
+    candidates = [cell_size * fraction for fraction in LOD_CELL_FRACTIONS if cell_size * fraction <= tolerance]
+    return max(candidates) if candidates else None
+
+def _simplify_store(store, world_tolerance):
+    # トポロジーを保ったまま簡略化し、元と同じフィーチャ順の列形式に戻す（属性列は共有）
+    # 面は隣接林班の共有境界を一度だけ簡略化する（フィーチャ単位だと境界ごとに結果が異なり、隙間や重なりが出る）
+    geometries = _store_geometries(store)
+    if store['family'] == 'Polygon' and hasattr(shapely, 'coverage_simplify'): simplified = shapely.coverage_simplify(geometries, world_tolerance)
+    else: simplified = shapely.simplify(geometries, world_tolerance, preserve_topology=True)
+    geometry_type, coords, offsets = shapely.to_ragged_array(simplified)
+    # 全フィーチャが1部品だと単一型 (Polygon/LineString) で返るため、フィーチャ単位のオフセットを補う
+    if geometry_type in (shapely.GeometryType.POLYGON, shapely.GeometryType.LINESTRING): offsets = tuple(offsets) + (np.arange(store['count'] + 1),)
+    return {'family': store['family'], 'count': store['count'], 'coords': coords, 'offsets': tuple(np.asarray(offset, dtype=np.int64) for offset in offsets), 'columns': store['columns']}
+
+def _build_style_pen(style, map_scale, view_scale):
+    pen_width_in_scene_units, unit, width_val = 0.0, style.get('line_width_unit', 'MM').upper(), style.get('line_width', 0)
+    if unit == 'MM': pen_width_in_scene_units = (width_val * 5.0) * map_scale
+    elif unit == 'MAPUNIT': pen_width_in_scene_units = width_val * map_scale
+    elif unit in ('PIXEL', 'PX'):
+        if view_scale > 0: pen_width_in_scene_units = width_val / view_scale
+    pen = QPen(style['line_color'], pen_width_in_scene_units)
+    pen.setStyle(style['pen_style'])
+    if style['pen_style'] == Qt.PenStyle.CustomDashLine and style['dash_pattern']: pen.setDashPattern(style['dash_pattern'])
+    pen.setCosmetic(False)
+    return pen
+
+def _apply_affine(matrix, coords):
+    points = np.asarray(coords, dtype=np.float64).reshape(-1, np.shape(coords)[-1])[:, :2]
+    return points @ matrix[:2, :2].T + matrix[:2, 2]
+
+def _array_to_qpolygonf(points):
+    # QPolygonF の内部バッファへ座標配列を直接書き込み、QPointF を1点ずつ生成しない
+    polygon = QPolygonF()
+    polygon.resize(len(points))
+    if len(points):
+        buffer = polygon.data(); buffer.setsize(len(points) * 2 * np.dtype(np.float64).itemsize)
+        np.frombuffer(buffer, dtype=np.float64).reshape(-1, 2)[:] = points
+    return polygon
+
+# 描画（スタイル・延長ラベル）で参照する属性だけを列として保持する
+FEATURE_STORE_COLUMNS = (
+    'fill_color', 'strk_style', 'stroke_dash_type', 'stroke_style', 'strk_color', 'stroke_color', 'color',
+    'strk_width', 'stroke_width', 'dash_pattn', 'dash_pattern', 'meter'
+)
+
+def _geometry_family(geom_type):
+    for family in ('Polygon', 'LineString', 'Point'):
+        if family in (geom_type or ''): return family
+    return None
+
+def _coords_array(coords):
+    if not coords: return np.empty((0, 2), dtype=np.float64)
+    return np.asarray(coords, dtype=np.float64).reshape(len(coords), -1)[:, :2]
+
+def _column_array(values):
+    # 数値だけの列は float64（欠損は NaN）、それ以外は object 配列
+    if all(value is None or (isinstance(value, (int, float)) and not isinstance(value, bool)) for value in values):
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    column = np.empty(len(values), dtype=object); column[:] = values
+    return column
+
+def _build_feature_store(features, geom_type=None, extra_columns=()):
+    # fiona のフィーチャを、連続した座標配列 + shapely の ragged array 形式のオフセット配列 + 必要な属性列に変換する
+    # （Polygon/LineString/Point はそれぞれ Multi 型として格納）
+    column_names = FEATURE_STORE_COLUMNS + tuple(name for name in extra_columns if name not in FEATURE_STORE_COLUMNS)
+    family, coord_parts, property_rows, present_columns = _geometry_family(geom_type), [], [], set()
+    coord_offsets, part_offsets, feature_offsets = [0], [0], [0]
+    for feature in features:
+        geom = feature.get('geometry')
+        if not geom or not geom.get('coordinates'): continue
+        geom_family = _geometry_family(geom['type'])
+        if family is None: family = geom_family
+        if geom_family != family: continue
+        coordinates = geom['coordinates'] if geom['type'].startswith('Multi') else [geom['coordinates']]
+        if family == 'Polygon':
+            polygons = [rings for rings in ([ring for ring in map(_coords_array, polygon) if len(ring) >= 3] for polygon in coordinates) if rings]
+            if not polygons: continue
+            for rings in polygons:
+                coord_parts.extend(rings); coord_offsets.extend(coord_offsets[-1] + np.cumsum([len(ring) for ring in rings])); part_offsets.append(len(coord_offsets) - 1)
+            feature_offsets.append(len(part_offsets) - 1)
+        else:
+            parts = [_coords_array([point]) for point in coordinates] if family == 'Point' else [part for part in map(_coords_array, coordinates) if len(part) >= 2]
+            if not parts: continue
+            coord_parts.extend(parts); coord_offsets.extend(coord_offsets[-1] + np.cumsum([len(part) for part in parts])); feature_offsets.append(len(coord_offsets) - 1)
+        properties = feature.get('properties') or {}
+        property_rows.append(tuple(properties.get(name) for name in column_names))
+        present_columns.update(name for name in column_names if name in properties)
+    offsets = {'Polygon': (coord_offsets, part_offsets, feature_offsets), 'LineString': (coord_offsets, feature_offsets)}.get(family, (feature_offsets,))
+    return {
+        'family': family, 'count': len(feature_offsets) - 1,
+        'coords': np.concatenate(coord_parts) if coord_parts else np.empty((0, 2), dtype=np.float64),
+        'offsets': tuple(np.asarray(offset, dtype=np.int64) for offset in offsets),
+        'columns': {name: _column_array([row[i] for row in property_rows]) for i, name in enumerate(column_names) if name in present_columns}
+    }
+
+def _store_feature_parts(store):
+    # 各フィーチャの部品（ポリゴンはリング、ラインはパート、ポイントは点）の範囲を、座標オフセット配列の添字で返す
+    offsets = store['offsets']
+    if store['family'] == 'Polygon': return offsets[0], offsets[1][offsets[2]]
+    if store['family'] == 'LineString': return offsets[0], offsets[1]
+    return np.arange(len(store['coords']) + 1, dtype=np.int64), offsets[0]
+
+def _store_value(column, index):
+    value = column[index]
+    # 数値列の NaN は元の欠損値 (None) に戻す
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+def _store_geometries(store):
+    if not store['count']: return np.empty(0, dtype=object)
+    geometry_type = {'Polygon': shapely.GeometryType.MULTIPOLYGON, 'LineString': shapely.GeometryType.MULTILINESTRING, 'Point': shapely.GeometryType.MULTIPOINT}[store['family']]
+    return shapely.from_ragged_array(geometry_type, store['coords'], store['offsets'])
+
+def _store_valid_geoms(store):
+    # 読み込み時に一度だけ buffer(0) で修正した検証済みジオメトリ（空は除外）
+    geoms = _store_geometries(store)
+    invalid = ~shapely.is_valid(geoms)
+    if invalid.any(): geoms[invalid] = shapely.buffer(geoms[invalid], 0)
+    return geoms[~shapely.is_empty(geoms)]
+
+def _build_valid_geoms(features):
+    return list(_store_valid_geoms(_build_feature_store(features)))
+
+def _compute_coverage_fractions(geom, origin_x, origin_y, cell_size, rows, cols):
+    fractions = np.zeros((rows, cols))
+    if geom is None or geom.is_empty or rows <= 0 or cols <= 0: return fractions
+    polygons = shapely.get_parts(geom)
+    polygons = polygons[shapely.get_type_id(polygons) == 3]
+    if polygons.size == 0: return fractions
+    rings, ring_polygon_index = shapely.get_rings(polygons, return_index=True)
+    is_exterior = np.r_[True, ring_polygon_index[1:] != ring_polygon_index[:-1]]
+    coords, ring_index = shapely.get_coordinates(rings, return_index=True)
+    # セル幅を 1 とするグリッド座標系 (u: 列方向, v: 行方向)
+    u, v = (coords[:, 0] - origin_x) / cell_size, (coords[:, 1] - origin_y) / cell_size
+    same_ring = ring_index[:-1] == ring_index[1:]
+    u1, v1, u2, v2, edge_ring = u[:-1][same_ring], v[:-1][same_ring], u[1:][same_ring], v[1:][same_ring], ring_index[:-1][same_ring]
+    # 外周と穴の向きをそろえる重み（リングの向きに依存せず、穴は減算されるようにする）
+    ring_signed_area = np.bincount(edge_ring, weights=u1 * v2 - u2 * v1, minlength=len(rings))
+    ring_weight = np.where(is_exterior, -1.0, 1.0) * np.sign(ring_signed_area)
+    edge_weight = ring_weight[edge_ring]
+    du, dv = u2 - u1, v2 - v1
+    def split_params(start, delta, limit):
+        lo = np.maximum(np.floor(np.minimum(start, start + delta)) + 1, 0)
+        hi = np.minimum(np.ceil(np.maximum(start, start + delta)) - 1, limit)
+        counts = np.maximum(hi - lo + 1, 0).astype(np.int64)
+        edge_ids = np.repeat(np.arange(len(start)), counts)
+        steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return edge_ids, (np.repeat(lo, counts) + steps - start[edge_ids]) / delta[edge_ids]
+    u_edges, u_params = split_params(u1, du, cols)
+    v_edges, v_params = split_params(v1, dv, rows)
+    edge_count = len(u1)
+    piece_edges = np.concatenate([np.arange(edge_count), np.arange(edge_count), u_edges, v_edges])
+    piece_params = np.concatenate([np.zeros(edge_count), np.ones(edge_count), u_params, v_params])
+    order = np.lexsort((piece_params, piece_edges))
+    piece_edges, piece_params = piece_edges[order], piece_params[order]
+    keep = piece_edges[:-1] == piece_edges[1:]
+    e, ta, tb = piece_edges[:-1][keep], piece_params[:-1][keep], piece_params[1:][keep]
+    ua, ub, va, vb = u1[e] + ta * du[e], u1[e] + tb * du[e], v1[e] + ta * dv[e], v1[e] + tb * dv[e]
+    col = np.floor((ua + ub) / 2).astype(np.int64)
+    band = np.floor((va + vb) / 2).astype(np.int64)
+    inside_cols = (col >= 0) & (col < cols) & (band >= 0)
+    col, band, dx, vm, w = col[inside_cols], band[inside_cols], (ub - ua)[inside_cols], ((va + vb) / 2)[inside_cols], edge_weight[e][inside_cols]
+    # 区間が属する行には台形面積を、それより上の行（v が小さい行）には区間幅ぶんの全面積を加算
+    partial = band < rows
+    np.add.at(fractions, (band[partial], col[partial]), w[partial] * dx[partial] * (vm[partial] - band[partial]))
+    full_rows = np.zeros((rows + 1, cols))
+    np.add.at(full_rows, (np.minimum(band, rows), col), w * dx)
+    fractions += np.cumsum(full_rows[::-1], axis=0)[::-1][1:]
+    return fractions
+
+def _rotation_fit_intervals(hull, target_width, target_height, start_deg=0.0, end_deg=90.0):
+    # 凸包の辺が座標軸と平行になる角度（回転キャリパーの候補角）で区間を分け、各区間で幅・高さを正弦波として解析的に解く
+    if hull is None or hull.is_empty: return []
+    points = shapely.get_coordinates(hull)
+    if len(points) > 1 and np.array_equal(points[0], points[-1]): points = points[:-1]
+    min_xy, max_xy = points.min(axis=0), points.max(axis=0)
+    points = points - (min_xy + max_xy) / 2
+    start, end = math.radians(start_deg), math.radians(end_deg)
+    edges = np.diff(np.vstack([points, points[:1]]), axis=0) if len(points) > 1 else np.zeros((0, 2))
+    edge_angles = np.mod(-np.arctan2(edges[:, 1], edges[:, 0]), math.pi / 2)
+    breakpoints = np.unique(np.concatenate([[start, end], np.concatenate([edge_angles + k * math.pi / 2 for k in range(-1, 5)])]))
+    breakpoints = breakpoints[(breakpoints >= start) & (breakpoints <= end)]
+    def solve(a, b, target, lo, hi):
+        # a*cosθ + b*sinθ <= target となる [lo, hi] 内の区間
+        radius = math.hypot(a, b)
+        if radius <= target: return [(lo, hi)]
+        phase, delta = math.atan2(b, a), math.acos(max(-1.0, target / radius))
+        found = []
+        for k in range(-2, 3):
+            s, e = max(lo, phase + delta + 2 * math.pi * k), min(hi, phase + 2 * math.pi - delta + 2 * math.pi * k)
+            if s <= e: found.append((s, e))
+        return found
+    feasible = []
+    for lo, hi in zip(breakpoints[:-1], breakpoints[1:]):
+        mid = (lo + hi) / 2
+        cos_m, sin_m = math.cos(mid), math.sin(mid)
+        proj_u, proj_v = points[:, 0] * cos_m - points[:, 1] * sin_m, points[:, 0] * sin_m + points[:, 1] * cos_m
+        du, dv = points[np.argmax(proj_u)] - points[np.argmin(proj_u)], points[np.argmax(proj_v)] - points[np.argmin(proj_v)]
+        for ws, we in solve(du[0], -du[1], target_width, lo, hi):
+            for hs, he in solve(dv[1], dv[0], target_height, lo, hi):
+                s, e = max(ws, hs), min(we, he)
+                if s <= e: feasible.append((s, e))
+    merged = []
+    for s, e in sorted(feasible):
+        if merged and s <= merged[-1][1] + 1e-12: merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+        else: merged.append((s, e))
+    return [(math.degrees(s), math.degrees(e)) for s, e in merged]
+
+GRID_SIZE_A4 = (45, 30)
+GRID_SIZE_A3 = (45, 73)
+
+ENCODING_SAMPLE_RECORDS = 1000
+ENCODING_DISPLAY_NAMES = {'utf-8': 'UTF-8', 'cp932': 'Shift_JIS'}
+
+def _normalize_encoding_name(name):
+    key = name.strip().lower().replace('-', '').replace('_', '').replace(' ', '')
+    aliases = {'utf8': 'utf-8', '65001': 'utf-8', 'sjis': 'cp932', 'shiftjis': 'cp932', 'cp932': 'cp932', '932': 'cp932', 'ansi932': 'cp932', 'ms932': 'cp932', 'windows31j': 'cp932'}
+    if key in aliases: return aliases[key]
+    try: return codecs.lookup(name.strip()).name
+    except LookupError: return None
+
+def _sidecar_path(file_path, extension):
+    base = os.path.splitext(file_path)[0]
+    return next((base + ext for ext in (extension.lower(), extension.upper()) if os.path.exists(base + ext)), None)
+
+def _resolve_encoding(file_path, sample_records=ENCODING_SAMPLE_RECORDS):
+    # 読み込み前に文字コードを決め、データセットを1回だけ開く（GPKG は仕様上 UTF-8）
+    if not file_path.lower().endswith('.shp'): return 'utf-8'
+    cpg_path = _sidecar_path(file_path, '.cpg')
+    if cpg_path:
+        with open(cpg_path, 'r', encoding='ascii', errors='ignore') as f: encoding = _normalize_encoding_name(f.read())
+        if encoding: return encoding
+    # .cpg が無い場合は DBF のフィールド名と先頭レコードの生バイトが UTF-8 として読めるかで判定
+    dbf_path = _sidecar_path(file_path, '.dbf')
+    if not dbf_path: return 'utf-8'
+    with open(dbf_path, 'rb') as f:
+        header = f.read(32)
+        if len(header) < 32: return 'utf-8'
+        header_length, record_length = int.from_bytes(header[8:10], 'little'), int.from_bytes(header[10:12], 'little')
+        descriptors, records = f.read(max(header_length - 32, 0)), f.read(record_length * sample_records)
+    field_names = b''.join(descriptors[i:i + 11] for i in range(0, len(descriptors) - 31, 32) if descriptors[i] != 0x0D)
+    try: (field_names + records).decode('utf-8')
+    except UnicodeDecodeError: return 'cp932'
+    return 'utf-8'
+
+def _read_layer(file_path, layer_name, consume=list, bbox=None, encoding=None):
+    # consume にはフィーチャのイテレータを受け取る関数を渡す（_build_feature_store を渡すと全フィーチャをリスト化せずに列形式へ変換）
+    # bbox を指定すると範囲と交差するフィーチャだけを読み込む。戻り値の最後は実際に使った文字コード
+    encoding = encoding or _resolve_encoding(file_path)
+    try:
+        with fiona.open(file_path, 'r', layer=layer_name, encoding=encoding) as collection:
+            return consume(collection.filter(bbox=bbox) if bbox else collection), collection.schema.get('geometry', 'Unknown'), collection.bounds, encoding
+    except (FionaError, UnicodeDecodeError):
+        # 先頭レコードでは判定できなかった場合だけ cp932 で開き直す
+        if encoding != 'utf-8': raise
+        with fiona.open(file_path, 'r', layer=layer_name, encoding='cp932') as collection:
+            return consume(collection.filter(bbox=bbox) if bbox else collection), collection.schema.get('geometry', 'Unknown'), collection.bounds, 'cp932'
+
+def _merge_bboxes(bboxes):
+    bboxes = [bbox for bbox in bboxes if bbox]
+    if not bboxes: return None
+    return (min(b[0] for b in bboxes), min(b[1] for b in bboxes), max(b[2] for b in bboxes), max(b[3] for b in bboxes))
+
+def _reachable_extent(bbox, k_value, grid_size=GRID_SIZE_A3):
+    # A3 グリッド (73×45 セル) を、区域に掛かる位置・任意の回転角で置いても対角線の長さより遠くは表示されない
+    reach = math.hypot(grid_size[0], grid_size[1]) * k_value
+    return (bbox[0] - reach, bbox[1] - reach, bbox[2] + reach, bbox[3] + reach)
+
+def _read_bbox_too_small(read_bbox, calc_bbox, k_value):
+    # 範囲を絞って読み込んだレイヤが、今の計算区域から届く範囲を覆っていなければ読み直しが必要
+    if not read_bbox or not calc_bbox: return False
+    reachable = _reachable_extent(calc_bbox, k_value)
+    return reachable[0] < read_bbox[0] or reachable[1] < read_bbox[1] or reachable[2] > read_bbox[2] or reachable[3] > read_bbox[3]
+
+def _find_optimal_rotation(geom, target_width, target_height, precision=1):
+    # precision=None で収まる最小角度をそのまま（1°未満の精度で）返す
+    if geom is None or geom.is_empty: return None
+    for start, end in _rotation_fit_intervals(geom.convex_hull, target_width, target_height, 1, 89):
+        if not precision: return start
+        angle = math.ceil(start / precision - 1e-9) * precision
+        if angle <= end + 1e-9: return int(round(angle)) if precision >= 1 else round(angle, 6)
+    return None
+
+def _check_fit(bbox, grid_rows, grid_cols, k_value):
+    if not bbox: return False
+    width, height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+    return width <= grid_cols * k_value and height <= grid_rows * k_value
+
+def _rotate_points_90_degrees_bbox(bbox):
+    min_x, min_y, max_x, max_y = bbox
+    center_x, center_y = min_x + (max_x - min_x) / 2, min_y + (max_y - min_y) / 2
+    points = [(min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y)]
+    rotated_points = [(center_x - (y - center_y), center_y + (x - center_x)) for x, y in points]
+    rotated_xs, rotated_ys = [p[0] for p in rotated_points], [p[1] for p in rotated_points]
+    return rotated_points, (min(rotated_xs), min(rotated_ys), max(rotated_xs), max(rotated_ys))
+
+def _exact_angle_note(geom, target_width, target_height):
+    # 地図は整数の角度で回転するが、収まる最小の角度は 1°未満の精度で求めて併記する
+    exact_angle = _find_optimal_rotation(geom, target_width, target_height, precision=None)
+    return f"（収まる最小の角度: {exact_angle:.2f}°）" if exact_angle is not None else ""
+
+def _choose_layout(master_geom, master_bbox, k_value, size_a4=GRID_SIZE_A4, size_a3=GRID_SIZE_A3):
+    # 戻り値: (grid_rows, grid_cols, page_orientation, map_rotation, info_message)
+    (rows_a4, cols_a4), (rows_a3, cols_a3) = size_a4, size_a3
+    portrait, landscape = QPageLayout.Orientation.Portrait, QPageLayout.Orientation.Landscape
+    if master_geom is not None and not master_geom.is_empty:
+        bbox, rotated_90_bbox = master_geom.bounds, rotate(master_geom, 90, origin='center', use_radians=False).bounds
+        if _check_fit(bbox, rows_a4, cols_a4, k_value): return rows_a4, cols_a4, portrait, 0, ""
+        if _check_fit(rotated_90_bbox, rows_a4, cols_a4, k_value): return rows_a4, cols_a4, portrait, 90, "A4縦に収めるため、90°回転しました。"
+        optimal_angle_a4 = _find_optimal_rotation(master_geom, cols_a4 * k_value, rows_a4 * k_value)
+        if optimal_angle_a4 is not None: return rows_a4, cols_a4, portrait, optimal_angle_a4, f"A4縦に収めるため、{optimal_angle_a4}°回転しました{_exact_angle_note(master_geom, cols_a4 * k_value, rows_a4 * k_value)}。"
+        if _check_fit(bbox, rows_a3, cols_a3, k_value): return rows_a3, cols_a3, landscape, 0, "データ範囲が大きいため、A3横モードに切り替えました。"
+        if _check_fit(rotated_90_bbox, rows_a3, cols_a3, k_value): return rows_a3, cols_a3, landscape, 90, "A3横に収めるため、90°回転しました。"
+        optimal_angle_a3 = _find_optimal_rotation(master_geom, cols_a3 * k_value, rows_a3 * k_value)
+        if optimal_angle_a3 is not None: return rows_a3, cols_a3, landscape, optimal_angle_a3, f"A3横に収めるため、{optimal_angle_a3}°回転しました{_exact_angle_note(master_geom, cols_a3 * k_value, rows_a3 * k_value)}。"
+        return rows_a3, cols_a3, landscape, 0, "A3モードでも最適な回転が見つかりませんでした。データの一部が切れて表示される可能性があります。"
+    _, rotated_bbox = _rotate_points_90_degrees_bbox(master_bbox)
+    if _check_fit(master_bbox, rows_a4, cols_a4, k_value): return rows_a4, cols_a4, portrait, 0, ""
+    if _check_fit(rotated_bbox, rows_a4, cols_a4, k_value): return rows_a4, cols_a4, portrait, 90, "A4縦に収めるため、90°回転しました。"
+    if _check_fit(master_bbox, rows_a3, cols_a3, k_value): return rows_a3, cols_a3, landscape, 0, "データ範囲が大きいため、A3横モードに切り替えました。"
+    if _check_fit(rotated_bbox, rows_a3, cols_a3, k_value): return rows_a3, cols_a3, landscape, 90, "A3横に収めるため、90°回転しました。"
+    return rows_a3, cols_a3, landscape, 0, "A3モードでもグリッド範囲に収まりません。データの一部が切れて表示される可能性があります。"
+
+def _build_world_to_scene_params(master_bbox, map_rotation, k_value, cell_size, grid_origin, grid_shape, map_offset=(0.0, 0.0)):
+    # 回転・縮尺・中心合わせ・地図オフセットを1つの 3x3 アフィン行列にまとめる
+    if not master_bbox: return None
+    bbox_min_x, bbox_min_y, bbox_max_x, bbox_max_y = master_bbox
+    rotation = np.identity(3)
+    if map_rotation != 0:
+        orig_center_x, orig_center_y = bbox_min_x + (bbox_max_x - bbox_min_x) / 2, bbox_min_y + (bbox_max_y - bbox_min_y) / 2
+        theta = math.radians(map_rotation)
+        cos_theta, sin_theta = math.cos(theta), math.sin(theta)
+        rotation = np.array([[cos_theta, -sin_theta, orig_center_x - cos_theta * orig_center_x + sin_theta * orig_center_y],
+                             [sin_theta, cos_theta, orig_center_y - sin_theta * orig_center_x - cos_theta * orig_center_y],
+                             [0.0, 0.0, 1.0]])
+    rotated_corners = _apply_affine(rotation, [(bbox_min_x, bbox_min_y), (bbox_max_x, bbox_min_y), (bbox_max_x, bbox_max_y), (bbox_min_x, bbox_max_y)])
+    (min_x, min_y), (max_x, max_y) = rotated_corners.min(axis=0), rotated_corners.max(axis=0)
+    scale, center_x, center_y = cell_size / k_value, min_x + (max_x - min_x) / 2, min_y + (max_y - min_y) / 2
+    grid_center_x, grid_center_y = grid_origin[0] + (grid_shape[1] * cell_size) / 2, grid_origin[1] + (grid_shape[0] * cell_size) / 2
+    to_scene = np.array([[scale, 0.0, grid_center_x - center_x * scale + map_offset[0]],
+                         [0.0, -scale, grid_center_y + center_y * scale + map_offset[1]],
+                         [0.0, 0.0, 1.0]])
+    return {'scale': scale, 'center_x': center_x, 'center_y': center_y, 'grid_center_x': grid_center_x, 'grid_center_y': grid_center_y, 'matrix': to_scene @ rotation}
+
+def _classify_in_area_cells(world_geom, world_to_scene, cell_size, grid_origin, grid_shape):
+    if world_geom is None or world_geom.is_empty: return []
+    try: scene_geom = shapely.transform(world_geom, lambda coords: _apply_affine(world_to_scene, coords))
+    except Exception as e: print(f"シーンジオメトリ変換エラー: {e}"); return []
+    if scene_geom is None or scene_geom.is_empty: return []
+    # セルごとの被覆率をポリゴンの辺から一括で求め、50%以上のセルを区域内とする
+    coverage = _compute_coverage_fractions(scene_geom, grid_origin[0], grid_origin[1], cell_size, grid_shape[0], grid_shape[1])
+    return [(int(r), int(c)) for r, c in np.argwhere(coverage >= 0.5 - 1e-9)]
+
+def _world_point_to_cell(x, y, world_to_scene, cell_size, grid_origin, grid_shape):
+    (scene_x, scene_y), = _apply_affine(world_to_scene, [(x, y)])
+    col, row = math.floor((scene_x - grid_origin[0]) / cell_size), math.floor((scene_y - grid_origin[1]) / cell_size)
+    return (row, col) if 0 <= row < grid_shape[0] and 0 <= col < grid_shape[1] else None
+
+def _compute_average_distance(in_area_cells, landing_cell, grid_rows, grid_cols, k_value):
+    landing_row, landing_col = landing_cell
+    row_counts, col_counts = {r: 0 for r in range(grid_rows)}, {c: 0 for c in range(grid_cols)}
+    for r, c in in_area_cells: row_counts[r] += 1; col_counts[c] += 1
+    total_product_v, total_product_h = sum(abs(r - landing_row) * count for r, count in row_counts.items()), sum(abs(c - landing_col) * count for c, count in col_counts.items())
+    total_degree, final_distance = len(in_area_cells), (total_product_v + total_product_h) / len(in_area_cells) * k_value if len(in_area_cells) > 0 else 0
+    all_rows, all_cols = [r for r, c in in_area_cells] if in_area_cells else [], [c for r, c in in_area_cells] if in_area_cells else []
+    return {"landing_row": landing_row, "landing_col": landing_col, "row_counts": row_counts, "col_counts": col_counts, "total_product_v": total_product_v, "total_product_h": total_product_h, "total_degree": total_degree, "final_distance": final_distance, "min_row": min(all_rows) if all_rows else 0, "max_row": max(all_rows) if all_rows else 0, "min_col": min(all_cols) if all_cols else 0, "max_col": max(all_cols) if all_cols else 0}
+
+def _compute_landing_costs(in_area_cells, grid_rows, grid_cols):
+    # 集材距離は行方向と列方向に分離できるため、行・列ごとの度数の累積和から全セル分の (⑨ + ⑦) を O(rows + cols) で求める
+    cells = np.asarray(in_area_cells, dtype=np.int64).reshape(-1, 2)
+    def axis_costs(indices, size):
+        counts = np.bincount(indices, minlength=size).astype(np.float64)
+        positions = np.arange(size, dtype=np.float64)
+        count_before, weight_before = np.cumsum(counts) - counts, np.cumsum(counts * positions) - counts * positions
+        count_after, weight_after = counts.sum() - count_before - counts, (counts * positions).sum() - weight_before - counts * positions
+        return (positions * count_before - weight_before) + (weight_after - positions * count_after)
+    return axis_costs(cells[:, 0], grid_rows)[:, None] + axis_costs(cells[:, 1], grid_cols)[None, :]
+
+def _find_optimal_landing(landing_costs, allowed_mask=None):
+    candidate_costs = landing_costs if allowed_mask is None else np.where(allowed_mask, landing_costs, np.inf)
+    if not np.isfinite(candidate_costs).any(): return None
+    row, col = np.unravel_index(np.argmin(candidate_costs), candidate_costs.shape)
+    return int(row), int(col)
+
+# ヒートマップの配色（近い: 緑 → 黄 → 遠い: 赤）
+HEATMAP_COLOR_STOPS = np.array([[0.0, 26, 152, 80], [0.5, 254, 224, 139], [1.0, 215, 48, 39]])
+HEATMAP_ALPHA = 110
+
+def _build_heatmap_image(average_distances):
+    values = np.asarray(average_distances, dtype=np.float64)
+    value_range = values.max() - values.min()
+    t = (values - values.min()) / value_range if value_range > 0 else np.zeros_like(values)
+    rgba = np.empty(values.shape + (4,), dtype=np.uint8)
+    for channel in range(3): rgba[..., channel] = np.interp(t, HEATMAP_COLOR_STOPS[:, 0], HEATMAP_COLOR_STOPS[:, channel + 1]).round()
+    rgba[..., 3] = HEATMAP_ALPHA
+    rows, cols = values.shape
+    # 1セル = 1ピクセルの画像。copy() で NumPy 配列から切り離す
+    return QImage(rgba.tobytes(), cols, rows, cols * 4, QImage.Format.Format_RGBA8888).copy()
+
+def _compute_line_cell_mask(line_geoms, world_to_scene, cell_size, grid_origin, grid_shape):
+    grid_rows, grid_cols = grid_shape
+    cell_rows, cell_cols = np.divmod(np.arange(grid_rows * grid_cols), grid_cols)
+    cell_min_x, cell_min_y = grid_origin[0] + cell_cols * cell_size, grid_origin[1] + cell_rows * cell_size
+    cell_polys = shapely.box(cell_min_x, cell_min_y, cell_min_x + cell_size, cell_min_y + cell_size)
+    scene_lines = shapely.transform(np.asarray(line_geoms, dtype=object), lambda coords: _apply_affine(world_to_scene, coords))
+    _, hit_cells = shapely.STRtree(cell_polys).query(scene_lines, predicate='intersects')
+    mask = np.zeros(grid_rows * grid_cols, dtype=bool); mask[hit_cells] = True
+    return mask.reshape(grid_rows, grid_cols)
+
+class LayerLoadCancelled(Exception):
+    pass
+
+LOAD_PROGRESS_INTERVAL = 2000
+
+def _iter_with_progress(features, on_progress=None, cancel_event=None, interval=LOAD_PROGRESS_INTERVAL):
+    # フィーチャを流しながら、一定件数ごとに進捗の通知と中止の確認を行う
+    for count, feature in enumerate(features, 1):
+        if count % interval == 0:
+            if cancel_event is not None and cancel_event.is_set(): raise LayerLoadCancelled()
+            if on_progress: on_progress(count)
+        yield feature
+
+def _list_layers(file_path):
+    entry_path = _parse_cache_path(file_path, 'layers')
+    cached = _read_parse_cache(entry_path)
+    if cached is not None: return cached['layer_names']
+    layer_names = fiona.listlayers(file_path)
+    _write_parse_cache(entry_path, {'layer_names': layer_names})
+    return layer_names
+
+def _peek_layers(file_path, layer_names):
+    # 各レイヤのジオメトリ型と文字コードだけを先に調べる（フィーチャは読まない）
+    layer_meta = {}
+    for layer_name in layer_names:
+        entry_path = _parse_cache_path(file_path, 'peek', layer_name)
+        cached = _read_parse_cache(entry_path)
+        if cached is not None: layer_meta[layer_name] = (cached['geom_type'], cached['encoding']); continue
+        try: _, geom_type, _, encoding = _read_layer(file_path, layer_name, lambda features: None); layer_meta[layer_name] = (geom_type, encoding)
+        except Exception: layer_meta[layer_name] = ('Unknown', None); continue
+        _write_parse_cache(entry_path, {'geom_type': geom_type, 'encoding': encoding})
+    return layer_meta
+
+def _has_polygon_layer(layer_meta):
+    return any("Polygon" in geom_type for geom_type, _ in layer_meta.values())
+
+def _load_layer_info(file_path, layer_name, read_bbox=None, encoding=None, consume=_build_feature_store, layer_style=None):
+    # read_bbox を指定すると fiona の空間フィルタ（GPKG では R-tree）で範囲外のフィーチャを読み込まない
+    # 読み込む前の更新日時とサイズを控え、プロジェクトを開くときに元データが変わったかを判定する
+    source_fingerprint = _source_fingerprint(file_path)
+    store, geom_type, layer_bbox, encoding = _read_layer(file_path, layer_name, consume, read_bbox, encoding)
+    if not store['count']: return None
+    if read_bbox:
+        min_x, min_y = store['coords'].min(axis=0); max_x, max_y = store['coords'].max(axis=0)
+        layer_bbox = (max(min_x, read_bbox[0]), max(min_y, read_bbox[1]), min(max_x, read_bbox[2]), min(max_y, read_bbox[3]))
+    is_calculable = "Polygon" in geom_type
+    partial_union = unary_union(_store_valid_geoms(store)) if is_calculable else None
+    if partial_union is not None and partial_union.is_empty: partial_union = None
+    total_area = partial_union.area if partial_union is not None else 0
+    layer_hull = shapely.convex_hull(shapely.multipoints(store['coords']))
+    if read_bbox: layer_hull = layer_hull.intersection(box(*read_bbox))
+    internal_name = os.path.splitext(os.path.basename(file_path))[0] if layer_name is None else layer_name
+    return {'path': file_path, 'layer_name': internal_name, 'geom_type': geom_type, 'store': store, 'style_table': _build_style_table(store, layer_style), 'union': partial_union, 'hull': layer_hull, 'graphics_items': [], 'graphics_group': None, 'is_calculable': is_calculable, 'is_calc_target': is_calculable, 'bbox': layer_bbox, 'area': total_area, 'encoding': encoding, 'source_fingerprint': source_fingerprint, 'read_bbox': read_bbox}
+
+# 読み込みキャッシュ: 元データ（パス・更新日時・サイズ）と読み込み範囲ごとに、変換済みの列形式ストアを .npy で保存する
+PARSE_CACHE_DIR = os.environ.get('X_GRID_CACHE_DIR') or os.path.join(os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache'), 'X-Grid', 'parse_cache')
+PARSE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+# ストアや meta.json の形式を変えたら上げる（古いエントリはキーが変わって使われず、LRU で削除される）
+PARSE_CACHE_VERSION = 2
+# 書きかけのまま残った一時ディレクトリは、この秒数を過ぎたら削除する
+PARSE_CACHE_TEMP_MAX_AGE = 24 * 60 * 60
+_parse_cache_lock = threading.Lock()
+# このセッションでメモリマップしているエントリ（Windows では削除できないため LRU の対象から外す）
+_parse_cache_mapped = set()
+
+def _parse_cache_path(file_path, *parts):
+    try: mtime_ns, size = _source_fingerprint(file_path)
+    except OSError: return None
+    key = json.dumps([PARSE_CACHE_VERSION, os.path.abspath(file_path), mtime_ns, size, *parts], ensure_ascii=False)
+    return os.path.join(PARSE_CACHE_DIR, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+def _read_parse_cache(entry_path):
+    # エントリがあれば meta.json を返し、その更新日時を最終利用日時として LRU の削除順に使う
+    if entry_path is None: return None
+    meta_path = os.path.join(entry_path, 'meta.json')
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f: meta = json.load(f)
+        os.utime(meta_path)
+        return meta
+    except (OSError, ValueError): return None
+
+def _write_parse_cache(entry_path, meta, arrays=None):
+    # 一時ディレクトリに書いてから名前を変え、他のスレッドに書きかけのエントリを読ませない
+    if entry_path is None: return
+    temp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(temp_path, exist_ok=True)
+        for name, array in (arrays or {}).items(): np.save(os.path.join(temp_path, name + '.npy'), array, allow_pickle=False)
+        with open(os.path.join(temp_path, 'meta.json'), 'w', encoding='utf-8') as f: json.dump(meta, f, ensure_ascii=False)
+        with _parse_cache_lock:
+            # meta.json のないエントリは削除に失敗した残骸なので、書き直す
+            if os.path.exists(entry_path) and not os.path.exists(os.path.join(entry_path, 'meta.json')): shutil.rmtree(entry_path, ignore_errors=True)
+            if os.path.exists(entry_path): shutil.rmtree(temp_path, ignore_errors=True)
+            else: os.replace(temp_path, entry_path)
+            _evict_parse_cache()
+    except OSError as e:
+        print(f"警告: 読み込みキャッシュを保存できませんでした。理由: {e}")
+        shutil.rmtree(temp_path, ignore_errors=True)
+
+def _evict_parse_cache(max_bytes=PARSE_CACHE_MAX_BYTES):
+    # 合計サイズが上限を超えたら、最終利用日時の古いエントリから削除する
+    # meta.json のないエントリ（削除し損ねた残骸）は最も古いものとして数え、古い一時ディレクトリは上限に関係なく削除する
+    entries, now = [], time.time()
+    for entry in os.scandir(PARSE_CACHE_DIR):
+        try:
+            if entry.name.endswith('.tmp'):
+                if now - entry.stat().st_mtime > PARSE_CACHE_TEMP_MAX_AGE: shutil.rmtree(entry.path, ignore_errors=True)
+                continue
+            try: last_used = os.stat(os.path.join(entry.path, 'meta.json')).st_mtime_ns
+            except FileNotFoundError: last_used = 0
+            entries.append((last_used, sum(item.stat().st_size for item in os.scandir(entry.path)), entry.path))
+        except OSError: continue
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, entry_path in sorted(entries):
+        if total_bytes <= max_bytes: break
+        if entry_path in _parse_cache_mapped: continue
+        shutil.rmtree(entry_path, ignore_errors=True)
+        if not os.path.exists(entry_path): total_bytes -= size
+
+def _read_cached_layer(file_path, layer_name, read_bbox=None, encoding=None):
+    # キャッシュにあれば fiona を使わずにレイヤを復元する（座標・オフセット・数値列はメモリマップで開く）
+    entry_path = _parse_cache_path(file_path, 'layer', layer_name, read_bbox, encoding)
+    meta = _read_parse_cache(entry_path)
+    if meta is None: return None
+    try:
+        load = lambda name: np.load(os.path.join(entry_path, name + '.npy'), mmap_mode='r', allow_pickle=False)
+        columns = {name: load(f"column_{i}") if values is None else _column_array(values) for i, (name, values) in enumerate(meta['columns'])}
+        store = {'family': meta['family'], 'count': meta['count'], 'coords': load('coords'), 'offsets': tuple(load(f"offsets_{i}") for i in range(meta['offset_levels'])), 'columns': columns}
+        style_table = _make_style_table(load('style_indices'), [_decode_style(*style) for style in meta['styles']])
+        union, hull = (shapely.from_wkb(load(name).tobytes()) if meta[f"has_{name}"] else None for name in ('union', 'hull'))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"警告: 読み込みキャッシュを使えないため、元データから読み込みます。理由: {e}"); return None
+    with _parse_cache_lock: _parse_cache_mapped.add(entry_path)
+    return {'path': file_path, 'layer_name': meta['layer_name'], 'geom_type': meta['geom_type'], 'store': store, 'style_table': style_table, 'union': union, 'hull': hull, 'graphics_items': [], 'graphics_group': None,
+            'is_calculable': "Polygon" in meta['geom_type'], 'is_calc_target': "Polygon" in meta['geom_type'], 'bbox': tuple(meta['bbox']) if meta['bbox'] else None, 'area': meta['area'], 'encoding': meta['encoding'], 'source_fingerprint': tuple(meta['source_fingerprint']), 'read_bbox': read_bbox}
+
+def _write_cached_layer(file_path, layer_name, read_bbox, encoding, layer_info):
+    store, style_table = layer_info['store'], layer_info['style_table']
+    arrays = {'coords': store['coords'], 'style_indices': np.asarray(style_table['indices'], dtype=np.int32)}
+    arrays.update((f"offsets_{i}", offset) for i, offset in enumerate(store['offsets']))
+    # 数値列は .npy、文字列などの列は meta.json に値のまま保存する
+    columns = []
+    for i, (name, column) in enumerate(store['columns'].items()):
+        if column.dtype == np.float64: arrays[f"column_{i}"] = column; columns.append((name, None))
+        else: columns.append((name, json.loads(json.dumps(column.tolist(), ensure_ascii=False, default=str))))
+    for name in ('union', 'hull'):
+        if layer_info[name] is not None: arrays[name] = np.frombuffer(shapely.to_wkb(layer_info[name]), dtype=np.uint8)
+    meta = {
+        'layer_name': layer_info['layer_name'], 'geom_type': layer_info['geom_type'], 'family': store['family'], 'count': store['count'], 'offset_levels': len(store['offsets']), 'columns': columns,
+        'styles': [_encode_style(style) for style in style_table['styles']], 'has_union': layer_info['union'] is not None, 'has_hull': layer_info['hull'] is not None,
+        'bbox': list(layer_info['bbox']) if layer_info['bbox'] else None, 'area': layer_info['area'], 'encoding': layer_info['encoding'], 'source_fingerprint': list(layer_info['source_fingerprint'])
+    }
+    _write_parse_cache(_parse_cache_path(file_path, 'layer', layer_name, read_bbox, encoding), meta, arrays)
+
+def _load_layers(file_path, layer_names, calc_bbox, k_value, layer_meta=None, on_progress=None, cancel_event=None):
+    # GUI に触れない読み込み処理（ワーカースレッドからも呼ぶ）。計算対象になるポリゴンレイヤを先に読み込み、その範囲から他のレイヤの読み込み範囲を決める
+    layer_meta = layer_meta or _peek_layers(file_path, layer_names)
+    loaded_layers, errors = {}, []
+    for layer_name in sorted(layer_names, key=lambda name: "Polygon" not in layer_meta[name][0]):
+        if cancel_event is not None and cancel_event.is_set(): raise LayerLoadCancelled()
+        geom_type, encoding = layer_meta[layer_name]
+        display_name = os.path.basename(file_path) if layer_name is None else layer_name
+        try:
+            merged_bbox = _merge_bboxes([calc_bbox] + [layer['bbox'] for layer in loaded_layers.values() if layer['is_calculable']])
+            read_bbox = _reachable_extent(merged_bbox, k_value) if merged_bbox and "Polygon" not in geom_type else None
+            if on_progress: on_progress(f"{display_name}: 読み込み中")
+            layer_info = _read_cached_layer(file_path, layer_name, read_bbox, encoding)
+            if layer_info is None:
+                report = (lambda count: on_progress(f"{display_name}: {count:,} 件")) if on_progress else None
+                layer_style = _read_gpkg_layer_style(file_path, layer_name)
+                style_fields = layer_style['fields'] if layer_style else ()
+                layer_info = _load_layer_info(file_path, layer_name, read_bbox, encoding, lambda features: _build_feature_store(_iter_with_progress(features, report, cancel_event), extra_columns=style_fields), layer_style)
+                if layer_info: _write_cached_layer(file_path, layer_name, read_bbox, encoding, layer_info)
+            if layer_info: loaded_layers[layer_name] = layer_info
+            elif read_bbox: print(f"警告: レイヤ '{display_name}' には計算区域の周辺にフィーチャがないため、読み込みをスキップ。")
+        except LayerLoadCancelled: raise
+        except Exception as e:
+            print(f"警告: レイヤ '{display_name}' の読み込みをスキップ。理由: {e}")
+            errors.append((layer_name, e))
+    return loaded_layers, errors
+
+def _source_layer_name(layer):
+    # シェープファイルはファイル名をレイヤ名として保持しているため、fiona には None を渡す
+    return None if layer['path'].lower().endswith('.shp') else layer['layer_name']
+
+def _layer_field_names(file_path, layer_name, encoding=None):
+    with fiona.open(file_path, 'r', layer=layer_name, encoding=encoding or _resolve_encoding(file_path)) as collection: return list(collection.schema['properties'])
+
+def _read_stand_geoms(file_path, layer_name, stand_field, encoding=None):
+    # 区域を分ける属性の値ごとにフィーチャをまとめ、値ごとの結合ポリゴンを返す
+    def group_features(features):
+        groups = {}
+        for feature in features:
+            stand_id = feature['properties'].get(stand_field)
+            if stand_id is not None and feature.get('geometry'): groups.setdefault(str(stand_id), []).append(feature)
+        return groups
+    groups, _, _, _ = _read_layer(file_path, layer_name, group_features, encoding=encoding)
+    stands = {}
+    for stand_id, features in groups.items():
+        valid_geoms = _build_valid_geoms(features)
+        if valid_geoms: stands[stand_id] = unary_union(valid_geoms)
+    return stands
+
+PROJECT_FILE_FILTER = "X-Grid プロジェクト (*.xgrid)"
+PROJECT_FORMAT_VERSION = 2
+PROJECT_SCHEMA = """
+CREATE TABLE project (key TEXT PRIMARY KEY, value);
+CREATE TABLE layers (
+    position INTEGER PRIMARY KEY, path TEXT NOT NULL, source_layer TEXT, layer_name TEXT, geom_type TEXT, family TEXT, encoding TEXT,
+    is_calc_target INTEGER, bbox TEXT, area REAL, source_mtime_ns INTEGER, source_size INTEGER, source_hash TEXT,
+    union_wkb BLOB, hull_wkb BLOB, style_indices BLOB, read_bbox TEXT
+);
+CREATE TABLE features (layer_position INTEGER, feature_index INTEGER, geometry BLOB NOT NULL, PRIMARY KEY (layer_position, feature_index));
+CREATE TABLE layer_columns (layer_position INTEGER, name TEXT, dtype TEXT, data BLOB, PRIMARY KEY (layer_position, name));
+CREATE TABLE styles (
+    layer_position INTEGER, style_index INTEGER, fill_color TEXT, line_color TEXT, line_width REAL, pen_style INTEGER, dash_pattern TEXT, line_width_unit TEXT,
+    PRIMARY KEY (layer_position, style_index)
+);
+"""
+
+def _source_files(file_path):
+    # シェープファイルは属性 (.dbf) などの付属ファイルも元データに含める
+    if not file_path.lower().endswith('.shp'): return [file_path]
+    return [file_path] + [path for path in (_sidecar_path(file_path, extension) for extension in ('.shx', '.dbf', '.prj', '.cpg')) if path]
+
+def _source_fingerprint(file_path):
+    stats = [os.stat(path) for path in _source_files(file_path)]
+    return max(stat.st_mtime_ns for stat in stats), sum(stat.st_size for stat in stats)
+
+def _source_hash(file_path):
+    digest = hashlib.sha256()
+    for path in _source_files(file_path):
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''): digest.update(chunk)
+    return digest.hexdigest()
+
+def _layer_source_state(layer):
+    # ハッシュは保存するときに1回だけ求める。読み込んだ後に元データが変わっていればハッシュは残さず、次に開くときに読み直させる
+    mtime_ns, size = layer.get('source_fingerprint') or (None, None)
+    if layer.get('source_hash') is None and mtime_ns is not None:
+        try:
+            if _source_fingerprint(layer['path']) == (mtime_ns, size): layer['source_hash'] = _source_hash(layer['path'])
+        except OSError: pass
+    return mtime_ns, size, layer.get('source_hash')
+
+def _source_unchanged(record):
+    # 更新日時とサイズが同じなら読み直さない。違っても内容が同じ（コピーや上書き保存しただけ）ならそのまま使う
+    if not os.path.exists(record['path']):
+        print(f"警告: '{record['path']}' が見つからないため、プロジェクトに保存されている形状を使います。"); return True
+    try:
+        if _source_fingerprint(record['path']) == (record['source_mtime_ns'], record['source_size']): return True
+        return record['source_hash'] is not None and _source_hash(record['path']) == record['source_hash']
+    except OSError: return False
+
+def _encode_column(column):
+    if column.dtype == np.float64: return 'float64', column.tobytes()
+    return 'json', json.dumps(column.tolist(), ensure_ascii=False, default=str).encode('utf-8')
+
+def _decode_column(dtype, data):
+    if dtype == 'float64': return np.frombuffer(data, dtype=np.float64).copy()
+    return _column_array(json.loads(data.decode('utf-8')))
+
+def _encode_style(style):
+    return (style['fill_color'].name(QColor.NameFormat.HexArgb), style['line_color'].name(QColor.NameFormat.HexArgb), float(style['line_width']), style['pen_style'].value, json.dumps(style['dash_pattern']), style['line_width_unit'])
+
+def _decode_style(fill_color, line_color, line_width, pen_style, dash_pattern, line_width_unit):
+    return {'fill_color': QColor(fill_color), 'line_color': QColor(line_color), 'line_width': line_width, 'pen_style': Qt.PenStyle(pen_style), 'dash_pattern': json.loads(dash_pattern), 'line_width_unit': line_width_unit}
+
+def _write_project(project_path, layers, state):
+    # 一時ファイルに書き出してから置き換え、保存に失敗しても元のプロジェクトを壊さない
+    temp_path = project_path + '.tmp'
+    if os.path.exists(temp_path): os.remove(temp_path)
+    connection = sqlite3.connect(temp_path)
+    try:
+        connection.executescript(PROJECT_SCHEMA)
+        with connection:
+            connection.executemany("INSERT INTO project (key, value) VALUES (?, ?)", [('format_version', json.dumps(PROJECT_FORMAT_VERSION))] + [(key, value if isinstance(value, bytes) else json.dumps(value, ensure_ascii=False)) for key, value in state.items()])
+            for position, layer in enumerate(layers):
+                store, style_table, (mtime_ns, size, source_hash) = layer['store'], layer['style_table'], _layer_source_state(layer)
+                connection.execute("INSERT INTO layers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                    position, layer['path'], _source_layer_name(layer), layer['layer_name'], layer['geom_type'], store['family'], layer['encoding'], int(bool(layer.get('is_calc_target'))),
+                    json.dumps(list(layer['bbox']) if layer['bbox'] else None), layer['area'], mtime_ns, size, source_hash,
+                    shapely.to_wkb(layer['union']) if layer['union'] is not None else None, shapely.to_wkb(layer['hull']) if layer['hull'] is not None else None, np.asarray(style_table['indices'], dtype=np.int32).tobytes(), json.dumps(list(layer['read_bbox']) if layer.get('read_bbox') else None)))
+                connection.executemany("INSERT INTO features VALUES (?, ?, ?)", ((position, index, wkb) for index, wkb in enumerate(shapely.to_wkb(_store_geometries(store)))))
+                connection.executemany("INSERT INTO layer_columns VALUES (?, ?, ?, ?)", ((position, name, *_encode_column(column)) for name, column in store['columns'].items()))
+                connection.executemany("INSERT INTO styles VALUES (?, ?, ?, ?, ?, ?, ?, ?)", ((position, index, *_encode_style(style)) for index, style in enumerate(style_table['styles'])))
+    finally: connection.close()
+    os.replace(temp_path, project_path)
+
+def _restore_project_layer(connection, record):
+    # 保存してある WKB から列形式のストアを組み直す（結合ポリゴン・凸包・スタイル表も保存したものを使う）
+    position = record['position']
+    geoms = shapely.from_wkb([row[0] for row in connection.execute("SELECT geometry FROM features WHERE layer_position = ? ORDER BY feature_index", (position,))])
+    _, coords, offsets = shapely.to_ragged_array(geoms, include_z=False)
+    store = {
+        'family': record['family'], 'count': len(geoms), 'coords': coords, 'offsets': tuple(np.asarray(offset, dtype=np.int64) for offset in offsets),
+        'columns': {name: _decode_column(dtype, data) for name, dtype, data in connection.execute("SELECT name, dtype, data FROM layer_columns WHERE layer_position = ?", (position,))}
+    }
+    styles = [_decode_style(*row) for row in connection.execute("SELECT fill_color, line_color, line_width, pen_style, dash_pattern, line_width_unit FROM styles WHERE layer_position = ? ORDER BY style_index", (position,))]
+    bbox, read_bbox = json.loads(record['bbox']), json.loads(record.get('read_bbox') or 'null')
+    return {'path': record['path'], 'layer_name': record['layer_name'], 'geom_type': record['geom_type'], 'store': store, 'style_table': _make_style_table(np.frombuffer(record['style_indices'], dtype=np.int32).copy(), styles),
+            'union': shapely.from_wkb(record['union_wkb']) if record['union_wkb'] is not None else None, 'hull': shapely.from_wkb(record['hull_wkb']) if record['hull_wkb'] is not None else None,
+            'graphics_items': [], 'graphics_group': None, 'is_calculable': "Polygon" in record['geom_type'], 'is_calc_target': bool(record['is_calc_target']), 'bbox': tuple(bbox) if bbox else None, 'area': record['area'],
+            'encoding': record['encoding'], 'source_fingerprint': (record['source_mtime_ns'], record['source_size']), 'source_hash': record['source_hash'], 'read_bbox': tuple(read_bbox) if read_bbox else None}
+
+def _load_project(project_path):
+    # 戻り値: (保存した状態, レイヤ, 読み直したレイヤ名, 読み込みエラー)。元データが変わっていないレイヤは fiona を使わずに復元する
+    if not os.path.exists(project_path): raise FileNotFoundError(project_path)
+    connection = sqlite3.connect(project_path); connection.row_factory = sqlite3.Row
+    try:
+        state = {row['key']: row['value'] if isinstance(row['value'], bytes) else json.loads(row['value']) for row in connection.execute("SELECT key, value FROM project")}
+        if state.get('format_version', 0) > PROJECT_FORMAT_VERSION: raise ValueError("新しいバージョンの X-Grid で保存されたプロジェクトです。")
+        layers, stale_records = {}, []
+        for record in map(dict, connection.execute("SELECT * FROM layers ORDER BY position")):
+            if _source_unchanged(record): layers[record['position']] = _restore_project_layer(connection, record)
+            else: stale_records.append(record)
+    finally: connection.close()
+    # 変わったレイヤは元データから読み直す（ポリゴンを先に読み、その範囲で他のレイヤを絞り込む）
+    errors = []
+    for record in sorted(stale_records, key=lambda record: "Polygon" not in (record['geom_type'] or '')):
+        calc_bbox = _merge_bboxes([layer['bbox'] for layer in layers.values() if layer['is_calculable']])
+        loaded_layers, load_errors = _load_layers(record['path'], [record['source_layer']], calc_bbox, state.get('k_value', 25.0))
+        errors += [(record['layer_name'], error) for _, error in load_errors]
+        if record['source_layer'] in loaded_layers:
+            layers[record['position']] = loaded_layers[record['source_layer']]
+            layers[record['position']]['is_calc_target'] = layers[record['position']]['is_calculable'] and bool(record['is_calc_target'])
+    return state, [layers[position] for position in sorted(layers)], [record['layer_name'] for record in stale_records], errors
+
+class LayerLoadSignals(QObject):
+    progress = pyqtSignal(object, str)
+    finished = pyqtSignal(object)
+
+class LayerLoadTask(QRunnable):
+    def __init__(self, file_path, layer_names, layer_meta, calc_bbox, k_value):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.file_path, self.layer_names, self.layer_meta, self.calc_bbox, self.k_value = file_path, layer_names, layer_meta, calc_bbox, k_value
+        self.has_polygon = _has_polygon_layer(layer_meta)
+        self.cancel_event, self.signals = threading.Event(), LayerLoadSignals()
+        self.status, self.loaded_layers, self.errors = None, {}, []
+
+    def run(self):
+        try:
+            self.loaded_layers, self.errors = _load_layers(self.file_path, self.layer_names, self.calc_bbox, self.k_value, self.layer_meta, lambda message: self.signals.progress.emit(self, message), self.cancel_event)
+            self.status = 'done'
+        except LayerLoadCancelled: self.status = 'cancelled'
+        except Exception as e: self.status, self.errors = 'failed', [(None, e)]
+        self.signals.finished.emit(self)
+
 class LayerSelectionDialog(QDialog):
     def __init__(self, layer_names, parent=None):
         super().__init__(parent)
@@ -65,6 +1049,28 @@ class LayerSelectionDialog(QDialog):
     def get_selected_layers(self):
         return [cb.text() for cb in self.checkboxes if cb.isChecked()]
 
+class BatchExportDialog(QDialog):
+    def __init__(self, field_names, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("一括エクスポート")
+        self.layout = QVBoxLayout(self)
+        self.layout.addWidget(QLabel("区域の分け方"))
+        self.by_layer_radio, self.by_field_radio = QRadioButton("計算対象のポリゴンレイヤごと"), QRadioButton("属性の値ごと")
+        self.field_combo = QComboBox(); self.field_combo.addItems(field_names)
+        self.by_layer_radio.setChecked(True); self.field_combo.setEnabled(False)
+        self.by_field_radio.setEnabled(bool(field_names)); self.by_field_radio.toggled.connect(self.field_combo.setEnabled)
+        field_layout = QHBoxLayout(); field_layout.addWidget(self.by_field_radio); field_layout.addWidget(self.field_combo, 1)
+        self.layout.addWidget(self.by_layer_radio); self.layout.addLayout(field_layout)
+        self.separate_files_checkbox = QCheckBox("区域ごとに別のPDFファイルに出力")
+        self.layout.addWidget(self.separate_files_checkbox)
+        button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        button_box.accepted.connect(self.accept); button_box.rejected.connect(self.reject)
+        self.layout.addWidget(button_box)
+    def get_stand_field(self):
+        return self.field_combo.currentText() if self.by_field_radio.isChecked() else None
+    def is_separate_files(self):
+        return self.separate_files_checkbox.isChecked()
+
 class DroppableListWidget(QListWidget):
     filesDropped = pyqtSignal(list)
 
@@ -100,6 +1106,137 @@ class DroppableListWidget(QListWidget):
             self.filesDropped.emit(valid_paths)
 
 
+class GridLinesItem(QGraphicsItem):
+    # グリッドや計算表の罫線を1つのアイテムにまとめ、drawLines の1回の呼び出しで描く
+    def __init__(self, lines, pen, parent=None):
+        super().__init__(parent)
+        self._lines, self._pen = list(lines), QPen(pen)
+        xs, ys = [v for line in self._lines for v in (line.x1(), line.x2())], [v for line in self._lines for v in (line.y1(), line.y2())]
+        self._lines_rect = QRectF(QPointF(min(xs), min(ys)), QPointF(max(xs), max(ys))) if self._lines else QRectF()
+
+    def pen(self): return QPen(self._pen)
+
+    def setPen(self, pen):
+        self.prepareGeometryChange(); self._pen = QPen(pen); self.update()
+
+    def boundingRect(self):
+        half_width = max(self._pen.widthF(), 1.0) / 2
+        return self._lines_rect.adjusted(-half_width, -half_width, half_width, half_width)
+
+    def paint(self, painter, option, widget=None):
+        painter.setPen(self._pen); painter.drawLines(self._lines)
+
+EXPORT_MARGIN_MM = 5.0
+PDF_RESOLUTION = 1200
+INVALID_FILENAME_PATTERN = re.compile(r'[\\/:*?"<>|]')
+TEXT_DOCUMENT_MARGIN = 4.0
+
+def _prepared_static_lines(text, font):
+    # 行ごとのグリフ配置はアイテムの作成時に一度だけ計算する（QStaticText を複数のアイテムで共有すると、PDF の2ページ目以降で位置がずれる）
+    lines = []
+    for line in text.split('\n'):
+        static_text = QStaticText(line); static_text.setTextFormat(Qt.TextFormat.PlainText); static_text.prepare(QTransform(), font)
+        lines.append(static_text)
+    return lines
+
+class StaticTextItem(QGraphicsItem):
+    # QGraphicsTextItem と同じ位置・大きさで描く軽量な文字アイテム（文字ごとに QTextDocument を作らない）
+    def __init__(self, text, font, color, parent=None):
+        super().__init__(parent)
+        self._text, self._font, self._color, self._lines = text, QFont(font), QColor(color), _prepared_static_lines(text, font)
+        self._line_height = max(line.size().height() for line in self._lines)
+        self._rect = QRectF(0, 0, max(line.size().width() for line in self._lines) + 2 * TEXT_DOCUMENT_MARGIN, self._line_height * len(self._lines) + 2 * TEXT_DOCUMENT_MARGIN)
+        # 文字の大きさを合わせる画面の解像度は作成時に一度だけ取得する
+        self._screen_dpi = QApplication.primaryScreen().logicalDotsPerInchY()
+
+    def boundingRect(self): return QRectF(self._rect)
+
+    def text_layout(self): return self._text, QFont(self._font), QColor(self._color), self._line_height, self._screen_dpi
+
+    def paint(self, painter, option, widget=None):
+        _paint_static_lines(painter, self._lines, self._font, self._color, self._line_height, self._screen_dpi)
+
+def _paint_static_lines(painter, lines, font, color, line_height, screen_dpi):
+    # フォントのポイント数は描画先の解像度で解釈されるため、高解像度のプリンタでは画面の解像度に合わせて縮小して描く
+    dpi_scale = screen_dpi / painter.device().logicalDpiY()
+    painter.save(); painter.scale(dpi_scale, dpi_scale); painter.setFont(font); painter.setPen(color)
+    for i, line in enumerate(lines): painter.drawStaticText(QPointF(TEXT_DOCUMENT_MARGIN, TEXT_DOCUMENT_MARGIN + i * line_height) / dpi_scale, line)
+    painter.restore()
+
+def _build_display_list(scene, source_rect, excluded_items=(), path_overrides=None):
+    # 印刷用に、範囲内のアイテムを非コスメティックのペンで固定した描画命令の列へ写し取る（GUIスレッドで呼ぶ。元のアイテムは変更しない）
+    excluded_ids, path_overrides = {id(item) for item in excluded_items if item is not None}, path_overrides or {}
+    display_list = [('background', QTransform(), (QBrush(scene.backgroundBrush()), QRectF(source_rect)))]
+    for item in scene.items(source_rect, Qt.ItemSelectionMode.IntersectsItemBoundingRect, Qt.SortOrder.AscendingOrder):
+        if id(item) in excluded_ids or not item.isVisible() or isinstance(item, QGraphicsItemGroup): continue
+        transform, pen = item.sceneTransform(), QPen(item.pen()) if hasattr(item, 'pen') else None
+        if pen is not None: pen.setCosmetic(False)
+        if isinstance(item, QGraphicsPathItem): display_list.append(('path', transform, (pen, QBrush(item.brush()), path_overrides.get(id(item), item.path()))))
+        elif isinstance(item, QGraphicsRectItem): display_list.append(('rect', transform, (pen, QBrush(item.brush()), item.rect())))
+        elif isinstance(item, QGraphicsEllipseItem): display_list.append(('ellipse', transform, (pen, QBrush(item.brush()), item.rect())))
+        elif isinstance(item, QGraphicsPolygonItem): display_list.append(('polygon', transform, (pen, QBrush(item.brush()), QPolygonF(item.polygon()), item.fillRule())))
+        elif isinstance(item, QGraphicsLineItem): display_list.append(('line', transform, (pen, item.line())))
+        elif isinstance(item, GridLinesItem): display_list.append(('lines', transform, (pen, list(item._lines))))
+        elif isinstance(item, StaticTextItem): display_list.append(('text', transform, item.text_layout()))
+        elif isinstance(item, QGraphicsPixmapItem): display_list.append(('image', transform, (item.offset(), item.pixmap().toImage())))
+        else: print(f"警告: 印刷できないアイテムをスキップ: {type(item).__name__}")
+    return display_list
+
+def _render_display_list(painter, display_list, target_rect, source_rect):
+    # QGraphicsScene.render と同じく、source_rect を縦横比を保って target_rect に合わせる（ワーカースレッドからも呼ぶ）
+    ratio = min(target_rect.width() / source_rect.width(), target_rect.height() / source_rect.height())
+    painter.save(); painter.setClipRect(target_rect, Qt.ClipOperation.IntersectClip)
+    base_transform = QTransform().translate(-source_rect.left(), -source_rect.top()) * QTransform().scale(ratio, ratio) * QTransform().translate(target_rect.left(), target_rect.top()) * painter.worldTransform()
+    for kind, transform, args in display_list:
+        painter.setWorldTransform(transform * base_transform)
+        if kind == 'background': painter.fillRect(args[1], args[0])
+        elif kind == 'text': text, font, color, line_height, screen_dpi = args; _paint_static_lines(painter, _prepared_static_lines(text, font), font, color, line_height, screen_dpi)
+        elif kind == 'image': painter.drawImage(args[0], args[1])
+        elif kind == 'lines': painter.setPen(args[0]); painter.drawLines(args[1])
+        elif kind == 'line': painter.setPen(args[0]); painter.drawLine(args[1])
+        else:
+            painter.setPen(args[0]); painter.setBrush(args[1])
+            if kind == 'path': painter.drawPath(args[2])
+            elif kind == 'rect': painter.drawRect(args[2])
+            elif kind == 'ellipse': painter.drawEllipse(args[2])
+            elif kind == 'polygon': painter.drawPolygon(args[2], args[3])
+    painter.restore()
+
+def _write_pdf_jobs(jobs, on_progress=None):
+    # jobs は [(ファイルパス, [(用紙, 描画先, 描画元, 描画命令の列), ...]), ...]。1ファイルの複数ページは newPage() で追加する
+    total_pages, done_pages, written_files = sum(len(pages) for _, pages in jobs), 0, []
+    for file_path, pages in jobs:
+        writer, pdf_painter = QPdfWriter(file_path), None
+        writer.setResolution(PDF_RESOLUTION)
+        try:
+            for page_layout, target_rect, source_rect, display_list in pages:
+                writer.setPageLayout(page_layout)
+                if pdf_painter is None: pdf_painter = QPainter(writer)
+                else: writer.newPage()
+                _render_display_list(pdf_painter, display_list, target_rect, source_rect)
+                done_pages += 1
+                if on_progress: on_progress(done_pages, total_pages)
+        finally:
+            if pdf_painter: pdf_painter.end()
+        written_files.append(file_path)
+    return written_files
+
+class PdfExportSignals(QObject):
+    progress = pyqtSignal(object, int, int)
+    finished = pyqtSignal(object)
+
+class PdfExportTask(QRunnable):
+    def __init__(self, jobs, on_done):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.jobs, self.on_done, self.signals = jobs, on_done, PdfExportSignals()
+        self.written_files, self.error = [], None
+
+    def run(self):
+        try: self.written_files = _write_pdf_jobs(self.jobs, lambda done, total: self.signals.progress.emit(self, done, total))
+        except Exception as e: self.error = e
+        self.signals.finished.emit(self)
+
 class MyGraphicsView(QGraphicsView):
     sceneClicked = pyqtSignal(QPointF)
     viewZoomed = pyqtSignal()
@@ -111,6 +1248,7 @@ class MyGraphicsView(QGraphicsView):
         self.setRenderHints(QPainter.RenderHint.Antialiasing | QPainter.RenderHint.TextAntialiasing | QPainter.RenderHint.SmoothPixmapTransform)
         self.viewport().setCursor(Qt.CursorShape.CrossCursor)
         self.is_panning = False
+        self.pan_started = False
         self.last_pan_point = QPoint()
         self.main_window = parent
         self.setAcceptDrops(True)
@@ -146,12 +1284,9 @@ class MyGraphicsView(QGraphicsView):
         if event.button() == Qt.MouseButton.LeftButton:
             if event.modifiers() == Qt.KeyboardModifier.ControlModifier:
                 self.is_panning = True
+                self.pan_started = False
                 self.last_pan_point = event.pos()
                 self.viewport().setCursor(Qt.CursorShape.ClosedHandCursor)
-                if self.main_window and self.main_window.in_area_cells_outline:
-                    if self.main_window.in_area_cells_outline.scene():
-                        self.main_window.scene.removeItem(self.main_window.in_area_cells_outline)
-                    self.main_window.in_area_cells_outline = None
             else:
                 self.sceneClicked.emit(self.mapToScene(event.pos()))
         super().mousePressEvent(event)
@@ -159,18 +1294,33 @@ class MyGraphicsView(QGraphicsView):
     def mouseMoveEvent(self, event):
         if self.is_panning:
             delta = event.pos() - self.last_pan_point
-            if self.main_window:
-                self.main_window.map_offset_x += delta.x()
-                self.main_window.map_offset_y += delta.y()
-                self.main_window.redraw_all_layers(update_outline=False)
+            if self.main_window and not delta.isNull():
+                if not self.pan_started: self._clear_for_pan()
+                self.main_window.pan_map(delta.x(), delta.y())
             self.last_pan_point = event.pos()
         super().mouseMoveEvent(event)
 
+    def _clear_for_pan(self):
+        # 地図が実際に動き始めたときだけ、区域の枠・ヒートマップと、区域内セルが変わって無効になる計算結果・見出し・土場を消す（Ctrl+クリックだけでは消さない）
+        self.pan_started = True
+        if self.main_window.in_area_cells_outline:
+            if self.main_window.in_area_cells_outline.scene():
+                self.main_window.scene.removeItem(self.main_window.in_area_cells_outline)
+            self.main_window.in_area_cells_outline = None
+        if self.main_window.heatmap_item:
+            if self.main_window.heatmap_item.scene():
+                self.main_window.scene.removeItem(self.main_window.heatmap_item)
+            self.main_window.heatmap_item = None
+        self.main_window.clear_calculation_results()
+        if self.main_window.pointer_item and self.main_window.pointer_item.scene():
+            self.main_window.scene.removeItem(self.main_window.pointer_item)
+        self.main_window.pointer_item, self.main_window.landing_cell = None, None
+
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton and self.is_panning:
             self.is_panning = False
             self.viewport().setCursor(Qt.CursorShape.CrossCursor)
-            if self.main_window:
+            if self.main_window and self.pan_started:
                 self.main_window.update_area_outline()
         super().mouseReleaseEvent(event)
         
@@ -185,8 +1335,8 @@ class X_Grid(QMainWindow):
         self.setGeometry(50, 50, 1800, 1000)
         self.cell_size_on_screen = 25
         self.k_value = 25.0
-        self.grid_rows_a4, self.grid_cols_a4 = 45, 30
-        self.grid_rows_a3, self.grid_cols_a3 = 45, 73 
+        self.grid_rows_a4, self.grid_cols_a4 = GRID_SIZE_A4
+        self.grid_rows_a3, self.grid_cols_a3 = GRID_SIZE_A3
         self.grid_rows, self.grid_cols = self.grid_rows_a4, self.grid_cols_a4
         self.page_orientation = QPageLayout.Orientation.Portrait
         self.grid_offset_x, self.grid_offset_y = 60, 40
@@ -201,17 +1351,30 @@ class X_Grid(QMainWindow):
         self.title_items = []
         self.pointer_item = None
         self.in_area_cells_outline = None
+        self.heatmap_item = None
+        self._lod_tolerance = None
+        self._drawn_world_to_scene = None
         self.last_info_message = ""
         self.has_first_polygon = False
         self.map_offset_x = 0.0
         self.map_offset_y = 0.0
+        self._drawn_map_offset = (0.0, 0.0)
         self.export_file_path = ""
+        self.project_file_path = ""
         self.Z_GRID = 0 
         self.Z_DATA_LAYERS_BASE = 1
         self.Z_AREA_OUTLINE = 50
         self.Z_OVERLAYS_BASE = 100
         
         self.calculation_results_visible = False
+        self._union_cache = {'key': None, 'members': [], 'geom': None}
+        self._in_area_cache = {'key': None, 'cells': []}
+        self.calc_area_override = None
+        self.load_thread_pool = QThreadPool(self)
+        self._load_tasks, self._load_messages, self._deferred_loads = [], {}, []
+        # PDF の書き出しは1件ずつ順番に行う
+        self.export_thread_pool = QThreadPool(self); self.export_thread_pool.setMaxThreadCount(1)
+        self._export_tasks = []
 
         self._setup_drawing_styles()
         self.init_ui()
@@ -270,6 +1433,14 @@ class X_Grid(QMainWindow):
         left_panel_layout.addWidget(layer_management_label)
         left_panel_layout.addWidget(self.layer_list_widget)
         left_panel_layout.addLayout(layer_buttons_layout)
+        project_buttons_layout = QHBoxLayout()
+        self.open_project_button = QPushButton("プロジェクトを開く")
+        self.save_project_button = QPushButton("プロジェクトを保存")
+        self.save_project_button.setToolTip("レイヤ・レイアウト・土場・計算結果を1つのファイルに保存し、次回は元データを読み直さずに開けるようにします")
+        project_buttons_layout.addWidget(self.open_project_button)
+        project_buttons_layout.addWidget(self.save_project_button)
+        project_buttons_layout.addStretch(1)
+        left_panel_layout.addLayout(project_buttons_layout)
         
         left_panel_layout.addStretch(1)
         
@@ -315,19 +1486,29 @@ class X_Grid(QMainWindow):
         
         control_panel_layout = QHBoxLayout()
         self.calculate_button = QPushButton("計算を実行")
+        self.optimal_landing_button = QPushButton("最適土場")
+        self.landing_on_lines_checkbox = QCheckBox("ライン上に限定")
+        self.heatmap_checkbox = QCheckBox("ヒートマップ")
+        self.heatmap_checkbox.setToolTip("各セルに土場を置いた場合の平均集材距離を色で表示します（緑: 短い / 赤: 長い）")
         self.update_title_button = QPushButton("表示")
         self.export_button = QPushButton("エクスポート")
+        self.batch_export_button = QPushButton("一括エクスポート")
+        self.batch_export_button.setToolTip("区域ごとに最適土場で計算し、まとめてPDFに出力します")
         
         self.subtitle_input = QLineEdit()
         self.subtitle_input.setPlaceholderText("例：〇〇〇林小班、〇〇伐区")
         self.subtitle_input.setFixedWidth(250)
         
         control_panel_layout.addWidget(self.calculate_button)
+        control_panel_layout.addWidget(self.optimal_landing_button)
+        control_panel_layout.addWidget(self.landing_on_lines_checkbox)
+        control_panel_layout.addWidget(self.heatmap_checkbox)
         control_panel_layout.addSpacing(20)
         control_panel_layout.addWidget(self.subtitle_input)
         control_panel_layout.addWidget(self.update_title_button)
         control_panel_layout.addStretch(1)
         control_panel_layout.addWidget(self.export_button)
+        control_panel_layout.addWidget(self.batch_export_button)
         
         right_panel_layout.addLayout(control_panel_layout)
         
@@ -370,16 +1551,33 @@ class X_Grid(QMainWindow):
         self.remove_layer_button.clicked.connect(self.remove_selected_layer)
         self.layer_up_button.clicked.connect(self.move_layer_up)
         self.layer_down_button.clicked.connect(self.move_layer_down)
+        self.open_project_button.clicked.connect(self.prompt_open_project)
+        self.save_project_button.clicked.connect(self.prompt_save_project)
         self.layer_list_widget.itemChanged.connect(self.on_layer_item_changed)
         self.view.sceneClicked.connect(self.on_scene_clicked)
+        self.view.viewZoomed.connect(self.apply_level_of_detail)
         self.calculate_button.clicked.connect(self.run_calculation_and_draw)
+        self.optimal_landing_button.clicked.connect(self.place_optimal_landing)
+        self.heatmap_checkbox.toggled.connect(self.update_heatmap)
         self.export_button.clicked.connect(self.export_results)
+        self.batch_export_button.clicked.connect(self.prompt_batch_export)
         self.update_title_button.clicked.connect(self.update_title_display)
         self.subtitle_input.returnPressed.connect(self.update_title_display)
 
         self.view.filesDropped.connect(self.handle_dropped_files)
         self.layer_list_widget.filesDropped.connect(self.handle_dropped_files)
 
+        # 読み込みの進捗はステータスバーに表示し、その間も操作できるようにする
+        self.load_status_label = QLabel()
+        self.cancel_load_button = QPushButton("読み込みを中止")
+        self.statusBar().addWidget(self.load_status_label, 1)
+        self.statusBar().addPermanentWidget(self.cancel_load_button)
+        self.load_status_label.setVisible(False); self.cancel_load_button.setVisible(False)
+        self.cancel_load_button.clicked.connect(self.cancel_layer_loads)
+        self.export_status_label = QLabel()
+        self.statusBar().addWidget(self.export_status_label)
+        self.export_status_label.setVisible(False)
+
         self.draw_grid()
 
     def prompt_add_layer(self):
@@ -389,100 +1587,244 @@ class X_Grid(QMainWindow):
         self._handle_file_addition(file_path)
 
     def handle_dropped_files(self, file_paths):
-        for file_path in file_paths:
-            self._handle_file_addition(file_path)
+        # 先に全ファイルのレイヤを選んでジオメトリ型を調べ、ポリゴンを含むファイルから読み込みを開始する
+        # （線・点だけのファイルは _start_layer_load で保留され、ポリゴンの範囲が分かってから絞り込んで読み込む）
+        selections = [(file_path, layer_names) for file_path in file_paths for layer_names in [self._select_file_layers(file_path)] if layer_names]
+        selections = [(file_path, layer_names, _peek_layers(file_path, layer_names)) for file_path, layer_names in selections]
+        for file_path, layer_names, layer_meta in sorted(selections, key=lambda selection: not _has_polygon_layer(selection[2])):
+            self._start_layer_load(file_path, layer_names, layer_meta)
 
     def _handle_file_addition(self, file_path):
+        layer_names_to_add = self._select_file_layers(file_path)
+        if layer_names_to_add: self._start_layer_load(file_path, layer_names_to_add)
+
+    def _select_file_layers(self, file_path):
         layer_names_to_add = []
         try:
             if file_path.lower().endswith('.shp'):
                 layer_names_to_add = [None]
             elif file_path.lower().endswith('.gpkg'):
-                all_layer_names = fiona.listlayers(file_path)
+                all_layer_names = _list_layers(file_path)
                 dialog = LayerSelectionDialog(all_layer_names, self)
                 if dialog.exec():
                     layer_names_to_add = dialog.get_selected_layers()
                 else:
-                    return
+                    return []
 
         except Exception as e:
             QMessageBox.critical(self, "エラー", f"ファイルからレイヤリストを取得できませんでした。\n\n詳細: {e}")
-            return
-
-        if not layer_names_to_add:
-            return
-
-        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
-        try:
-            if self.add_layers_from_file(file_path, layer_names_to_add):
-                self.map_offset_x = 0.0
-                self.map_offset_y = 0.0
-                self.update_layout_and_redraw()
-        except Exception as e:
-            QMessageBox.critical(self, "エラー", f"レイヤ追加処理中にエラー: {e}")
-        finally:
-            QApplication.restoreOverrideCursor()
-
+            return []
+
+        return layer_names_to_add
+
+    def _get_calc_bbox(self):
+        return _merge_bboxes([layer['bbox'] for layer in self.layers if layer.get('is_calculable')])
+
+    def _start_layer_load(self, file_path, layer_names, layer_meta=None):
+        layer_meta = layer_meta or _peek_layers(file_path, layer_names)
+        # ポリゴンを含まないファイルは、読み込み中のポリゴンが揃ってから（その範囲で絞り込んで）読み込む
+        if not _has_polygon_layer(layer_meta) and any(task.has_polygon for task in self._load_tasks):
+            self._deferred_loads.append((file_path, layer_names, layer_meta)); self._update_load_status(); return
+        task = LayerLoadTask(file_path, layer_names, layer_meta, self._get_calc_bbox(), self.k_value)
+        task.signals.progress.connect(self._on_layer_load_progress)
+        task.signals.finished.connect(self._on_layer_load_finished)
+        self._load_tasks.append(task); self._load_messages[task] = f"{os.path.basename(file_path)}: 待機中"
+        self._update_load_status()
+        self.load_thread_pool.start(task)
+
+    def _on_layer_load_progress(self, task, message):
+        if task in self._load_messages: self._load_messages[task] = message; self._update_load_status()
+
+    def _on_layer_load_finished(self, task):
+        self._load_messages.pop(task, None)
+        # 複数ファイルを同時に読み込んでも、リストへの追加は読み込みを開始した順に行う
+        finished_tasks = []
+        while self._load_tasks and self._load_tasks[0].status is not None: finished_tasks.append(self._load_tasks.pop(0))
+        if any(finished.status == 'done' for finished in finished_tasks):
+            QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+            try:
+                if any([self._merge_loaded_layers(finished.file_path, finished.layer_names, finished.loaded_layers) for finished in finished_tasks if finished.status == 'done']):
+                    self._reload_clipped_layers()
+                    self.map_offset_x = 0.0
+                    self.map_offset_y = 0.0
+                    self.update_layout_and_redraw()
+            except Exception as e:
+                QMessageBox.critical(self, "エラー", f"レイヤ追加処理中にエラー: {e}")
+            finally:
+                QApplication.restoreOverrideCursor()
+        for finished in finished_tasks:
+            if finished.status == 'cancelled': print(f"情報: '{os.path.basename(finished.file_path)}' の読み込みを中止しました。")
+            for layer_name, error in finished.errors:
+                QMessageBox.warning(self, "読み込みエラー", f"ファイルの読み込みに失敗しました。\nファイル形式またはエンコーディングがサポートされていない可能性があります。\n\n詳細: {error}")
+        if self._deferred_loads and not any(pending.has_polygon for pending in self._load_tasks):
+            deferred_loads, self._deferred_loads = self._deferred_loads, []
+            for file_path, layer_names, layer_meta in deferred_loads: self._start_layer_load(file_path, layer_names, layer_meta)
+        self._update_load_status()
+
+    def cancel_layer_loads(self):
+        for task in self._load_tasks: task.cancel_event.set()
+        self._deferred_loads.clear()
+        self._update_load_status()
+
+    def _update_load_status(self):
+        messages = list(self._load_messages.values()) + [f"{os.path.basename(file_path)}: 待機中" for file_path, _, _ in self._deferred_loads]
+        self.load_status_label.setText(f"読み込み中 ({len(messages)}件)  " + " / ".join(messages) if messages else "")
+        self.load_status_label.setVisible(bool(messages)); self.cancel_load_button.setVisible(bool(self._load_tasks))
 
     def add_layers_from_file(self, file_path, layer_names):
+        # 同期版（ワーカーを使わずにこのスレッドで読み込む）
+        loaded_layers, errors = _load_layers(file_path, layer_names, self._get_calc_bbox(), self.k_value)
+        for layer_name, error in errors:
+            QMessageBox.warning(self, "読み込みエラー", f"ファイルの読み込みに失敗しました。\nファイル形式またはエンコーディングがサポートされていない可能性があります。\n\n詳細: {error}")
+        new_layers_added = self._merge_loaded_layers(file_path, layer_names, loaded_layers)
+        if new_layers_added: self._reload_clipped_layers()
+        return new_layers_added
+
+    def _reload_clipped_layers(self):
+        # ポリゴンの追加で計算区域が広がったら、範囲を絞って読み込んだ線・点レイヤを広い範囲で読み直す（読み込みキャッシュも範囲ごとに効く）
+        calc_bbox = self._get_calc_bbox()
+        for index, layer in enumerate(self.layers):
+            if layer.get('is_calculable') or not _read_bbox_too_small(layer.get('read_bbox'), calc_bbox, self.k_value): continue
+            layer_name = _source_layer_name(layer)
+            loaded_layers, errors = _load_layers(layer['path'], [layer_name], calc_bbox, self.k_value, {layer_name: (layer['geom_type'], layer['encoding'])})
+            if layer_name in loaded_layers:
+                print(f"情報: 計算区域が広がったため、レイヤ '{layer['layer_name']}' を読み直しました。")
+                self.layers[index] = loaded_layers[layer_name]
+            for _, error in errors:
+                QMessageBox.warning(self, "読み込みエラー", f"計算区域が広がったため、レイヤ '{layer['layer_name']}' を読み直そうとしましたが失敗しました。\n周辺の線・点の一部が表示されていない可能性があります。\n\n詳細: {error}")
+
+    def _merge_loaded_layers(self, file_path, layer_names, loaded_layers):
+        # 読み込み済みのレイヤを GUI スレッドでリストに追加する（追加順は選択した順のまま）
         new_layers_added = False
         self.layer_list_widget.blockSignals(True)
-        
         for layer_name in layer_names:
-            try:
-                features, geom_type, layer_bbox = [], 'Unknown', None
-                try:
-                    with fiona.open(file_path, 'r', layer=layer_name, encoding='utf-8') as collection:
-                        features = list(collection)
-                        geom_type = collection.schema.get('geometry', 'Unknown')
-                        layer_bbox = collection.bounds
-                except (FionaError, UnicodeDecodeError):
-                    with fiona.open(file_path, 'r', layer=layer_name, encoding='cp932') as collection:
-                        features = list(collection)
-                        geom_type = collection.schema.get('geometry', 'Unknown')
-                        layer_bbox = collection.bounds
-                if not features: continue
-                is_calculable = "Polygon" in geom_type
-                total_area = 0
-                if is_calculable:
-                    polygons = [shape(f['geometry']) for f in features if f.get('geometry')]
-                    valid_polygons = [p for p in polygons if p.is_valid]
-                    if valid_polygons: total_area = unary_union(valid_polygons).area
-                if layer_name is None:
-                    internal_name = os.path.splitext(os.path.basename(file_path))[0]
-                    item_text = os.path.basename(file_path)
-                else:
-                    internal_name, item_text = layer_name, f"{os.path.basename(file_path)} ({layer_name})"
-                layer_info = {'path': file_path, 'layer_name': internal_name, 'geom_type': geom_type, 'features': features, 'graphics_items': [], 'is_calculable': is_calculable, 'is_calc_target': is_calculable, 'bbox': layer_bbox, 'area': total_area}
-                list_item = QListWidgetItem(item_text)
-                if is_calculable:
-                    list_item.setFlags(list_item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
-                    list_item.setCheckState(Qt.CheckState.Checked)
-                else:
-                    list_item.setFlags(list_item.flags() & ~Qt.ItemFlag.ItemIsUserCheckable)
-                self.layers.insert(0, layer_info)
-                self.layer_list_widget.insertItem(0, list_item)
-                new_layers_added = True
-            except Exception as e: 
-                print(f"警告: レイヤ '{layer_name}' の読み込みをスキップ。理由: {e}")
-                QMessageBox.warning(self, "読み込みエラー", f"ファイルの読み込みに失敗しました。\nファイル形式またはエンコーディングがサポートされていない可能性があります。\n\n詳細: {e}")
-                continue
+            if layer_name not in loaded_layers: continue
+            layer_info = loaded_layers[layer_name]
+            self.layers.insert(0, layer_info)
+            self.layer_list_widget.insertItem(0, self._make_layer_list_item(layer_info))
+            new_layers_added = True
         self.layer_list_widget.blockSignals(False)
         return new_layers_added
+
+    def _make_layer_list_item(self, layer_info):
+        file_path, layer_name = layer_info['path'], _source_layer_name(layer_info)
+        item_text = os.path.basename(file_path) if layer_name is None else f"{os.path.basename(file_path)} ({layer_name})"
+        encoding_name = ENCODING_DISPLAY_NAMES.get(layer_info['encoding'], layer_info['encoding'])
+        # 文字コードが曖昧なシェープファイルは、判定した文字コードをリストに表示
+        if file_path.lower().endswith('.shp'): item_text += f" [{encoding_name}]"
+        list_item = QListWidgetItem(item_text)
+        list_item.setToolTip(f"{file_path}\n文字コード: {encoding_name}")
+        if layer_info['is_calculable']:
+            list_item.setFlags(list_item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            list_item.setCheckState(Qt.CheckState.Checked if layer_info.get('is_calc_target') else Qt.CheckState.Unchecked)
+        else:
+            list_item.setFlags(list_item.flags() & ~Qt.ItemFlag.ItemIsUserCheckable)
+        return list_item
+
+    def prompt_save_project(self):
+        if not self.layers: QMessageBox.warning(self, "警告", "保存するレイヤがありません。"); return
+        if self._load_tasks or self._deferred_loads: QMessageBox.warning(self, "警告", "読み込み中のレイヤがあります。読み込みが終わってから保存してください。"); return
+        file_path, _ = QFileDialog.getSaveFileName(self, "プロジェクトを保存", self.project_file_path or f"X-Grid_{self.subtitle_input.text().strip()}", PROJECT_FILE_FILTER)
+        if not file_path: return
+        if not file_path.lower().endswith('.xgrid'): file_path += '.xgrid'
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try: self.save_project(file_path)
+        except Exception as e: QMessageBox.critical(self, "エラー", f"プロジェクトの保存中にエラーが発生しました: {e}"); return
+        finally: QApplication.restoreOverrideCursor()
+        QMessageBox.information(self, "成功", f"プロジェクトを保存しました:\n{file_path}")
+
+    def save_project(self, file_path):
+        # 区域内セルはマスク（1セル1ビット）、計算結果は土場と集計値だけを保存する（表は開くときに描き直す）
+        in_area_cells = self.get_in_area_cells()
+        in_area_mask = np.zeros((self.grid_rows, self.grid_cols), dtype=bool)
+        if in_area_cells: in_area_mask[tuple(np.asarray(in_area_cells).T)] = True
+        results = None
+        if self.calculation_results_visible and self.landing_cell and in_area_cells:
+            calc_data = _compute_average_distance(in_area_cells, self.landing_cell, self.grid_rows, self.grid_cols, self.k_value)
+            results = {key: calc_data[key] for key in ('landing_row', 'landing_col', 'total_product_v', 'total_product_h', 'total_degree', 'final_distance')}
+        state = {
+            'k_value': self.k_value, 'subtitle': self.subtitle_input.text(), 'landing_cell': list(self.landing_cell) if self.landing_cell else None, 'results': results,
+            'layout': {'master_bbox': self.master_bbox, 'grid_rows': self.grid_rows, 'grid_cols': self.grid_cols, 'page_orientation': self.page_orientation.value, 'map_rotation': self.map_rotation, 'map_offset': [self.map_offset_x, self.map_offset_y]},
+            'in_area_mask': np.packbits(in_area_mask).tobytes()
+        }
+        _write_project(file_path, self.layers, state)
+        self.project_file_path = file_path
+
+    def prompt_open_project(self):
+        if self._load_tasks or self._deferred_loads: QMessageBox.warning(self, "警告", "読み込み中のレイヤがあります。読み込みが終わってから開いてください。"); return
+        file_path, _ = QFileDialog.getOpenFileName(self, "プロジェクトを開く", os.path.dirname(self.project_file_path), PROJECT_FILE_FILTER)
+        if not file_path: return
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try: reloaded_names, errors = self.open_project(file_path)
+        except Exception as e: QMessageBox.critical(self, "エラー", f"プロジェクトを開けませんでした。\n\n詳細: {e}"); return
+        finally: QApplication.restoreOverrideCursor()
+        for layer_name, error in errors: QMessageBox.warning(self, "読み込みエラー", f"レイヤ '{layer_name}' を読み直せませんでした。\n\n詳細: {error}")
+        if reloaded_names: QMessageBox.information(self, "情報", "元データが更新されていたため、次のレイヤを読み直しました:\n" + "\n".join(reloaded_names) + ("" if self.landing_cell else "\n\n土場を指定し直してください。"))
+
+    def open_project(self, file_path):
+        state, layers, reloaded_names, errors = _load_project(file_path)
+        self.clear_calculation_results()
+        self.layer_list_widget.blockSignals(True)
+        self.layer_list_widget.clear()
+        self.layers = layers
+        for layer in layers: self.layer_list_widget.addItem(self._make_layer_list_item(layer))
+        self.layer_list_widget.blockSignals(False)
+        self.k_value, self.landing_cell, layout = state.get('k_value', self.k_value), None, state.get('layout') or {}
+        self.subtitle_input.setText(state.get('subtitle') or "")
+        if reloaded_names: self._reload_clipped_layers()
+        self.update_master_bbox()
+        # 読み直したレイヤが無ければ、保存したレイアウトと区域内セルをそのまま使う（レイアウトの探索と区域の判定を省く）
+        layout_restored = not reloaded_names and layout.get('master_bbox') == self.master_bbox
+        if layout_restored:
+            self.grid_rows, self.grid_cols, self.map_rotation = layout['grid_rows'], layout['grid_cols'], layout['map_rotation']
+            self.page_orientation, (self.map_offset_x, self.map_offset_y) = QPageLayout.Orientation(layout['page_orientation']), layout['map_offset']
+            if state.get('in_area_mask') is not None:
+                in_area_mask = np.unpackbits(np.frombuffer(state['in_area_mask'], dtype=np.uint8), count=self.grid_rows * self.grid_cols).reshape(self.grid_rows, self.grid_cols)
+                self._in_area_cache['key'], self._in_area_cache['cells'] = self._get_in_area_cache_key(), [(int(r), int(c)) for r, c in np.argwhere(in_area_mask)]
+        else:
+            self.determine_layout()
+            # 読み直してもレイアウトが同じなら、地図の位置と土場は引き継ぐ（区域内セルは判定し直す）
+            layout_restored = bool(layout) and (self.master_bbox, self.grid_rows, self.grid_cols, self.map_rotation, self.page_orientation.value) == (layout['master_bbox'], layout['grid_rows'], layout['grid_cols'], layout['map_rotation'], layout['page_orientation'])
+            self.map_offset_x, self.map_offset_y = layout['map_offset'] if layout_restored else (0.0, 0.0)
+        self.redraw_all_layers(); self.auto_fit_view()
+        if layout_restored and state.get('landing_cell'):
+            self.set_landing_cell(*state['landing_cell'])
+            if state.get('results'): self.run_calculation_and_draw()
+        if self.subtitle_input.text().strip(): self.update_title_display()
+        self.project_file_path = file_path
+        return reloaded_names, errors
+
+    def closeEvent(self, event):
+        self.cancel_layer_loads()
+        self.load_thread_pool.waitForDone(); self.export_thread_pool.waitForDone()
+        super().closeEvent(event)
     
     ### ▼ 修正箇所 ▼ ###
     def remove_selected_layer(self):
         current_row = self.layer_list_widget.currentRow()
         if current_row < 0: return
-        self.layers.pop(current_row)
+        removed_layer = self.layers.pop(current_row)
         self.layer_list_widget.takeItem(current_row)
         
         # レイヤ削除は計算結果を無効にするため、クリア処理を呼び出す
         self.clear_calculation_results()
 
-        self.update_layout_and_redraw()
+        layout_before = (self.master_bbox, self.grid_rows, self.grid_cols, self.map_rotation, self.page_orientation)
+        self.update_master_bbox(); self.determine_layout()
+        if layout_before != (self.master_bbox, self.grid_rows, self.grid_cols, self.map_rotation, self.page_orientation):
+            self.redraw_all_layers(); self.auto_fit_view(); return
+        # レイアウトが変わらなければ、削除したレイヤの図形だけを取り除く
+        if removed_layer.get('graphics_group') and removed_layer['graphics_group'].scene(): self.scene.removeItem(removed_layer['graphics_group'])
+        removed_layer['graphics_items'].clear(); removed_layer['graphics_group'] = None; removed_layer['feature_items'] = []
+        self._apply_layer_z_order()
+        self.update_area_outline()
     ### ▲ 修正箇所 ▲ ###
 
+    def _apply_layer_z_order(self):
+        # 重なり順の変更はレイヤのグループの Z 値を付け直すだけで済ませる
+        for i, layer in enumerate(self.layers):
+            if layer.get('graphics_group'): layer['graphics_group'].setZValue(self.Z_DATA_LAYERS_BASE + (len(self.layers) - 1 - i))
+
     def move_layer_up(self):
         current_row = self.layer_list_widget.currentRow()
         if current_row > 0:
@@ -490,7 +1832,7 @@ class X_Grid(QMainWindow):
             item = self.layer_list_widget.takeItem(current_row)
             self.layer_list_widget.insertItem(current_row - 1, item)
             self.layer_list_widget.setCurrentRow(current_row - 1)
-            self.redraw_all_layers()
+            self._apply_layer_z_order()
 
     def move_layer_down(self):
         current_row = self.layer_list_widget.currentRow()
@@ -499,12 +1841,14 @@ class X_Grid(QMainWindow):
             item = self.layer_list_widget.takeItem(current_row)
             self.layer_list_widget.insertItem(current_row + 1, item)
             self.layer_list_widget.setCurrentRow(current_row + 1)
-            self.redraw_all_layers()
+            self._apply_layer_z_order()
 
     def on_layer_item_changed(self, item):
         row = self.layer_list_widget.row(item)
         if 0 <= row < len(self.layers):
             is_checked = (item.checkState() == Qt.CheckState.Checked)
+            # 文字列やツールチップの変更でも呼ばれるため、チェック状態が変わったときだけ区域を更新する
+            if is_checked == bool(self.layers[row].get('is_calc_target')): return
             self.layers[row]['is_calc_target'] = is_checked
             self.clear_calculation_results()
             self.update_area_outline()
@@ -515,94 +1859,43 @@ class X_Grid(QMainWindow):
         self.redraw_all_layers()
         self.auto_fit_view()
 
+    def _get_calc_union_key(self):
+        if self.calc_area_override is not None: return ('override', id(self.calc_area_override))
+        return tuple((id(layer), bool(layer.get('is_calc_target'))) for layer in self.layers if layer.get('is_calculable'))
+
     def _get_combined_calculable_geom(self):
-        all_shapely_polygons = []
-        calculable_layers = [layer for layer in self.layers if layer.get('is_calc_target') and layer.get('is_calculable')]
-        if not calculable_layers: return None
-        for layer in calculable_layers:
-            for feature in layer['features']:
-                geom_dict = feature.get('geometry')
-                if not geom_dict: continue
-                try:
-                    shapely_geom = shape(geom_dict)
-                    if not shapely_geom.is_valid: shapely_geom = shapely_geom.buffer(0)
-                    if shapely_geom.is_empty: continue
-                    all_shapely_polygons.append(shapely_geom)
-                except Exception: continue
-        if not all_shapely_polygons: return None
-        return unary_union(all_shapely_polygons)
-
-    def _get_combined_all_layers_geom(self):
-        all_geoms = []
-        for layer in self.layers:
-            for feature in layer['features']:
-                geom_dict = feature.get('geometry')
-                if not geom_dict: continue
-                try:
-                    shapely_geom = shape(geom_dict)
-                    if not shapely_geom.is_valid: shapely_geom = shapely_geom.buffer(0)
-                    if shapely_geom.is_empty: continue
-                    all_geoms.append(shapely_geom)
-                except Exception: continue
-        if not all_geoms: return None
-        return unary_union(all_geoms)
-
-    def _find_optimal_rotation(self, geom, target_width, target_height):
-        if geom is None or geom.is_empty: return None
-        for angle in range(1, 90):
-            rotated_geom = rotate(geom, angle, origin='center', use_radians=False)
-            min_x, min_y, max_x, max_y = rotated_geom.bounds
-            width, height = max_x - min_x, max_y - min_y
-            if width <= target_width and height <= target_height: return angle
-        return None
+        # 一括エクスポート中は、レイヤのチェック状態ではなく出力中の区域だけを計算対象にする
+        if self.calc_area_override is not None: return self.calc_area_override
+        key, cache = self._get_calc_union_key(), self._union_cache
+        if key == cache['key']: return cache['geom']
+        members = [layer for layer in self.layers if layer.get('is_calc_target') and layer.get('is_calculable') and layer.get('union') is not None]
+        member_ids, cached_ids = {id(layer) for layer in members}, {id(layer) for layer in cache['members']}
+        added = [layer for layer in members if id(layer) not in cached_ids]
+        if not members: combined = None
+        elif cache['key'] is not None and cache['geom'] is not None and cached_ids <= member_ids and len(added) == 1:
+            # チェックON: 既存の結合結果に追加レイヤの部分ユニオンだけを結合
+            combined = unary_union([cache['geom'], added[0]['union']])
+        else:
+            # チェックOFF・削除: 残りのレイヤの部分ユニオン（読み込み時に作成済み）だけを再結合
+            combined = unary_union([layer['union'] for layer in members])
+        # members はレイヤ辞書そのものを保持し、キャッシュ中に id() が再利用されないようにする
+        cache['key'], cache['members'], cache['geom'] = key, members, combined
+        return combined
 
-    def _apply_rotation_to_coords(self, coords):
-        if self.map_rotation == 0 or not self.master_bbox: return coords
-        orig_center_x = self.master_bbox[0] + (self.master_bbox[2] - self.master_bbox[0]) / 2
-        orig_center_y = self.master_bbox[1] + (self.master_bbox[3] - self.master_bbox[1]) / 2
-        theta = math.radians(self.map_rotation)
-        cos_theta, sin_theta = math.cos(theta), math.sin(theta)
-        rotated_ps = []
-        for p_x, p_y in coords:
-            tx, ty = p_x - orig_center_x, p_y - orig_center_y
-            rotated_x = tx * cos_theta - ty * sin_theta + orig_center_x
-            rotated_y = tx * sin_theta + ty * cos_theta + orig_center_y
-            rotated_ps.append((rotated_x, rotated_y))
-        return rotated_ps
-
-    def _check_fit(self, bbox, grid_rows, grid_cols):
-        if not bbox: return False
-        width, height = bbox[2] - bbox[0], bbox[3] - bbox[1]
-        return width <= grid_cols * self.k_value and height <= grid_rows * self.k_value
+    def _get_all_layers_hull(self):
+        # 凸包は任意の回転で元のジオメトリと同じ外接矩形を持つため、レイアウト判定には凸包だけを使う
+        layer_hulls = [layer['hull'] for layer in self.layers if layer.get('hull') is not None]
+        if not layer_hulls: return None
+        return shapely.convex_hull(shapely.multipoints(shapely.get_coordinates(layer_hulls)))
+
+    def _get_world_to_scene_params(self):
+        return _build_world_to_scene_params(self.master_bbox, self.map_rotation, self.k_value, self.cell_size_on_screen, (self.grid_offset_x, self.grid_offset_y), (self.grid_rows, self.grid_cols), (self.map_offset_x, self.map_offset_y))
 
     def determine_layout(self):
         if not self.master_bbox:
             self.grid_rows, self.grid_cols, self.page_orientation, self.map_rotation = self.grid_rows_a4, self.grid_cols_a4, QPageLayout.Orientation.Portrait, 0
             return
-        master_geom = self._get_combined_all_layers_geom()
-        info_message, layout_found = "", False
-        final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation = self.grid_rows, self.grid_cols, self.page_orientation, self.map_rotation
-        if master_geom and not master_geom.is_empty:
-            bbox, rotated_90_geom = master_geom.bounds, rotate(master_geom, 90, origin='center', use_radians=False)
-            rotated_90_bbox, a4_width_m, a4_height_m, a3_width_m, a3_height_m = rotated_90_geom.bounds, self.grid_cols_a4 * self.k_value, self.grid_rows_a4 * self.k_value, self.grid_cols_a3 * self.k_value, self.grid_rows_a3 * self.k_value
-            if self._check_fit(bbox, self.grid_rows_a4, self.grid_cols_a4): final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation, info_message, layout_found = self.grid_rows_a4, self.grid_cols_a4, QPageLayout.Orientation.Portrait, 0, "", True
-            if not layout_found and self._check_fit(rotated_90_bbox, self.grid_rows_a4, self.grid_cols_a4): final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation, info_message, layout_found = self.grid_rows_a4, self.grid_cols_a4, QPageLayout.Orientation.Portrait, 90, "A4縦に収めるため、90°回転しました。", True
-            if not layout_found:
-                optimal_angle_a4 = self._find_optimal_rotation(master_geom, a4_width_m, a4_height_m)
-                if optimal_angle_a4 is not None: final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation, info_message, layout_found = self.grid_rows_a4, self.grid_cols_a4, QPageLayout.Orientation.Portrait, optimal_angle_a4, f"A4縦に収めるため、{optimal_angle_a4}°回転しました。", True
-            if not layout_found and self._check_fit(bbox, self.grid_rows_a3, self.grid_cols_a3): final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation, info_message, layout_found = self.grid_rows_a3, self.grid_cols_a3, QPageLayout.Orientation.Landscape, 0, "データ範囲が大きいため、A3横モードに切り替えました。", True
-            if not layout_found and self._check_fit(rotated_90_bbox, self.grid_rows_a3, self.grid_cols_a3): final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation, info_message, layout_found = self.grid_rows_a3, self.grid_cols_a3, QPageLayout.Orientation.Landscape, 90, "A3横に収めるため、90°回転しました。", True
-            if not layout_found:
-                optimal_angle_a3 = self._find_optimal_rotation(master_geom, a3_width_m, a3_height_m)
-                if optimal_angle_a3 is not None: final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation, info_message, layout_found = self.grid_rows_a3, self.grid_cols_a3, QPageLayout.Orientation.Landscape, optimal_angle_a3, f"A3横に収めるため、{optimal_angle_a3}°回転しました。", True
-            if not layout_found: final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation, info_message = self.grid_rows_a3, self.grid_cols_a3, QPageLayout.Orientation.Landscape, 0, "A3モードでも最適な回転が見つかりませんでした。データの一部が切れて表示される可能性があります。"
-        else:
-            _, rotated_bbox = self._rotate_points_90_degrees_bbox(self.master_bbox)
-            if self._check_fit(self.master_bbox, self.grid_rows_a4, self.grid_cols_a4): final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation = self.grid_rows_a4, self.grid_cols_a4, QPageLayout.Orientation.Portrait, 0
-            elif self._check_fit(rotated_bbox, self.grid_rows_a4, self.grid_cols_a4): final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation, info_message = self.grid_rows_a4, self.grid_cols_a4, QPageLayout.Orientation.Portrait, 90, "A4縦に収めるため、90°回転しました。"
-            elif self._check_fit(self.master_bbox, self.grid_rows_a3, self.grid_cols_a3): final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation, info_message = self.grid_rows_a3, self.grid_cols_a3, QPageLayout.Orientation.Landscape, 0, "データ範囲が大きいため、A3横モードに切り替えました。"
-            elif self._check_fit(rotated_bbox, self.grid_rows_a3, self.grid_cols_a3): final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation, info_message = self.grid_rows_a3, self.grid_cols_a3, QPageLayout.Orientation.Landscape, 90, "A3横に収めるため、90°回転しました。"
-            else: final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation, info_message = self.grid_rows_a3, self.grid_cols_a3, QPageLayout.Orientation.Landscape, 0, "A3モードでもグリッド範囲に収まりません。データの一部が切れて表示される可能性があります。"
+        final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation, info_message = _choose_layout(self._get_all_layers_hull(), self.master_bbox, self.k_value, (self.grid_rows_a4, self.grid_cols_a4), (self.grid_rows_a3, self.grid_cols_a3))
         layout_changed = (self.grid_rows != final_grid_rows or self.grid_cols != final_grid_cols or self.map_rotation != final_map_rotation or self.page_orientation != final_page_orientation)
         self.grid_rows, self.grid_cols, self.page_orientation, self.map_rotation = final_grid_rows, final_grid_cols, final_page_orientation, final_map_rotation
         if layout_changed and info_message and info_message != self.last_info_message:
@@ -611,14 +1904,6 @@ class X_Grid(QMainWindow):
             self.last_info_message = info_message
         elif not info_message: self.last_info_message = ""
 
-    def _rotate_points_90_degrees_bbox(self, bbox):
-        min_x, min_y, max_x, max_y = bbox
-        center_x, center_y = min_x + (max_x - min_x) / 2, min_y + (max_y - min_y) / 2
-        points = [(min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y)]
-        rotated_points = [(center_x - (y - center_y), center_y + (x - center_x)) for x, y in points]
-        rotated_xs, rotated_ys = [p[0] for p in rotated_points], [p[1] for p in rotated_points]
-        return rotated_points, (min(rotated_xs), min(rotated_ys), max(rotated_xs), max(rotated_ys))
-
     def update_master_bbox(self):
         self.master_bbox = None
         for layer in self.layers:
@@ -635,146 +1920,124 @@ class X_Grid(QMainWindow):
         if self.in_area_cells_outline and self.in_area_cells_outline.scene(): self.scene.removeItem(self.in_area_cells_outline)
         self.scene.clear()
         self.grid_items.clear(); self.compass_items.clear(); self.calculation_items.clear(); self.result_text_items.clear(); self.title_items.clear()
-        self.pointer_item = None; self.in_area_cells_outline = None
-        for layer in self.layers: layer['graphics_items'].clear()
+        self.pointer_item = None; self.in_area_cells_outline = None; self.heatmap_item = None
+        for layer in self.layers: layer['graphics_items'].clear(); layer['graphics_group'] = None; layer['feature_items'] = []
         self.draw_grid()
         if not self.master_bbox: return
-        rotated_corners = self._apply_rotation_to_coords([(self.master_bbox[0], self.master_bbox[1]), (self.master_bbox[2], self.master_bbox[1]), (self.master_bbox[2], self.master_bbox[3]), (self.master_bbox[0], self.master_bbox[3])])
-        xs, ys = [p[0] for p in rotated_corners], [p[1] for p in rotated_corners]
-        bbox_to_use, params = (min(xs), min(ys), max(xs), max(ys)), self._get_transform_parameters_from_bbox((min(xs), min(ys), max(xs), max(ys)))
+        params = self._get_world_to_scene_params()
         if not params: return
-        def draw_line_label(q_points, label_text, z_value, layer_dict):
-            if len(q_points) < 2: return
-            mid_index, p1, p2 = len(q_points) // 2, q_points[len(q_points) // 2 - 1], q_points[len(q_points) // 2]
-            mid_point, angle_rad = QPointF((p1.x() + p2.x()) / 2, (p1.y() + p2.y()) / 2), math.atan2(p2.y() - p1.y(), p2.x() - p1.x())
+        world_to_scene = params['matrix']
+        def draw_line_label(scene_points, label_text, z_value, layer_dict):
+            if len(scene_points) < 2: return
+            (p1_x, p1_y), (p2_x, p2_y) = scene_points[len(scene_points) // 2 - 1], scene_points[len(scene_points) // 2]
+            mid_point, angle_rad = QPointF((p1_x + p2_x) / 2, (p1_y + p2_y) / 2), math.atan2(p2_y - p1_y, p2_x - p1_x)
             angle_deg, offset_angle_rad, offset_distance = math.degrees(angle_rad), angle_rad - math.pi / 2, 8
             offset_x, offset_y = offset_distance * math.cos(offset_angle_rad), offset_distance * math.sin(offset_angle_rad)
             label_pos = QPointF(mid_point.x() - offset_x, mid_point.y() - offset_y) if angle_deg > 90 or angle_deg < -90 else QPointF(mid_point.x() + offset_x, mid_point.y() + offset_y)
             if angle_deg > 90 or angle_deg < -90: angle_deg += 180
-            font, text_item = QFont("游ゴシック", 8, QFont.Weight.Bold), self.scene.addText(label_text, QFont("游ゴシック", 8, QFont.Weight.Bold))
-            text_item.setDefaultTextColor(QColor("black")); text_item.setZValue(z_value + 0.5); text_rect = text_item.boundingRect()
+            text_item = StaticTextItem(label_text, self.fonts['label'], QColor("black")); self.scene.addItem(text_item)
+            text_item.setZValue(z_value + 0.5); text_rect = text_item.boundingRect()
             text_item.setPos(label_pos.x() - text_rect.width() / 2, label_pos.y() - text_rect.height() / 2)
             text_item.setTransformOriginPoint(text_rect.center()); text_item.setRotation(angle_deg)
-            layer_dict['graphics_items'].append(text_item)
+            layer_dict['graphics_group'].addToGroup(text_item); layer_dict['graphics_items'].append(text_item)
+        # レイヤごとにグループ化し、パン操作ではグループの位置だけを動かす
+        self._drawn_map_offset, self._drawn_world_to_scene = (self.map_offset_x, self.map_offset_y), world_to_scene
+        self._lod_tolerance = _select_lod_tolerance(self.view.transform().m11(), self.cell_size_on_screen)
         for i, layer in enumerate(self.layers):
             z_value = self.Z_DATA_LAYERS_BASE + (len(self.layers) - 1 - i)
-            for feature in layer['features']:
+            layer['graphics_group'] = self.scene.createItemGroup([])
+            layer['graphics_group'].setZValue(z_value)
+            store = layer['store']
+            if store['family'] not in ('Polygon', 'LineString'): continue
+            # レイヤの全座標を一度に変換し、フィーチャごとには部品の範囲を切り出すだけにする（現在の拡大率に合わせた簡略化版を使う）
+            draw_store = self._get_lod_store(layer, self._lod_tolerance)
+            scene_coords, (coord_offsets, feature_part_offsets) = _apply_affine(world_to_scene, draw_store['coords']), _store_feature_parts(draw_store)
+            layer['feature_items'] = [[] for _ in range(store['count'])]
+            # ペンは縮尺（と画面の拡大率）ごとにスタイル表の各スタイルにつき1本だけ作って使い回す
+            style_table, meter_column = layer['style_table'], store['columns'].get('meter')
+            pen_key = (params['scale'], self.view.transform().m11())
+            if pen_key not in style_table['pens']: style_table['pens'] = {pen_key: [_build_style_pen(style, params['scale'], pen_key[1]) for style in style_table['styles']]}
+            pens = style_table['pens'][pen_key]
+            # 延長ラベルの位置は拡大率で変わらないよう、簡略化していない形状から求める
+            if meter_column is not None: label_coords, (label_coord_offsets, label_part_offsets) = (scene_coords, (coord_offsets, feature_part_offsets)) if draw_store is store else (_apply_affine(world_to_scene, store['coords']), _store_feature_parts(store))
+            for index in range(store['count']):
                 try:
-                    geom = feature.get('geometry')
-                    if not geom or not geom.get('coordinates'): continue
-                    style = self._get_feature_style(feature, layer)
-                    pen_width_in_scene_units, unit, width_val = 0.0, style.get('line_width_unit', 'MM').upper(), style.get('line_width', 0)
-                    if unit == 'MM': pen_width_in_scene_units = (width_val * 5.0) * params['scale']
-                    elif unit in ('PIXEL', 'PX'):
-                        current_view_scale = self.view.transform().m11()
-                        if current_view_scale > 0: pen_width_in_scene_units = width_val / current_view_scale
-                    pen = QPen(style['line_color'], pen_width_in_scene_units)
-                    pen.setStyle(style['pen_style'])
-                    if style['pen_style'] == Qt.PenStyle.CustomDashLine and style['dash_pattern']: pen.setDashPattern(style['dash_pattern'])
-                    pen.setCosmetic(False)
-                    brush, path = QBrush(style['fill_color']), QPainterPath()
-                    brush.setStyle(Qt.BrushStyle.SolidPattern if style['fill_color'].alpha() != 0 else Qt.BrushStyle.NoBrush)
-                    def transform_and_rotate_coords(coords):
-                        rotated_coords = self._apply_rotation_to_coords(coords)
-                        return [QPointF(params['grid_center_x'] + (p[0] - params['center_x']) * params['scale'] + self.map_offset_x, params['grid_center_y'] - (p[1] - params['center_y']) * params['scale'] + self.map_offset_y) for p in rotated_coords]
+                    scene_parts = [scene_coords[coord_offsets[part]:coord_offsets[part + 1]] for part in range(feature_part_offsets[index], feature_part_offsets[index + 1])]
+                    style_index = style_table['indices'][index]
+                    style, pen, brush, path = style_table['styles'][style_index], pens[style_index], style_table['brushes'][style_index], QPainterPath()
                     items_created = []
-                    if layer['geom_type'] in ('Polygon', 'MultiPolygon'):
+                    if store['family'] == 'Polygon':
                         path.setFillRule(Qt.FillRule.OddEvenFill)
-                        coords_list = geom['coordinates'] if geom['type'] == 'MultiPolygon' else [geom['coordinates']]
-                        for poly_rings in coords_list:
-                            for ring in poly_rings:
-                                if ring and len(ring) >= 3: path.addPolygon(QPolygonF(transform_and_rotate_coords(ring)))
+                        for ring in scene_parts: path.addPolygon(_array_to_qpolygonf(ring))
                         items_created.append(self.scene.addPath(path, pen, brush))
-                    elif layer['geom_type'] in ('LineString', 'MultiLineString'):
-                        coords_list = geom['coordinates'] if geom['type'] == 'MultiLineString' else [geom['coordinates']]
-                        for line_coords in coords_list:
-                            if len(line_coords) < 2: continue
-                            q_points = transform_and_rotate_coords(line_coords); line_path = QPainterPath(); line_path.moveTo(q_points[0])
-                            for p in q_points[1:]: line_path.lineTo(p)
-                            items_created.append(self.scene.addPath(line_path, pen))
-                            properties = feature.get('properties', {})
-                            if 'meter' in properties and properties['meter'] is not None:
-                                try: label_text = f"{int(float(properties['meter']))}m"
-                                except (ValueError, TypeError): label_text = f"{properties['meter']}m"
-                                if label_text.strip() != "m": draw_line_label(q_points, label_text, z_value, layer)
-                    else: continue
+                        layer['feature_items'][index].append(items_created[-1])
+                    else:
+                        for part_number, scene_points in enumerate(scene_parts):
+                            line_path = QPainterPath()
+                            line_path.addPolygon(_array_to_qpolygonf(scene_points))
+                            items_created.append(self.scene.addPath(line_path, pen)); layer['feature_items'][index].append(items_created[-1])
+                            meter_value = _store_value(meter_column, index) if meter_column is not None else None
+                            if meter_value is not None:
+                                try: label_text = f"{int(float(meter_value))}m"
+                                except (ValueError, TypeError): label_text = f"{meter_value}m"
+                                label_part = label_part_offsets[index] + part_number
+                                if label_text.strip() != "m": draw_line_label(label_coords[label_coord_offsets[label_part]:label_coord_offsets[label_part + 1]], label_text, z_value, layer)
                     for item in items_created:
-                        if item: item.setZValue(z_value); setattr(item, 'style_info', style); layer['graphics_items'].append(item)
+                        if item: item.setZValue(z_value); setattr(item, 'style_info', style); layer['graphics_group'].addToGroup(item); layer['graphics_items'].append(item)
                 except Exception as e: print(f"警告: フィーチャ描画をスキップ。理由: {e}"); continue
         self.draw_compass()
         if update_outline: self.update_area_outline()
 
-    def _get_feature_style(self, feature, layer_info):
-        props = feature.get('properties', {})
-        final_style = DEFAULT_STYLE_INFO.copy()
-        
-        fill_color_prop = props.get('fill_color')
-        if fill_color_prop is not None:
-            prop_val_str = str(fill_color_prop).strip()
-            if not prop_val_str: 
-                final_style['fill_color'] = QColor(Qt.GlobalColor.transparent)
-            else:
-                new_color = _parse_any_color_string(prop_val_str)
-                if new_color.isValid(): 
-                    final_style['fill_color'] = new_color
-
-        style_key = props.get('strk_style') or props.get('stroke_dash_type') or props.get('stroke_style')
-        if style_key is not None:
-            style_val = str(style_key).lower()
-            pen_style_map = {
-                'solid': Qt.PenStyle.SolidLine, 'dot': Qt.PenStyle.DotLine,
-                'dash': Qt.PenStyle.DashLine, 'dashdot': Qt.PenStyle.DashDotLine,
-                'dashdotdot': Qt.PenStyle.DashDotDotLine, 'custom': Qt.PenStyle.CustomDashLine,
-                'none': Qt.PenStyle.NoPen, 'no': Qt.PenStyle.NoPen
-            }
-            final_style['pen_style'] = pen_style_map.get(style_val, Qt.PenStyle.SolidLine)
-
-        if final_style['pen_style'] != Qt.PenStyle.NoPen:
-            line_color_prop = props.get('strk_color') or props.get('stroke_color') or props.get('color')
-            if line_color_prop is not None:
-                new_line_color = _parse_any_color_string(str(line_color_prop))
-                if new_line_color.isValid(): 
-                    final_style['line_color'] = new_line_color
-            
-            line_width_prop = props.get('strk_width') or props.get('stroke_width')
-            if line_width_prop is not None:
-                try: 
-                    final_style['line_width'] = float(line_width_prop)
-                except (ValueError, TypeError): 
-                    pass
-            
-            pattern_prop = props.get('dash_pattn') or props.get('dash_pattern')
-            if final_style.get('pen_style') == Qt.PenStyle.CustomDashLine and pattern_prop:
-                final_style['dash_pattern'] = []
-                try:
-                    pattern_str = str(pattern_prop).strip().replace('[','').replace(']','')
-                    scale_factor = final_style.get('line_width', 1.0)
-                    pattern_list = [float(p.strip()) * scale_factor for p in pattern_str.split(',')]
-                    if pattern_list: 
-                        final_style['dash_pattern'] = pattern_list
-                except (ValueError, TypeError, AttributeError):
-                    final_style['dash_pattern'] = []
-                    final_style['pen_style'] = Qt.PenStyle.SolidLine
-
-        current_fill_color = final_style['fill_color']
-        if current_fill_color.alpha() != 0:
-            current_fill_color.setAlpha(200)
-            final_style['fill_color'] = current_fill_color
-            
-        return final_style
+    def pan_map(self, dx, dy):
+        self.map_offset_x += dx
+        self.map_offset_y += dy
+        shift_x, shift_y = self.map_offset_x - self._drawn_map_offset[0], self.map_offset_y - self._drawn_map_offset[1]
+        for layer in self.layers:
+            if layer.get('graphics_group'): layer['graphics_group'].setPos(shift_x, shift_y)
+
+    def _get_lod_store(self, layer, tolerance):
+        if tolerance is None: return layer['store']
+        # 簡略化の結果は段階ごとにレイヤに保持する（世界座標なのでレイアウトや移動が変わっても使い回せる）
+        lod_cache = layer.setdefault('lod_cache', {})
+        if tolerance not in lod_cache: lod_cache[tolerance] = _simplify_store(layer['store'], tolerance * self.k_value / self.cell_size_on_screen)
+        return lod_cache[tolerance]
+
+    def apply_level_of_detail(self):
+        # 拡大率が変わって簡略化の段階が変わったときだけ、描画済みのパスを差し替える
+        tolerance = _select_lod_tolerance(self.view.transform().m11(), self.cell_size_on_screen)
+        if tolerance == self._lod_tolerance or self._drawn_world_to_scene is None: return
+        self._lod_tolerance = tolerance
+        for layer in self.layers:
+            # 点レイヤや描画していないレイヤは簡略化版を作らない
+            if layer['store']['family'] not in ('Polygon', 'LineString') or not layer.get('feature_items'): continue
+            for item, path in self._iter_feature_paths(layer, self._get_lod_store(layer, tolerance)): item.setPath(path)
+
+    def _iter_feature_paths(self, layer, draw_store):
+        # 描画済みのフィーチャのアイテムと、draw_store の形状から作ったパスの組を返す
+        if layer['store']['family'] not in ('Polygon', 'LineString') or not layer.get('feature_items'): return
+        scene_coords, (coord_offsets, feature_part_offsets) = _apply_affine(self._drawn_world_to_scene, draw_store['coords']), _store_feature_parts(draw_store)
+        for index, items in enumerate(layer['feature_items']):
+            scene_parts = [scene_coords[coord_offsets[part]:coord_offsets[part + 1]] for part in range(feature_part_offsets[index], feature_part_offsets[index + 1])]
+            if layer['store']['family'] == 'Polygon':
+                if not items: continue
+                path = QPainterPath(); path.setFillRule(Qt.FillRule.OddEvenFill)
+                for ring in scene_parts: path.addPolygon(_array_to_qpolygonf(ring))
+                yield items[0], path
+            elif len(items) == len(scene_parts):
+                for item, scene_points in zip(items, scene_parts):
+                    line_path = QPainterPath(); line_path.addPolygon(_array_to_qpolygonf(scene_points)); yield item, line_path
+
+    def _get_full_detail_paths(self):
+        # 画面が簡略化した形状を表示中なら、印刷用に元の形状のパスをアイテムごとに作る（表示中のアイテムは差し替えない）
+        if self._lod_tolerance is None or self._drawn_world_to_scene is None: return {}
+        return {id(item): path for layer in self.layers for item, path in self._iter_feature_paths(layer, layer['store'])}
 
     def auto_fit_view(self):
         all_items_rect = self.scene.itemsBoundingRect()
         grid_rect = QRectF(self.grid_offset_x, self.grid_offset_y, self.grid_cols * self.cell_size_on_screen, self.grid_rows * self.cell_size_on_screen)
         bounding_rect = all_items_rect.united(grid_rect)
         if bounding_rect.isValid(): self.view.fitInView(bounding_rect.adjusted(-20, -20, 20, 20), Qt.AspectRatioMode.KeepAspectRatio)
-
-    def _get_transform_parameters_from_bbox(self, bbox):
-        if not bbox: return None
-        scale, min_x, min_y, max_x, max_y = self.cell_size_on_screen / self.k_value, bbox[0], bbox[1], bbox[2], bbox[3]
-        center_x, center_y = min_x + (max_x - min_x) / 2, min_y + (max_y - min_y) / 2
-        grid_center_x, grid_center_y = self.grid_offset_x + (self.grid_cols * self.cell_size_on_screen) / 2, self.grid_offset_y + (self.grid_rows * self.cell_size_on_screen) / 2
-        return {'scale': scale, 'center_x': center_x, 'center_y': center_y, 'grid_center_x': grid_center_x, 'grid_center_y': grid_center_y}
+        self.apply_level_of_detail()
 
     def on_scene_clicked(self, scene_pos):
         grid_rect = QRectF(self.grid_offset_x, self.grid_offset_y, self.grid_cols * self.cell_size_on_screen, self.grid_rows * self.cell_size_on_screen)
@@ -782,13 +2045,36 @@ class X_Grid(QMainWindow):
             QMessageBox.information(self, "情報", "先にポリゴンレイヤを読み込んでください。"); return
         if grid_rect.contains(scene_pos):
             col, row = int((scene_pos.x() - self.grid_offset_x) / self.cell_size_on_screen), int((scene_pos.y() - self.grid_offset_y) / self.cell_size_on_screen)
-            if 0 <= row < self.grid_rows and 0 <= col < self.grid_cols:
-                self.landing_cell = (row, col)
-                if self.pointer_item and self.pointer_item.scene(): self.scene.removeItem(self.pointer_item)
-                center_x, center_y, point_size = self.grid_offset_x + col * self.cell_size_on_screen + self.cell_size_on_screen / 2, self.grid_offset_y + row * self.cell_size_on_screen + self.cell_size_on_screen / 2, self.cell_size_on_screen * 0.5
-                self.pointer_item = self.scene.addEllipse(center_x - point_size / 2, center_y - point_size / 2, point_size, point_size, QPen(QColor("red"), 1), QBrush(QColor("red")))
-                self.pointer_item.setZValue(self.Z_OVERLAYS_BASE + 2)
-                self.clear_calculation_results()
+            if 0 <= row < self.grid_rows and 0 <= col < self.grid_cols: self.set_landing_cell(row, col)
+
+    def set_landing_cell(self, row, col):
+        self.landing_cell = (row, col)
+        if self.pointer_item and self.pointer_item.scene(): self.scene.removeItem(self.pointer_item)
+        center_x, center_y, point_size = self.grid_offset_x + col * self.cell_size_on_screen + self.cell_size_on_screen / 2, self.grid_offset_y + row * self.cell_size_on_screen + self.cell_size_on_screen / 2, self.cell_size_on_screen * 0.5
+        self.pointer_item = self.scene.addEllipse(center_x - point_size / 2, center_y - point_size / 2, point_size, point_size, QPen(QColor("red"), 1), QBrush(QColor("red")))
+        self.pointer_item.setZValue(self.Z_OVERLAYS_BASE + 2)
+        self.clear_calculation_results()
+
+    def _get_line_cell_mask(self):
+        params = self._get_world_to_scene_params()
+        line_geoms = [geom for layer in self.layers if not layer.get('is_calculable') and layer['store']['family'] == 'LineString' for geom in _store_geometries(layer['store'])]
+        if not params or not line_geoms: return None
+        return _compute_line_cell_mask(line_geoms, params['matrix'], self.cell_size_on_screen, (self.grid_offset_x, self.grid_offset_y), (self.grid_rows, self.grid_cols))
+
+    def place_optimal_landing(self):
+        if not any(layer.get('is_calculable') for layer in self.layers):
+            QMessageBox.information(self, "情報", "先にポリゴンレイヤを読み込んでください。"); return
+        in_area_cells = self.get_in_area_cells()
+        if not in_area_cells: QMessageBox.warning(self, "警告", "計算対象の区域がありません。レイヤ管理リストでポリゴンレイヤにチェックを入れてください。"); return
+        allowed_mask = None
+        if self.landing_on_lines_checkbox.isChecked():
+            allowed_mask = self._get_line_cell_mask()
+            if allowed_mask is None or not allowed_mask.any(): QMessageBox.warning(self, "警告", "グリッド内を通るラインがありません。ラインレイヤを読み込むか「ライン上に限定」を外してください。"); return
+        landing_costs = _compute_landing_costs(in_area_cells, self.grid_rows, self.grid_cols)
+        landing_cell = _find_optimal_landing(landing_costs, allowed_mask)
+        self.set_landing_cell(*landing_cell)
+        expected_distance = landing_costs[landing_cell] / len(in_area_cells) * self.k_value
+        QMessageBox.information(self, "情報", f"平均集材距離が最小となるセルに土場を設定しました。\n（平均集材距離 約{expected_distance:.1f} m）")
 
     def draw_grid(self):
         for item in self.grid_items:
@@ -810,17 +2096,12 @@ class X_Grid(QMainWindow):
             h_table_row_heights = [50, 40, 50]
             end_y += h_table_gap + sum(h_table_row_heights)
         
-        for r in range(self.grid_rows + 1):
-            y = self.grid_offset_y + r * self.cell_size_on_screen
-            line = self.scene.addLine(self.grid_offset_x, y, end_x, y, pen)
-            line.setZValue(self.Z_GRID)
-            self.grid_items.append(line)
-
-        for c in range(self.grid_cols + 1):
-            x = self.grid_offset_x + c * self.cell_size_on_screen
-            line = self.scene.addLine(x, self.grid_offset_y, x, end_y, pen)
-            line.setZValue(self.Z_GRID)
-            self.grid_items.append(line)
+        grid_lines = [QLineF(self.grid_offset_x, self.grid_offset_y + r * self.cell_size_on_screen, end_x, self.grid_offset_y + r * self.cell_size_on_screen) for r in range(self.grid_rows + 1)]
+        grid_lines += [QLineF(self.grid_offset_x + c * self.cell_size_on_screen, self.grid_offset_y, self.grid_offset_x + c * self.cell_size_on_screen, end_y) for c in range(self.grid_cols + 1)]
+        grid_item = GridLinesItem(grid_lines, pen)
+        grid_item.setZValue(self.Z_GRID)
+        self.scene.addItem(grid_item)
+        self.grid_items.append(grid_item)
 
     def draw_compass(self):
         for item in self.compass_items:
@@ -832,8 +2113,8 @@ class X_Grid(QMainWindow):
         ns_poly, ew_poly = QPolygonF([QPointF(0, -size/2), QPointF(size/10, 0), QPointF(0, size/2), QPointF(-size/10, 0)]), QPolygonF([QPointF(size/2, 0), QPointF(0, size/10), QPointF(-size/2, 0), QPointF(0, -size/10)])
         dark_brush, light_brush, no_pen = QBrush(QColor(50, 50, 50)), QBrush(QColor(150, 150, 150)), QPen(Qt.PenStyle.NoPen)
         ew_item, ns_item = self.scene.addPolygon(ew_poly, no_pen, light_brush), self.scene.addPolygon(ns_poly, no_pen, dark_brush)
-        font, text_item = QFont("游ゴシック", 10, QFont.Weight.Bold), self.scene.addText("N", QFont("游ゴシック", 10, QFont.Weight.Bold))
-        text_item.setDefaultTextColor(QColor("black")); text_rect = text_item.boundingRect()
+        text_item = StaticTextItem("N", self.fonts['compass'], QColor("black")); self.scene.addItem(text_item)
+        text_rect = text_item.boundingRect()
         text_item.setPos(-text_rect.width() / 2, -size / 2 - text_rect.height() + 3)
         compass_group.addToGroup(ew_item); compass_group.addToGroup(ns_item); compass_group.addToGroup(text_item)
         compass_group.setPos(center_x, center_y); compass_group.setRotation(-self.map_rotation)
@@ -841,31 +2122,24 @@ class X_Grid(QMainWindow):
 
     def get_in_area_cells(self):
         if not self.master_bbox: return []
-        rotated_corners = self._apply_rotation_to_coords([(self.master_bbox[0], self.master_bbox[1]), (self.master_bbox[2], self.master_bbox[1]), (self.master_bbox[2], self.master_bbox[3]), (self.master_bbox[0], self.master_bbox[3])])
-        xs, ys = [p[0] for p in rotated_corners], [p[1] for p in rotated_corners]
-        bbox_to_use, params = (min(xs), min(ys), max(xs), max(ys)), self._get_transform_parameters_from_bbox((min(xs), min(ys), max(xs), max(ys)))
+        cache_key = self._get_in_area_cache_key()
+        if cache_key == self._in_area_cache['key']: return list(self._in_area_cache['cells'])
+        in_area_cells = self._compute_in_area_cells()
+        self._in_area_cache['key'], self._in_area_cache['cells'] = cache_key, in_area_cells
+        return list(in_area_cells)
+
+    def _get_in_area_cache_key(self):
+        return (self._get_calc_union_key(), tuple(self.master_bbox), self.map_rotation, self.map_offset_x, self.map_offset_y, self.grid_rows, self.grid_cols, self.k_value, self.cell_size_on_screen, self.grid_offset_x, self.grid_offset_y)
+
+    def _compute_in_area_cells(self):
+        params = self._get_world_to_scene_params()
         if not params: return []
-        combined_world_geom = self._get_combined_calculable_geom()
-        if combined_world_geom is None or combined_world_geom.is_empty: return []
-        def transform_geom_coords(coords):
-            rotated_coords = self._apply_rotation_to_coords(coords)
-            return [(params['grid_center_x'] + (p[0] - params['center_x']) * params['scale'] + self.map_offset_x, params['grid_center_y'] - (p[1] - params['center_y']) * params['scale'] + self.map_offset_y) for p in rotated_coords]
-        combined_scene_geom = None
-        try:
-            if combined_world_geom.geom_type == 'Polygon': combined_scene_geom = Polygon(transform_geom_coords(combined_world_geom.exterior.coords), [transform_geom_coords(interior.coords) for interior in combined_world_geom.interiors])
-            elif combined_world_geom.geom_type == 'MultiPolygon': polys = [Polygon(transform_geom_coords(p.exterior.coords), [transform_geom_coords(i.coords) for i in p.interiors]) for p in combined_world_geom.geoms if p.exterior]; combined_scene_geom = MultiPolygon(polys)
-        except Exception as e: print(f"シーンジオメトリ変換エラー: {e}"); return []
-        if not combined_scene_geom or combined_scene_geom.is_empty: return []
-        in_area_cells, area_threshold = [], 0.5 * (self.cell_size_on_screen ** 2)
-        for r in range(self.grid_rows):
-            for c in range(self.grid_cols):
-                cell_poly = box(self.grid_offset_x + c * self.cell_size_on_screen, self.grid_offset_y + r * self.cell_size_on_screen, self.grid_offset_x + (c + 1) * self.cell_size_on_screen, self.grid_offset_y + (r + 1) * self.cell_size_on_screen)
-                if combined_scene_geom.intersects(cell_poly) and combined_scene_geom.intersection(cell_poly).area >= area_threshold: in_area_cells.append((r, c))
-        return in_area_cells
+        return _classify_in_area_cells(self._get_combined_calculable_geom(), params['matrix'], self.cell_size_on_screen, (self.grid_offset_x, self.grid_offset_y), (self.grid_rows, self.grid_cols))
 
     def update_area_outline(self):
         if self.in_area_cells_outline and self.in_area_cells_outline.scene(): self.scene.removeItem(self.in_area_cells_outline)
         self.in_area_cells_outline = None
+        self.update_heatmap()
         in_area_cells = self.get_in_area_cells()
         if not in_area_cells: return
         cell_polygons = []
@@ -893,6 +2167,20 @@ class X_Grid(QMainWindow):
         self.in_area_cells_outline = self.scene.addPath(outline_path, outline_pen)
         self.in_area_cells_outline.setZValue(self.Z_AREA_OUTLINE)
 
+    def update_heatmap(self):
+        if self.heatmap_item and self.heatmap_item.scene(): self.scene.removeItem(self.heatmap_item)
+        self.heatmap_item = None
+        if not self.heatmap_checkbox.isChecked(): return
+        in_area_cells = self.get_in_area_cells()
+        if not in_area_cells: return
+        # 全セル分の平均集材距離を一括で求め、1枚の画像としてグリッドに重ねる
+        average_distances = _compute_landing_costs(in_area_cells, self.grid_rows, self.grid_cols) / len(in_area_cells) * self.k_value
+        self.heatmap_item = self.scene.addPixmap(QPixmap.fromImage(_build_heatmap_image(average_distances)))
+        self.heatmap_item.setTransformationMode(Qt.TransformationMode.FastTransformation)
+        self.heatmap_item.setPos(self.grid_offset_x, self.grid_offset_y); self.heatmap_item.setScale(self.cell_size_on_screen)
+        self.heatmap_item.setZValue(self.Z_AREA_OUTLINE - 1)
+        self.heatmap_item.setToolTip(f"平均集材距離 {average_distances.min():.1f} m（緑）～ {average_distances.max():.1f} m（赤）")
+
     def clear_calculation_results(self):
         for item in self.calculation_items + self.result_text_items + self.title_items:
             if item.scene(): self.scene.removeItem(item)
@@ -934,13 +2222,8 @@ class X_Grid(QMainWindow):
         
         QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
         try:
-            landing_row, landing_col = self.landing_cell
-            row_counts, col_counts = {r: 0 for r in range(self.grid_rows)}, {c: 0 for c in range(self.grid_cols)}
-            for r, c in in_area_cells: row_counts[r] += 1; col_counts[c] += 1
-            total_product_v, total_product_h = sum(abs(r - landing_row) * count for r, count in row_counts.items()), sum(abs(c - landing_col) * count for c, count in col_counts.items())
-            total_degree, final_distance = len(in_area_cells), (total_product_v + total_product_h) / len(in_area_cells) * self.k_value if len(in_area_cells) > 0 else 0
-            all_rows, all_cols = [r for r, c in in_area_cells] if in_area_cells else [], [c for r, c in in_area_cells] if in_area_cells else []
-            calc_data = {"landing_row": landing_row, "landing_col": landing_col, "row_counts": row_counts, "col_counts": col_counts, "total_product_v": total_product_v, "total_product_h": total_product_h, "total_degree": total_degree, "final_distance": final_distance, "min_row": min(all_rows) if all_rows else 0, "max_row": max(all_rows) if all_rows else 0, "min_col": min(all_cols) if all_cols else 0, "max_col": max(all_cols) if all_cols else 0, "subtitle": self.subtitle_input.text().strip()}
+            calc_data = _compute_average_distance(in_area_cells, self.landing_cell, self.grid_rows, self.grid_cols, self.k_value)
+            calc_data['subtitle'] = self.subtitle_input.text().strip()
             self._draw_calculation_header(calc_data)
             self._draw_final_result(calc_data)
             self._draw_calculation_tables(calc_data)
@@ -949,11 +2232,11 @@ class X_Grid(QMainWindow):
         finally: QApplication.restoreOverrideCursor()
 
     def _setup_drawing_styles(self):
-        self.fonts = { 'title': QFont("游ゴシック", 16, QFont.Weight.Bold), 'legend': QFont("游ゴシック", 9), 'scale': QFont("游ゴシック", 10), 'cell_count': QFont("游ゴシック", 10, QFont.Weight.Bold), 'result': QFont("游ゴシック", 12, QFont.Weight.Bold), 'header': QFont("游ゴシック", 9, QFont.Weight.Bold), 'data': QFont("游ゴシック", 9), 'total': QFont("游ゴシック", 9, QFont.Weight.Bold), 'highlight': QFont("游ゴシック", 9, QFont.Weight.Bold) }
+        self.fonts = { 'title': QFont("游ゴシック", 16, QFont.Weight.Bold), 'legend': QFont("游ゴシック", 9), 'scale': QFont("游ゴシック", 10), 'cell_count': QFont("游ゴシック", 10, QFont.Weight.Bold), 'result': QFont("游ゴシック", 12, QFont.Weight.Bold), 'header': QFont("游ゴシック", 9, QFont.Weight.Bold), 'data': QFont("游ゴシック", 9), 'total': QFont("游ゴシック", 9, QFont.Weight.Bold), 'highlight': QFont("游ゴシック", 9, QFont.Weight.Bold), 'label': QFont("游ゴシック", 8, QFont.Weight.Bold), 'compass': QFont("游ゴシック", 10, QFont.Weight.Bold) }
         self.colors = { 'normal': QColor("#333333"), 'dark': QColor("black"), 'highlight': QColor("red") }
 
     def _add_aligned_text(self, text, font, color, point, alignment=Qt.AlignmentFlag.AlignCenter, is_result=False):
-        item = self.scene.addText(text, font); item.setDefaultTextColor(color); text_rect = item.boundingRect(); item_x, item_y = point.x(), point.y()
+        item = StaticTextItem(text, font, color); self.scene.addItem(item); text_rect = item.boundingRect(); item_x, item_y = point.x(), point.y()
         if alignment & Qt.AlignmentFlag.AlignHCenter: item_x -= text_rect.width() / 2
         elif alignment & Qt.AlignmentFlag.AlignRight: item_x -= text_rect.width()
         if alignment & Qt.AlignmentFlag.AlignVCenter: item_y -= text_rect.height() / 2
@@ -998,41 +2281,15 @@ class X_Grid(QMainWindow):
         pen = QPen(QColor(180, 180, 180))
         pen.setCosmetic(False)
 
-        v_table_y_end = self.grid_offset_y + self.grid_rows * self.cell_size_on_screen
-        current_x = v_table_x
-        for w in col_widths_v:
-            item = self.scene.addLine(current_x, self.grid_offset_y, current_x, v_table_y_end, pen)
-            self.calculation_items.append(item)
-            current_x += w
-        item = self.scene.addLine(current_x, self.grid_offset_y, current_x, v_table_y_end, pen)
-        self.calculation_items.append(item)
-
-        h_table_x_end = self.grid_offset_x + self.grid_cols * self.cell_size_on_screen
-        current_y = h_table_y
-        for h in row_heights_h:
-            item = self.scene.addLine(self.grid_offset_x, current_y, h_table_x_end, current_y, pen)
-            self.calculation_items.append(item)
-            current_y += h
-        item = self.scene.addLine(self.grid_offset_x, current_y, h_table_x_end, current_y, pen)
-        self.calculation_items.append(item)
-
-        summary_box_x_end = v_table_x + sum(col_widths_v)
-        summary_box_y_end = h_table_y + sum(row_heights_h)
-        current_x = v_table_x
-        for w in col_widths_v:
-            item = self.scene.addLine(current_x, h_table_y, current_x, summary_box_y_end, pen)
-            self.calculation_items.append(item)
-            current_x += w
-        item = self.scene.addLine(current_x, h_table_y, current_x, summary_box_y_end, pen)
-        self.calculation_items.append(item)
-        
-        current_y = h_table_y
-        for h in row_heights_h:
-            item = self.scene.addLine(v_table_x, current_y, summary_box_x_end, current_y, pen)
-            self.calculation_items.append(item)
-            current_y += h
-        item = self.scene.addLine(v_table_x, current_y, summary_box_x_end, current_y, pen)
-        self.calculation_items.append(item)
+        # 縦表・横表・集計欄の罫線はまとめて1つのアイテムにする
+        v_table_y_end, h_table_x_end = self.grid_offset_y + self.grid_rows * self.cell_size_on_screen, self.grid_offset_x + self.grid_cols * self.cell_size_on_screen
+        summary_box_x_end, summary_box_y_end = v_table_x + sum(col_widths_v), h_table_y + sum(row_heights_h)
+        v_table_xs, h_table_ys = [v_table_x + sum(col_widths_v[:i]) for i in range(len(col_widths_v) + 1)], [h_table_y + sum(row_heights_h[:i]) for i in range(len(row_heights_h) + 1)]
+        table_lines = [QLineF(x, self.grid_offset_y, x, v_table_y_end) for x in v_table_xs] + [QLineF(self.grid_offset_x, y, h_table_x_end, y) for y in h_table_ys]
+        table_lines += [QLineF(x, h_table_y, x, summary_box_y_end) for x in v_table_xs] + [QLineF(v_table_x, y, summary_box_x_end, y) for y in h_table_ys]
+        table_item = GridLinesItem(table_lines, pen)
+        self.scene.addItem(table_item)
+        self.calculation_items.append(table_item)
         
         headers_v_data, current_x = [("①", "走行\n(縦)\n距離"), ("②", "度数"), ("③", "①×②")], v_table_x
         for i, (num, text) in enumerate(headers_v_data):
@@ -1061,11 +2318,131 @@ class X_Grid(QMainWindow):
             if value is None: self._add_aligned_text(symbol, self.fonts['total'], self.colors['normal'], QPointF(x + w/2, y + h/2))
             else: self._add_aligned_text(symbol, self.fonts['total'], self.colors['normal'], QPointF(x + w/2, y + h/3)); self._add_aligned_text(value, self.fonts['total'], self.colors['normal'], QPointF(x + w/2, y + h*2/3))
 
-    def _set_all_pens_cosmetic(self, is_cosmetic):
-        items_to_process = self.grid_items + self.calculation_items + self.title_items
-        if self.in_area_cells_outline: items_to_process.append(self.in_area_cells_outline)
-        for item in items_to_process:
-            if hasattr(item, 'pen') and callable(item.pen) and hasattr(item, 'setPen'): pen = item.pen(); pen.setCosmetic(is_cosmetic); item.setPen(pen)
+    def prompt_batch_export(self):
+        calc_layers = [layer for layer in self.layers if layer.get('is_calculable') and layer.get('is_calc_target')]
+        if not calc_layers: QMessageBox.warning(self, "警告", "計算対象の区域がありません。レイヤ管理リストでポリゴンレイヤにチェックを入れてください。"); return
+        field_names = []
+        for layer in calc_layers:
+            try: field_names += [name for name in _layer_field_names(layer['path'], _source_layer_name(layer), layer.get('encoding')) if name not in field_names]
+            except Exception as e: print(f"警告: レイヤ '{layer['layer_name']}' の属性を取得できません。理由: {e}")
+        dialog = BatchExportDialog(field_names, self)
+        if dialog.exec() != QDialog.DialogCode.Accepted: return
+        stand_field, separate_files = dialog.get_stand_field(), dialog.is_separate_files()
+        try: stands = self._collect_stands(calc_layers, stand_field)
+        except Exception as e: QMessageBox.critical(self, "エラー", f"区域の読み込み中にエラーが発生しました: {e}"); return
+        if not stands: QMessageBox.warning(self, "警告", "出力する区域がありません。"); return
+        if separate_files: output_path = QFileDialog.getExistingDirectory(self, "出力先のフォルダを選択")
+        else: output_path, _ = QFileDialog.getSaveFileName(self, "一括エクスポート", "X-Grid_一括", "PDF Document (*.pdf)")
+        if not output_path: return
+        progress, cancel_event = QProgressDialog("PDFを出力しています...", "中止", 0, len(stands), self), threading.Event()
+        progress.setWindowModality(Qt.WindowModality.WindowModal); progress.setMinimumDuration(0); progress.canceled.connect(cancel_event.set)
+        def on_progress(index, stand_name): progress.setLabelText(f"{stand_name} ({index + 1}/{len(stands)})"); progress.setValue(index)
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try: jobs, errors = self._snapshot_stand_pages(stands, output_path, separate_files, on_progress, cancel_event)
+        finally: QApplication.restoreOverrideCursor(); progress.close()
+        def report(task):
+            if task.error is not None: QMessageBox.critical(self, "エラー", f"エクスポート中にエラーが発生しました: {task.error}"); return
+            message = f"{sum(len(pages) for _, pages in jobs)} 区域をPDFとして保存しました:\n" + "\n".join(task.written_files[:10]) + ("\n..." if len(task.written_files) > 10 else "")
+            if cancel_event.is_set(): message = "一括エクスポートを中止しました。\n" + message
+            if errors: QMessageBox.warning(self, "一括エクスポート", message + "\n\n出力できなかった区域:\n" + "\n".join(f"{name}: {error}" for name, error in errors[:20]))
+            else: QMessageBox.information(self, "成功", message + "\n\n【重要】\n印刷する際は、必ず印刷設定で「実際のサイズ」または「倍率100%」を選択してください。")
+        if jobs: self._start_pdf_export(jobs, report)
+        else: QMessageBox.warning(self, "一括エクスポート", "出力できる区域がありませんでした。" + ("\n\n出力できなかった区域:\n" + "\n".join(f"{name}: {error}" for name, error in errors[:20]) if errors else ""))
+
+    def _collect_stands(self, calc_layers, stand_field=None):
+        if stand_field is None: return [(layer['layer_name'], layer['union']) for layer in calc_layers if layer.get('union') is not None]
+        stands = {}
+        for layer in calc_layers:
+            for stand_id, geom in _read_stand_geoms(layer['path'], _source_layer_name(layer), stand_field, layer.get('encoding')).items():
+                stands[stand_id] = unary_union([stands[stand_id], geom]) if stand_id in stands else geom
+        return sorted(stands.items())
+
+    def _draw_stand_page(self, stand_name, stand_geom):
+        # 区域だけを計算対象にしてレイアウト・最適土場・計算表を描き、出力する用紙をこの時点で決める
+        self.calc_area_override, self.master_bbox, self.map_offset_x, self.map_offset_y = stand_geom, list(stand_geom.bounds), 0.0, 0.0
+        self.grid_rows, self.grid_cols, self.page_orientation, self.map_rotation, _ = _choose_layout(stand_geom.convex_hull, self.master_bbox, self.k_value, (self.grid_rows_a4, self.grid_cols_a4), (self.grid_rows_a3, self.grid_cols_a3))
+        self.calculation_results_visible = False
+        self.redraw_all_layers(update_outline=False)
+        in_area_cells = self.get_in_area_cells()
+        if not in_area_cells: raise ValueError("計算対象の区域がありません")
+        allowed_mask = self._get_line_cell_mask() if self.landing_on_lines_checkbox.isChecked() else None
+        if allowed_mask is not None and not allowed_mask.any(): allowed_mask = None
+        self.landing_cell = _find_optimal_landing(_compute_landing_costs(in_area_cells, self.grid_rows, self.grid_cols), allowed_mask)
+        self.subtitle_input.setText(stand_name)
+        self.run_calculation_and_draw()
+        if not self.calculation_results_visible: raise ValueError("計算結果を描画できません")
+        source_rect = self._get_export_source_rect()
+        for page_layout in (self._get_export_page_layout(), self._get_export_page_layout(QPageLayout.Orientation.Landscape, QPageSize.PageSizeId.A3)):
+            (target_width_mm, target_height_mm), (printable_width_mm, printable_height_mm) = self._get_export_size_mm(page_layout, source_rect)
+            if target_width_mm <= printable_width_mm and target_height_mm <= printable_height_mm: return source_rect, page_layout
+        raise ValueError("1:5000スケールでは用紙に収まりません")
+
+    def _snapshot_stand_pages(self, stands, output_path, separate_files=False, on_progress=None, cancel_event=None):
+        # 区域ごとに描画したシーンを描画命令の列として控え、PDF の書き出しはワーカースレッドに任せる（separate_files では区域ごとに別ファイル）
+        saved_state = (self.master_bbox, self.grid_rows, self.grid_cols, self.page_orientation, self.map_rotation, self.map_offset_x, self.map_offset_y, self.landing_cell, self.subtitle_input.text(), self.calculation_results_visible)
+        jobs, errors = [], []
+        try:
+            for index, (stand_name, stand_geom) in enumerate(stands):
+                if cancel_event is not None and cancel_event.is_set(): break
+                if on_progress: on_progress(index, stand_name)
+                try: source_rect, page_layout = self._draw_stand_page(stand_name, stand_geom)
+                except Exception as e: errors.append((stand_name, str(e))); continue
+                page = self._snapshot_export_page(page_layout, source_rect)
+                if separate_files: jobs.append((os.path.join(output_path, f"X-Grid_{INVALID_FILENAME_PATTERN.sub('_', stand_name)}.pdf"), [page]))
+                elif jobs: jobs[0][1].append(page)
+                else: jobs.append((output_path, [page]))
+        finally:
+            self.calc_area_override = None
+            self.master_bbox, self.grid_rows, self.grid_cols, self.page_orientation, self.map_rotation, self.map_offset_x, self.map_offset_y, self.landing_cell, subtitle_text, results_visible = saved_state
+            self.subtitle_input.setText(subtitle_text); self.calculation_results_visible = False
+            self.redraw_all_layers(); self.auto_fit_view()
+            if self.landing_cell: self.set_landing_cell(*self.landing_cell)
+            if results_visible: self.run_calculation_and_draw()
+        return jobs, errors
+
+    def _snapshot_export_page(self, page_layout, source_rect):
+        # 表示中のシーンは変更せず、ポインタとヒートマップを除き、簡略化前の形状で描画命令を作る
+        display_list = _build_display_list(self.scene, source_rect, (self.pointer_item, self.heatmap_item), self._get_full_detail_paths())
+        return page_layout, self._get_export_target_rect(page_layout, source_rect), source_rect, display_list
+
+    def _start_pdf_export(self, jobs, on_done):
+        task = PdfExportTask(jobs, on_done)
+        task.signals.progress.connect(self._on_pdf_export_progress); task.signals.finished.connect(self._on_pdf_export_finished)
+        self._export_tasks.append(task); self._update_export_status(task, 0, sum(len(pages) for _, pages in jobs))
+        self.export_thread_pool.start(task)
+
+    def _on_pdf_export_progress(self, task, done, total): self._update_export_status(task, done, total)
+
+    def _on_pdf_export_finished(self, task):
+        if task in self._export_tasks: self._export_tasks.remove(task)
+        self._update_export_status(None, 0, 0)
+        task.on_done(task)
+
+    def _update_export_status(self, task, done, total):
+        if task is None or not self._export_tasks: self.export_status_label.setVisible(bool(self._export_tasks)); return
+        self.export_status_label.setText(f"PDF出力中: {done}/{total} ページ" + (f"（他 {len(self._export_tasks) - 1} 件待機中）" if len(self._export_tasks) > 1 else ""))
+        self.export_status_label.setVisible(True)
+
+    def _get_export_source_rect(self):
+        content_left, content_top, content_right, content_bottom = self.grid_offset_x - 90, self.grid_offset_y - 145, self.grid_offset_x + self.grid_cols * self.cell_size_on_screen + 5 + sum([40, 35, 45]), self.grid_offset_y + self.grid_rows * self.cell_size_on_screen + 5 + sum([50, 40, 50])
+        return QRectF(content_left, content_top, content_right - content_left, content_bottom - content_top)
+
+    def _get_export_page_layout(self, orientation=None, page_size_id=None):
+        is_a3 = self.grid_cols == self.grid_cols_a3 or (page_size_id == QPageSize.PageSizeId.A3)
+        page_size_id = page_size_id if page_size_id is not None else (QPageSize.PageSizeId.A3 if is_a3 else QPageSize.PageSizeId.A4)
+        return QPageLayout(QPageSize(page_size_id), orientation if orientation is not None else self.page_orientation, QMarginsF(0, 0, 0, 0), QPageLayout.Unit.Millimeter)
+
+    def _get_export_size_mm(self, page_layout, source_rect):
+        # 1:5000 で出力したときの必要サイズと、用紙の印刷可能サイズ (mm)
+        full_page_rect_mm, mm_per_scene_unit = page_layout.fullRect(QPageLayout.Unit.Millimeter), (self.k_value / self.cell_size_on_screen) / 5.0
+        return (source_rect.width() * mm_per_scene_unit, source_rect.height() * mm_per_scene_unit), (full_page_rect_mm.width() - 2 * EXPORT_MARGIN_MM, full_page_rect_mm.height() - 2 * EXPORT_MARGIN_MM)
+
+    def _get_export_target_rect(self, page_layout, source_rect, resolution=PDF_RESOLUTION):
+        (target_width_mm, target_height_mm), (printable_width_mm, printable_height_mm) = self._get_export_size_mm(page_layout, source_rect)
+        full_page_rect_mm, full_page_rect_px = page_layout.fullRect(QPageLayout.Unit.Millimeter), page_layout.fullRectPixels(resolution)
+        dpmm_x, dpmm_y = full_page_rect_px.width() / full_page_rect_mm.width(), full_page_rect_px.height() / full_page_rect_mm.height()
+        target_width_px, target_height_px, offset_x_px, offset_y_px = target_width_mm * dpmm_x, target_height_mm * dpmm_y, EXPORT_MARGIN_MM * dpmm_x + (printable_width_mm * dpmm_x - target_width_mm * dpmm_x) / 2.0, EXPORT_MARGIN_MM * dpmm_y + (printable_height_mm * dpmm_y - target_height_mm * dpmm_y) / 2.0
+        return QRectF(offset_x_px, offset_y_px, target_width_px, target_height_px)
 
     def export_results(self):
         if not self.subtitle_input.text().strip(): QMessageBox.warning(self, "入力エラー", "見出しが入力されていません。\n入力して「表示」ボタンを押してから、再度エクスポートしてください。"); return
@@ -1073,41 +2450,28 @@ class X_Grid(QMainWindow):
         self._export_results_recursive()
 
     def _export_results_recursive(self, force_orientation=None, force_page_size_id=None):
+        if force_orientation is None:
+            file_path, _ = QFileDialog.getSaveFileName(self, "結果をエクスポート", f"X-Grid_{self.subtitle_input.text().strip()}" or "X-Grid_計算結果", "PDF Document (*.pdf)")
+            if not file_path: return
+            self.export_file_path = file_path
+        else: file_path = self.export_file_path
+        if not file_path.lower().endswith(".pdf"): return
+        source_rect, page_layout = self._get_export_source_rect(), self._get_export_page_layout(force_orientation, force_page_size_id)
+        (target_width_mm, target_height_mm), (printable_width_mm, printable_height_mm) = self._get_export_size_mm(page_layout, source_rect)
+        if target_width_mm > printable_width_mm or target_height_mm > printable_height_mm:
+            msg_box = QMessageBox(self); msg_box.setIcon(QMessageBox.Icon.Warning); msg_box.setWindowTitle("サイズ超過")
+            msg_box.setText(f"1:5000スケールではコンテンツが用紙サイズ({page_layout.pageSize().name()})の印刷可能領域に収まりません。\n\n<b>必要サイズ:</b> {target_width_mm:.1f} x {target_height_mm:.1f} mm\n<b>印刷可能領域 (マージン{EXPORT_MARGIN_MM:.0f}mm):</b> {printable_width_mm:.1f} x {printable_height_mm:.1f} mm\n\nA3サイズでエクスポートを再試行しますか？")
+            retry_button, cancel_button = msg_box.addButton("A3で再試行", QMessageBox.ButtonRole.YesRole), msg_box.addButton("キャンセル", QMessageBox.ButtonRole.NoRole); msg_box.exec()
+            if msg_box.clickedButton() == retry_button: self._export_results_recursive(QPageLayout.Orientation.Landscape, QPageSize.PageSizeId.A3)
+            return
         QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
-        if self.pointer_item: self.pointer_item.hide()
-        try:
-            if force_orientation is None:
-                default_filename, (file_path, _) = f"X-Grid_{self.subtitle_input.text().strip()}" or "X-Grid_計算結果", QFileDialog.getSaveFileName(self, "結果をエクスポート", f"X-Grid_{self.subtitle_input.text().strip()}" or "X-Grid_計算結果", "PDF Document (*.pdf)")
-                if not file_path:
-                    if self.pointer_item: self.pointer_item.show(); QApplication.restoreOverrideCursor(); return
-                self.export_file_path = file_path
-            else: file_path = self.export_file_path
-            content_left, content_top, content_right, content_bottom = self.grid_offset_x - 90, self.grid_offset_y - 145, self.grid_offset_x + self.grid_cols * self.cell_size_on_screen + 5 + sum([40, 35, 45]), self.grid_offset_y + self.grid_rows * self.cell_size_on_screen + 5 + sum([50, 40, 50])
-            source_rect = QRectF(content_left, content_top, content_right - content_left, content_bottom - content_top)
-            if file_path.lower().endswith(".pdf"):
-                printer, orientation, is_a3 = QPrinter(QPrinter.PrinterMode.HighResolution), force_orientation if force_orientation is not None else self.page_orientation, self.grid_cols == self.grid_cols_a3 or (force_page_size_id == QPageSize.PageSizeId.A3)
-                printer.setOutputFormat(QPrinter.OutputFormat.PdfFormat); printer.setOutputFileName(file_path)
-                page_size_id, page_layout = force_page_size_id if force_page_size_id is not None else (QPageSize.PageSizeId.A3 if is_a3 else QPageSize.PageSizeId.A4), QPageLayout(QPageSize(force_page_size_id if force_page_size_id is not None else (QPageSize.PageSizeId.A3 if is_a3 else QPageSize.PageSizeId.A4)), orientation, QMarginsF(0, 0, 0, 0), QPageLayout.Unit.Millimeter)
-                printer.setPageLayout(page_layout)
-                full_page_rect_mm, full_page_rect_px = page_layout.fullRect(QPageLayout.Unit.Millimeter), printer.pageRect(QPrinter.Unit.DevicePixel)
-                dpmm_x, dpmm_y, margin_mm, mm_per_scene_unit = full_page_rect_px.width() / full_page_rect_mm.width(), full_page_rect_px.height() / full_page_rect_mm.height(), 5.0, (self.k_value / self.cell_size_on_screen) / 5.0
-                target_width_mm, target_height_mm, printable_width_mm, printable_height_mm = source_rect.width() * mm_per_scene_unit, source_rect.height() * mm_per_scene_unit, full_page_rect_mm.width() - 10.0, full_page_rect_mm.height() - 10.0
-                if target_width_mm > printable_width_mm or target_height_mm > printable_height_mm:
-                    msg_box = QMessageBox(self); msg_box.setIcon(QMessageBox.Icon.Warning); msg_box.setWindowTitle("サイズ超過")
-                    msg_box.setText(f"1:5000スケールではコンテンツが用紙サイズ({page_layout.pageSize().name()})の印刷可能領域に収まりません。\n\n<b>必要サイズ:</b> {target_width_mm:.1f} x {target_height_mm:.1f} mm\n<b>印刷可能領域 (マージン{margin_mm:.0f}mm):</b> {printable_width_mm:.1f} x {printable_height_mm:.1f} mm\n\nA3サイズでエクスポートを再試行しますか？")
-                    retry_button, cancel_button = msg_box.addButton("A3で再試行", QMessageBox.ButtonRole.YesRole), msg_box.addButton("キャンセル", QMessageBox.ButtonRole.NoRole); msg_box.exec()
-                    if msg_box.clickedButton() == retry_button: self._export_results_recursive(QPageLayout.Orientation.Landscape, QPageSize.PageSizeId.A3)
-                    if self.pointer_item: self.pointer_item.show(); QApplication.restoreOverrideCursor(); return
-                target_width_px, target_height_px, offset_x_px, offset_y_px = target_width_mm * dpmm_x, target_height_mm * dpmm_y, margin_mm * dpmm_x + (printable_width_mm * dpmm_x - target_width_mm * dpmm_x) / 2.0, margin_mm * dpmm_y + (printable_height_mm * dpmm_y - target_height_mm * dpmm_y) / 2.0
-                target_rect_px, pdf_painter = QRectF(offset_x_px, offset_y_px, target_width_px, target_height_px), QPainter(printer)
-                self._set_all_pens_cosmetic(False)
-                try: self.scene.render(pdf_painter, target_rect_px, source_rect)
-                finally: self._set_all_pens_cosmetic(True); pdf_painter.end()
-                QMessageBox.information(self, "成功", f"結果をPDFとして保存しました:\n{file_path}\n\n【重要】\n印刷する際は、必ず印刷設定で「実際のサイズ」または「倍率100%」を選択してください。")
-        except Exception as e: QMessageBox.critical(self, "エラー", f"エクスポート中にエラーが発生しました: {e}"); self._set_all_pens_cosmetic(True)
-        finally:
-            if self.pointer_item: self.pointer_item.show()
-            QApplication.restoreOverrideCursor()
+        try: page = self._snapshot_export_page(page_layout, source_rect)
+        except Exception as e: QMessageBox.critical(self, "エラー", f"エクスポート中にエラーが発生しました: {e}"); return
+        finally: QApplication.restoreOverrideCursor()
+        def report(task):
+            if task.error is not None: QMessageBox.critical(self, "エラー", f"エクスポート中にエラーが発生しました: {task.error}")
+            else: QMessageBox.information(self, "成功", f"結果をPDFとして保存しました:\n{file_path}\n\n【重要】\n印刷する際は、必ず印刷設定で「実際のサイズ」または「倍率100%」を選択してください。")
+        self._start_pdf_export([(file_path, [page])], report)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,125 @@
+import sys
+import csv
+import json
+import math
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from shapely.ops import unary_union
+
+from X_Grid import (
+    GRID_SIZE_A4, _read_layer, _build_valid_geoms, _choose_layout, _build_world_to_scene_params,
+    _classify_in_area_cells, _world_point_to_cell, _compute_average_distance
+)
+
+# X_Grid の画面上のグリッドと同じ値（計算結果を画面操作と一致させるため）
+CELL_SIZE_ON_SCREEN = 25
+GRID_ORIGIN = (60, 40)
+
+OUTPUT_FIELDS = [
+    'stand', 'paper', 'grid_rows', 'grid_cols', 'rotation', 'in_area_cells', 'landing_row', 'landing_col',
+    'total_product_v', 'total_product_h', 'average_distance', 'average_distance_rounded', 'message', 'error'
+]
+
+def _first_point(geom_dict):
+    if not geom_dict: return None
+    if geom_dict['type'] == 'Point': return tuple(geom_dict['coordinates'][:2])
+    if geom_dict['type'] == 'MultiPoint' and geom_dict['coordinates']: return tuple(geom_dict['coordinates'][0][:2])
+    return None
+
+def _load_landing_points(path, layer, landing_field):
+    features, geom_type, _, _ = _read_layer(path, layer)
+    if 'Point' not in geom_type: raise ValueError(f"土場レイヤはポイントである必要があります: {geom_type}")
+    landings = {}
+    for feature in features:
+        key, point = feature['properties'].get(landing_field), _first_point(feature.get('geometry'))
+        if key is not None and point is not None: landings.setdefault(str(key), point)
+    return landings
+
+def build_tasks(args):
+    features, geom_type, _, _ = _read_layer(args.input, args.layer)
+    if 'Polygon' not in geom_type: raise ValueError(f"区域レイヤはポリゴンである必要があります: {geom_type}")
+    landings = _load_landing_points(args.landing_layer, args.landing_layer_name, args.landing_field or args.stand_field) if args.landing_layer else {}
+    stands = {}
+    for feature in features:
+        properties = feature['properties']
+        stand_id = properties.get(args.stand_field)
+        if stand_id is None or not feature.get('geometry'): continue
+        stand = stands.setdefault(str(stand_id), {'geometries': [], 'landing': landings.get(str(stand_id)), 'landing_error': None})
+        # fiona のジオメトリをプロセス間で受け渡せる素の辞書に変換
+        stand['geometries'].append({'type': feature['geometry']['type'], 'coordinates': feature['geometry']['coordinates']})
+        if stand['landing'] is None and args.landing_x_field and args.landing_y_field:
+            landing_x, landing_y = properties.get(args.landing_x_field), properties.get(args.landing_y_field)
+            if landing_x is not None and landing_y is not None:
+                # 数値でない座標はその区域だけのエラーとして出力し、他の区域の計算は続ける
+                try: stand['landing'], stand['landing_error'] = (float(landing_x), float(landing_y)), None
+                except (TypeError, ValueError): stand['landing_error'] = f"土場の座標が数値ではありません: ({landing_x}, {landing_y})"
+    return [(stand_id, stand['geometries'], stand['landing'], args.k, stand['landing_error']) for stand_id, stand in stands.items()]
+
+def compute_stand(task):
+    stand_id, geometries, landing, k_value, landing_error = task
+    row = {field: '' for field in OUTPUT_FIELDS}
+    row['stand'] = stand_id
+    try:
+        valid_geoms = _build_valid_geoms([{'geometry': geom} for geom in geometries])
+        if not valid_geoms: raise ValueError("有効なポリゴンがありません")
+        stand_geom = unary_union(valid_geoms)
+        master_bbox = list(stand_geom.bounds)
+        grid_rows, grid_cols, _, map_rotation, info_message = _choose_layout(stand_geom.convex_hull, master_bbox, k_value)
+        params = _build_world_to_scene_params(master_bbox, map_rotation, k_value, CELL_SIZE_ON_SCREEN, GRID_ORIGIN, (grid_rows, grid_cols))
+        in_area_cells = _classify_in_area_cells(stand_geom, params['matrix'], CELL_SIZE_ON_SCREEN, GRID_ORIGIN, (grid_rows, grid_cols))
+        row.update({'paper': 'A4' if (grid_rows, grid_cols) == GRID_SIZE_A4 else 'A3', 'grid_rows': grid_rows, 'grid_cols': grid_cols, 'rotation': map_rotation, 'in_area_cells': len(in_area_cells), 'message': info_message})
+        if not in_area_cells: raise ValueError("計算対象の区域がありません")
+        if landing is None: raise ValueError(landing_error or "土場の位置が指定されていません")
+        landing_cell = _world_point_to_cell(landing[0], landing[1], params['matrix'], CELL_SIZE_ON_SCREEN, GRID_ORIGIN, (grid_rows, grid_cols))
+        if landing_cell is None: raise ValueError("土場がグリッドの範囲外です")
+        calc_data = _compute_average_distance(in_area_cells, landing_cell, grid_rows, grid_cols, k_value)
+        row.update({'landing_row': calc_data['landing_row'], 'landing_col': calc_data['landing_col'], 'total_product_v': calc_data['total_product_v'], 'total_product_h': calc_data['total_product_h'],
+                    'average_distance': math.floor(calc_data['final_distance'] * 10) / 10, 'average_distance_rounded': int(calc_data['final_distance'] + 0.5)})
+    except Exception as e:
+        row['error'] = str(e)
+    return row
+
+def write_rows(rows, output_path):
+    if output_path.lower().endswith('.json'):
+        with open(output_path, 'w', encoding='utf-8') as f: json.dump(rows, f, ensure_ascii=False, indent=2)
+    else:
+        # Excel で文字化けしないよう BOM 付き UTF-8 で出力
+        with open(output_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS)
+            writer.writeheader(); writer.writerows(rows)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="X_Grid 平均集材距離の一括計算（GUIなし）")
+    parser.add_argument('input', help="区域ポリゴンのファイル (.shp または .gpkg)")
+    parser.add_argument('--layer', help="GPKG内の区域レイヤ名")
+    parser.add_argument('--stand-field', required=True, help="フィーチャを区域ごとに分ける属性名")
+    parser.add_argument('--landing-x-field', help="土場のX座標を持つ属性名")
+    parser.add_argument('--landing-y-field', help="土場のY座標を持つ属性名")
+    parser.add_argument('--landing-layer', help="土場ポイントのファイル (.shp または .gpkg)")
+    parser.add_argument('--landing-layer-name', help="GPKG内の土場ポイントのレイヤ名")
+    parser.add_argument('--landing-field', help="土場ポイント側の区域名の属性名（省略時は --stand-field と同じ）")
+    parser.add_argument('--k', type=float, default=25.0, help="1セルの辺長 K (m)")
+    parser.add_argument('--workers', type=int, default=None, help="並列プロセス数（省略時はCPUコア数）")
+    parser.add_argument('-o', '--output', required=True, help="出力ファイル (.csv または .json)")
+    args = parser.parse_args(argv)
+    if not args.landing_layer and not (args.landing_x_field and args.landing_y_field):
+        parser.error("--landing-layer または --landing-x-field/--landing-y-field のどちらかを指定してください")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    tasks = build_tasks(args)
+    if not tasks: print("計算対象の区域がありません。", file=sys.stderr); return 1
+    rows = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for i, row in enumerate(executor.map(compute_stand, tasks, chunksize=max(1, len(tasks) // 64)), 1):
+            rows.append(row)
+            print(f"[{i}/{len(tasks)}] {row['stand']}: {row['error'] or str(row['average_distance']) + ' m'}", file=sys.stderr)
+    write_rows(rows, args.output)
+    return 0 if not any(row['error'] for row in rows) else 2
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
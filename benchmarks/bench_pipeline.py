@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+
+# 画面を持たない環境でも同じ条件で測れるよう、Qt は offscreen で動かす
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fiona
+import numpy as np
+import shapely
+from fiona.crs import CRS
+from PyQt6.QtCore import Qt, QPoint, QPointF, QEvent, PYQT_VERSION_STR, QT_VERSION_STR
+from PyQt6.QtGui import QMouseEvent
+from PyQt6.QtWidgets import QApplication, QMessageBox
+
+import X_Grid
+from X_Grid import X_Grid as XGridWindow
+
+STAGES = ('load', 'load_cached', 'determine_layout', 'get_in_area_cells', 'redraw_all_layers', 'pan_frame', 'pan_release', 'run_calculation_and_draw', 'pdf_snapshot', 'pdf_write')
+CRS_JGD2011 = CRS.from_epsg(6677)
+
+def _wavy_ring(center_x, center_y, radius_x, radius_y, vertices, rng):
+    phase = rng.random() * math.tau
+    ring = [(center_x + radius_x * (1 + 0.2 * math.sin(5 * a + phase)) * math.cos(a), center_y + radius_y * (1 + 0.2 * math.sin(5 * a + phase)) * math.sin(a))
+            for a in (math.tau * i / vertices for i in range(vertices))]
+    return ring + ring[:1]
+
+def generate_data(out_dir, args):
+    # 区域ポリゴン（格子状に並べた波形の多角形）と、区域を横切る作業道ライン（ランダムウォーク）を作る
+    rng, width, height = random.Random(args.seed), args.extent[0], args.extent[1]
+    cols = max(1, math.ceil(math.sqrt(args.stands * width / height)))
+    rows = math.ceil(args.stands / cols)
+    cell_w, cell_h = width / cols, height / rows
+    stands = [{'geometry': {'type': 'Polygon', 'coordinates': [_wavy_ring(args.origin[0] + (i % cols + 0.5) * cell_w, args.origin[1] + (i // cols + 0.5) * cell_h, cell_w * 0.45, cell_h * 0.45, args.stand_vertices, rng)]},
+               'properties': {'stand': f"S{i:04d}", 'fill_color': f"{rng.randrange(256)},{rng.randrange(256)},{rng.randrange(256)},255", 'strk_color': '0,0,0', 'strk_width': '0.26', 'strk_style': 'solid'}} for i in range(args.stands)]
+    lines = []
+    for i in range(args.lines):
+        x, y, heading, step = args.origin[0] + rng.random() * width, args.origin[1] + rng.random() * height, rng.random() * math.tau, max(width, height) / args.line_vertices
+        coords = []
+        for _ in range(args.line_vertices):
+            coords.append((x, y)); heading += rng.uniform(-0.3, 0.3)
+            # 範囲の端で向きを反転し、データ範囲（＝レイアウト）を extent の中に収める
+            if not args.origin[0] <= x + step * math.cos(heading) <= args.origin[0] + width: heading = math.pi - heading
+            if not args.origin[1] <= y + step * math.sin(heading) <= args.origin[1] + height: heading = -heading
+            x += step * math.cos(heading); y += step * math.sin(heading)
+        lines.append({'geometry': {'type': 'LineString', 'coordinates': coords}, 'properties': {'meter': float(round(shapely.LineString(coords).length)), 'strk_color': '#0000ff', 'strk_width': '0.5', 'strk_style': ('solid', 'dash')[i % 2]}})
+    stand_schema = {'geometry': 'Polygon', 'properties': {'stand': 'str', 'fill_color': 'str', 'strk_color': 'str', 'strk_width': 'str', 'strk_style': 'str'}}
+    line_schema = {'geometry': 'LineString', 'properties': {'meter': 'float', 'strk_color': 'str', 'strk_width': 'str', 'strk_style': 'str'}}
+    if args.format == 'gpkg':
+        path = os.path.join(out_dir, 'bench.gpkg')
+        for layer_name, schema, features in (('stands', stand_schema, stands), ('roads', line_schema, lines)):
+            with fiona.open(path, 'w', driver='GPKG', layer=layer_name, schema=schema, crs=CRS_JGD2011) as dst: dst.writerecords(features)
+        return [(path, ['stands', 'roads'])]
+    sources = []
+    for name, schema, features in (('stands', stand_schema, stands), ('roads', line_schema, lines)):
+        path = os.path.join(out_dir, f"{name}.shp")
+        with fiona.open(path, 'w', driver='ESRI Shapefile', schema=schema, crs=CRS_JGD2011, encoding='utf-8') as dst: dst.writerecords(features)
+        sources.append((path, [None]))
+    return sources
+
+def _timed(func):
+    start = time.perf_counter(); result = func()
+    return time.perf_counter() - start, result
+
+def _send_mouse(view, event_type, pos, button, buttons, modifiers):
+    QApplication.sendEvent(view.viewport(), QMouseEvent(event_type, QPointF(pos), QPointF(view.viewport().mapToGlobal(pos)), button, buttons, modifiers))
+
+def run_once(sources, args, cache_dir, out_dir, repeat_index):
+    timings, counts = {}, {}
+    # 読み込み: キャッシュが空の状態（fiona で解析）と、キャッシュに載った状態の両方を測る
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    window = None
+    for stage in ('load', 'load_cached'):
+        if window: window.close()
+        window = XGridWindow(); window.resize(1600, 1000); window.show(); QApplication.processEvents()
+        timings[stage], _ = _timed(lambda: [window.add_layers_from_file(path, layer_names) for path, layer_names in sources])
+    window.update_master_bbox()
+    window.last_info_message = ""
+    timings['determine_layout'], _ = _timed(window.determine_layout)
+    window.redraw_all_layers(update_outline=False); window.auto_fit_view(); QApplication.processEvents()
+    # 区域の結合と区域内セルの判定をキャッシュなしで測る
+    window._union_cache['key'], window._in_area_cache['key'] = None, None
+    timings['get_in_area_cells'], in_area_cells = _timed(window.get_in_area_cells)
+    timings['redraw_all_layers'], _ = _timed(window.redraw_all_layers)
+    QApplication.processEvents()
+    # Ctrl+ドラッグ: マウスイベントを送り、1回の移動ごとにビューポートを同期して描き直した時間を1フレームとする
+    view, center = window.view, window.view.viewport().rect().center()
+    _send_mouse(view, QEvent.Type.MouseButtonPress, center, Qt.MouseButton.LeftButton, Qt.MouseButton.LeftButton, Qt.KeyboardModifier.ControlModifier)
+    frame_times = []
+    for frame in range(args.pan_frames):
+        offset = center + QPoint(round(40 * math.sin(frame / 5)), round(25 * math.cos(frame / 7)))
+        frame_time, _ = _timed(lambda: (_send_mouse(view, QEvent.Type.MouseMove, offset, Qt.MouseButton.NoButton, Qt.MouseButton.LeftButton, Qt.KeyboardModifier.ControlModifier), view.viewport().repaint()))
+        frame_times.append(frame_time)
+    timings['pan_frame'] = statistics.mean(frame_times) if frame_times else 0.0
+    timings['pan_release'], _ = _timed(lambda: _send_mouse(view, QEvent.Type.MouseButtonRelease, center, Qt.MouseButton.LeftButton, Qt.MouseButton.NoButton, Qt.KeyboardModifier.ControlModifier))
+    in_area_cells = window.get_in_area_cells()
+    if in_area_cells:
+        landing_cell = in_area_cells[len(in_area_cells) // 2]
+        window.set_landing_cell(*landing_cell); window.subtitle_input.setText("ベンチマーク")
+        timings['run_calculation_and_draw'], _ = _timed(window.run_calculation_and_draw)
+        window.update_title_display()
+        source_rect, page_layout = window._get_export_source_rect(), window._get_export_page_layout()
+        timings['pdf_snapshot'], page = _timed(lambda: window._snapshot_export_page(page_layout, source_rect))
+        pdf_path = os.path.join(out_dir, f"bench_{repeat_index}.pdf")
+        timings['pdf_write'], _ = _timed(lambda: X_Grid._write_pdf_jobs([(pdf_path, [page])]))
+        counts['pdf_bytes'] = os.path.getsize(pdf_path)
+    counts.update({
+        'features': sum(layer['store']['count'] for layer in window.layers), 'vertices': sum(len(layer['store']['coords']) for layer in window.layers),
+        'grid': [window.grid_rows, window.grid_cols], 'map_rotation': window.map_rotation, 'in_area_cells': len(in_area_cells), 'scene_items': len(window.scene.items())
+    })
+    window.close()
+    return timings, counts
+
+def summarize(runs):
+    return {stage: {'median': statistics.median(values), 'min': min(values), 'mean': statistics.mean(values), 'runs': values}
+            for stage in STAGES for values in [[run[stage] for run in runs if stage in run]] if values}
+
+def compare(results, baseline, threshold):
+    # 中央値が基準より threshold の割合を超えて遅くなった段階を返す
+    if baseline.get('parameters') != results['parameters']: print("警告: 基準とデータの生成条件が異なります。比較結果は参考値です。", file=sys.stderr)
+    regressions = []
+    print(f"{'stage':<26}{'baseline':>12}{'current':>12}{'ratio':>8}")
+    for stage, summary in results['stages'].items():
+        base = baseline.get('stages', {}).get(stage)
+        if not base: print(f"{stage:<26}{'-':>12}{summary['median'] * 1000:>10.1f}ms{'-':>8}"); continue
+        ratio = summary['median'] / base['median'] if base['median'] > 0 else float('inf')
+        print(f"{stage:<26}{base['median'] * 1000:>10.1f}ms{summary['median'] * 1000:>10.1f}ms{ratio:>8.2f}" + ("  <-- 遅くなりました" if ratio > 1 + threshold else ""))
+        if ratio > 1 + threshold: regressions.append(stage)
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="X_Grid の読み込み→レイアウト→区域判定→描画→PDF出力の処理時間を測定します")
+    parser.add_argument('--format', choices=('gpkg', 'shp'), default='gpkg', help="生成する入力データの形式")
+    parser.add_argument('--stands', type=int, default=40, help="区域ポリゴンの数")
+    parser.add_argument('--stand-vertices', type=int, default=2000, help="区域ポリゴン1つあたりの頂点数")
+    parser.add_argument('--lines', type=int, default=400, help="ラインの数")
+    parser.add_argument('--line-vertices', type=int, default=200, help="ライン1本あたりの頂点数")
+    parser.add_argument('--extent', type=float, nargs=2, default=(1400.0, 900.0), metavar=('WIDTH', 'HEIGHT'), help="データ範囲の幅と高さ (m)")
+    parser.add_argument('--origin', type=float, nargs=2, default=(-30000.0, -120000.0), metavar=('X', 'Y'), help="データ範囲の左下の座標")
+    parser.add_argument('--pan-frames', type=int, default=60, help="Ctrl+ドラッグで描き直すフレーム数")
+    parser.add_argument('--repeat', type=int, default=5, help="全段階を繰り返す回数（中央値を比較に使う）")
+    parser.add_argument('--seed', type=int, default=1, help="データ生成の乱数シード")
+    parser.add_argument('-o', '--output', help="結果を書き出す JSON ファイル")
+    parser.add_argument('--baseline', help="比較する基準の JSON ファイル（このスクリプトで書き出したもの）")
+    parser.add_argument('--threshold', type=float, default=0.2, help="中央値がこの割合を超えて遅くなったら失敗とする（0.2 = 20%%）")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    # レイアウト決定時などのメッセージボックスで止まらないよう、内容は標準エラーに出す
+    for name in ('information', 'warning', 'critical'): setattr(QMessageBox, name, staticmethod(lambda parent, title, text, *rest, **kwargs: print(f"[{title}] {text}", file=sys.stderr)))
+    with tempfile.TemporaryDirectory(prefix='xgrid_bench_') as work_dir:
+        # 読み込みキャッシュは一時ディレクトリに置き、普段使いのキャッシュを汚さない
+        cache_dir = X_Grid.PARSE_CACHE_DIR = os.path.join(work_dir, 'parse_cache')
+        generation_time, sources = _timed(lambda: generate_data(work_dir, args))
+        print(f"データ生成: {generation_time:.2f} s ({args.format})", file=sys.stderr)
+        runs, counts = [], None
+        for repeat_index in range(args.repeat):
+            timings, counts = run_once(sources, args, cache_dir, work_dir, repeat_index)
+            runs.append(timings)
+            print(f"[{repeat_index + 1}/{args.repeat}] " + ", ".join(f"{stage} {value * 1000:.1f}ms" for stage, value in timings.items()), file=sys.stderr)
+    parameters = {key: (list(value) if isinstance(value, tuple) else value) for key, value in vars(args).items() if key not in ('output', 'baseline', 'threshold', 'repeat')}
+    results = {
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'machine': platform.machine(), 'cpu_count': os.cpu_count(), 'qt': QT_VERSION_STR, 'pyqt': PYQT_VERSION_STR, 'numpy': np.__version__, 'shapely': shapely.__version__, 'fiona': fiona.__version__},
+        'parameters': parameters, 'counts': counts, 'stages': summarize(runs)
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f: json.dump(results, f, ensure_ascii=False, indent=2)
+    else: json.dump(results, sys.stdout, ensure_ascii=False, indent=2); print()
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f: baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions: print("遅くなった段階: " + ", ".join(regressions), file=sys.stderr); return 1
+    app.processEvents()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,23 @@
+import csv
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fiona
+from fiona.crs import CRS
+
+import X_Grid_batch
+
+def test_non_numeric_landing_is_reported_per_stand(tmp_path):
+    input_path, output_path = str(tmp_path / 'stands.shp'), str(tmp_path / 'result.csv')
+    schema = {'geometry': 'Polygon', 'properties': {'name': 'str', 'lx': 'str', 'ly': 'str'}}
+    with fiona.open(input_path, 'w', driver='ESRI Shapefile', schema=schema, crs=CRS.from_epsg(6677), encoding='utf-8') as dst:
+        for name, x0, landing_x in (('A', 0, '300'), ('B', 2000, 'abc')):
+            ring = [(x0, 0), (x0 + 600, 0), (x0 + 600, 400), (x0, 400), (x0, 0)]
+            dst.write({'geometry': {'type': 'Polygon', 'coordinates': [ring]}, 'properties': {'name': name, 'lx': landing_x, 'ly': '200'}})
+
+    assert X_Grid_batch.main([input_path, '--stand-field', 'name', '--landing-x-field', 'lx', '--landing-y-field', 'ly', '--workers', '1', '-o', output_path]) == 2
+    with open(output_path, encoding='utf-8-sig') as f: rows = {row['stand']: row for row in csv.DictReader(f)}
+    assert rows['A']['error'] == '' and float(rows['A']['average_distance']) > 0
+    assert 'abc' in rows['B']['error'] and rows['B']['paper'] == 'A4'
@@ -0,0 +1,27 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fiona
+import pytest
+from fiona.crs import CRS
+
+import X_Grid
+
+def _write_shp(path, encoding, name):
+    with fiona.open(path, 'w', driver='ESRI Shapefile', schema={'geometry': 'Point', 'properties': {'name': 'str'}}, crs=CRS.from_epsg(6677), encoding=encoding) as dst:
+        dst.write({'geometry': {'type': 'Point', 'coordinates': (0, 0)}, 'properties': {'name': name}})
+
+@pytest.mark.parametrize('encoding, expected', [('cp932', 'cp932'), ('utf-8', 'utf-8')])
+def test_resolve_encoding_from_dbf_bytes(tmp_path, encoding, expected):
+    path = str(tmp_path / 'points.shp'); _write_shp(path, encoding, "林班")
+    os.remove(str(tmp_path / 'points.cpg'))
+    assert X_Grid._resolve_encoding(path) == expected
+    assert X_Grid._read_layer(path, None)[0][0]['properties']['name'] == "林班"
+
+def test_resolve_encoding_prefers_cpg(tmp_path):
+    path = str(tmp_path / 'points.shp'); _write_shp(path, 'cp932', "林班")
+    with open(str(tmp_path / 'points.cpg'), 'w', encoding='ascii') as f: f.write("SJIS")
+    assert X_Grid._resolve_encoding(path) == 'cp932'
+    assert X_Grid._resolve_encoding(str(tmp_path / 'stands.gpkg')) == 'utf-8'
@@ -0,0 +1,54 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import Polygon
+
+import X_Grid
+
+def test_coverage_fractions_match_intersection_areas():
+    rng = np.random.default_rng(0)
+    # 穴あきポリゴンと、グリッドの外にはみ出すポリゴン
+    outer = shapely.buffer(shapely.points(52, 37), 30, quad_segs=5)
+    geom = shapely.union(shapely.difference(outer, shapely.buffer(shapely.points(55, 40), 9)), Polygon(rng.uniform(-20, 120, (3, 2))).convex_hull)
+    origin_x, origin_y, cell_size, rows, cols = 3.5, -1.25, 7.0, 12, 14
+    fractions = X_Grid._compute_coverage_fractions(geom, origin_x, origin_y, cell_size, rows, cols)
+    rr, cc = np.mgrid[0:rows, 0:cols]
+    cells = shapely.box(origin_x + cc * cell_size, origin_y + rr * cell_size, origin_x + (cc + 1) * cell_size, origin_y + (rr + 1) * cell_size)
+    np.testing.assert_allclose(fractions, shapely.area(shapely.intersection(cells, geom)) / cell_size ** 2, atol=1e-9)
+
+def _fits(points, angle, target_width, target_height):
+    theta = np.radians(angle)
+    u, v = points[:, 0] * np.cos(theta) - points[:, 1] * np.sin(theta), points[:, 0] * np.sin(theta) + points[:, 1] * np.cos(theta)
+    return np.ptp(u) <= target_width and np.ptp(v) <= target_height
+
+def test_rotation_matches_brute_force_sweep():
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        points = rng.normal(size=(12, 2)) * rng.uniform(5, 60, 2)
+        hull = shapely.multipoints(points).convex_hull
+        hull_points = shapely.get_coordinates(hull)
+        size = np.ptp(hull_points, axis=0).max()
+        target_width, target_height = rng.uniform(0.6, 1.1) * size, rng.uniform(0.6, 1.1) * size
+        # 整数の角度を総当たりして、収まる最小の角度と一致すること
+        expected = next((angle for angle in range(1, 90) if _fits(hull_points, angle, target_width, target_height)), None)
+        assert X_Grid._find_optimal_rotation(hull, target_width, target_height) == expected
+        # 1°未満の精度の角度では収まり、それより少し小さい角度では収まらないこと
+        exact = X_Grid._find_optimal_rotation(hull, target_width, target_height, precision=None)
+        if exact is not None and exact > 1 + 1e-3:
+            assert _fits(hull_points, exact, target_width * (1 + 1e-9), target_height * (1 + 1e-9))
+            assert not _fits(hull_points, exact - 1e-3, target_width, target_height)
+
+def test_landing_costs_match_average_distance():
+    rng = np.random.default_rng(2)
+    rows, cols = 9, 13
+    in_area_cells = [tuple(cell) for cell in np.argwhere(rng.random((rows, cols)) < 0.4)]
+    costs = X_Grid._compute_landing_costs(in_area_cells, rows, cols)
+    for row in range(rows):
+        for col in range(cols):
+            calc_data = X_Grid._compute_average_distance(in_area_cells, (row, col), rows, cols, 25.0)
+            assert costs[row, col] == pytest.approx(calc_data['total_product_v'] + calc_data['total_product_h'])
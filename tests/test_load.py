@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fiona
+import pytest
+from fiona.crs import CRS
+from PyQt6.QtWidgets import QApplication, QMessageBox
+
+import X_Grid
+
+@pytest.fixture
+def window(tmp_path, monkeypatch):
+    app = QApplication.instance() or QApplication([])
+    monkeypatch.setattr(X_Grid, 'PARSE_CACHE_DIR', str(tmp_path / 'parse_cache'))
+    for name in ('information', 'warning', 'critical'): monkeypatch.setattr(QMessageBox, name, staticmethod(lambda *args, **kwargs: None))
+    win = X_Grid.X_Grid(); win.resize(1200, 900); win.show(); app.processEvents()
+    yield win
+    win.close()
+
+def _write_shp(path, geom_type, geometries):
+    with fiona.open(path, 'w', driver='ESRI Shapefile', schema={'geometry': geom_type, 'properties': {'name': 'str'}}, crs=CRS.from_epsg(6677), encoding='utf-8') as dst:
+        dst.writerecords({'geometry': geometry, 'properties': {'name': str(i)}} for i, geometry in enumerate(geometries))
+
+def _wait_for_loads(win, timeout=30):
+    deadline = time.monotonic() + timeout
+    while (win._load_tasks or win._deferred_loads) and time.monotonic() < deadline: QApplication.processEvents(); time.sleep(0.01)
+    assert not win._load_tasks and not win._deferred_loads
+
+def test_dropped_lines_wait_for_polygons_in_same_drop(window, tmp_path):
+    stand_path, lines_path = str(tmp_path / 'stand.shp'), str(tmp_path / 'lines.shp')
+    _write_shp(stand_path, 'Polygon', [{'type': 'Polygon', 'coordinates': [[(0, 0), (600, 0), (600, 400), (0, 400), (0, 0)]]}])
+    # 林班のそばの線1本と、100 km 離れた線1本
+    _write_shp(lines_path, 'LineString', [{'type': 'LineString', 'coordinates': [(100, 100), (500, 300)]}, {'type': 'LineString', 'coordinates': [(100000, 100000), (100500, 100300)]}])
+
+    window.handle_dropped_files([lines_path, stand_path])
+    _wait_for_loads(window)
+
+    lines_layer = next(layer for layer in window.layers if layer['layer_name'] == 'lines')
+    assert lines_layer['store']['count'] == 1
+    assert lines_layer['bbox'][2] < 1000
+
+def test_clipped_lines_are_reread_when_stands_grow(window, tmp_path):
+    near_path, far_path, lines_path = str(tmp_path / 'near.shp'), str(tmp_path / 'far.shp'), str(tmp_path / 'lines.shp')
+    _write_shp(near_path, 'Polygon', [{'type': 'Polygon', 'coordinates': [[(0, 0), (600, 0), (600, 400), (0, 400), (0, 0)]]}])
+    _write_shp(far_path, 'Polygon', [{'type': 'Polygon', 'coordinates': [[(100000, 100000), (100600, 100000), (100600, 100400), (100000, 100400), (100000, 100000)]]}])
+    _write_shp(lines_path, 'LineString', [{'type': 'LineString', 'coordinates': [(100, 100), (500, 300)]}, {'type': 'LineString', 'coordinates': [(100100, 100100), (100500, 100300)]}])
+
+    window.add_layers_from_file(near_path, [None]); window.add_layers_from_file(lines_path, [None])
+    assert next(layer for layer in window.layers if layer['layer_name'] == 'lines')['store']['count'] == 1
+
+    window.add_layers_from_file(far_path, [None])
+    lines_layer = next(layer for layer in window.layers if layer['layer_name'] == 'lines')
+    assert lines_layer['store']['count'] == 2
+    assert not X_Grid._read_bbox_too_small(lines_layer['read_bbox'], window._get_calc_bbox(), window.k_value)
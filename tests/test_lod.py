@@ -0,0 +1,43 @@
+import os
+import sys
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fiona
+import numpy as np
+import shapely
+from fiona.crs import CRS
+from PyQt6.QtWidgets import QApplication, QMessageBox
+from shapely.geometry import MultiPolygon, Polygon
+
+import X_Grid
+
+def test_simplify_keeps_shared_borders_together():
+    # 細かくジグザグした共有境界を持つ隣接林班
+    border = [(x, 50 + (3 if x % 2 else -3)) for x in range(0, 101)]
+    south, north = Polygon([(0, 0), (100, 0)] + border[::-1]), Polygon(border + [(100, 100), (0, 100)])
+    _, coords, offsets = shapely.to_ragged_array([MultiPolygon([south]), MultiPolygon([north])])
+    store = {'family': 'Polygon', 'count': 2, 'coords': coords, 'offsets': tuple(np.asarray(offset, dtype=np.int64) for offset in offsets), 'columns': {}}
+
+    simplified_south, simplified_north = X_Grid._store_geometries(X_Grid._simplify_store(store, 10.0))
+    assert shapely.get_num_coordinates(simplified_south) < shapely.get_num_coordinates(south)
+    # 隙間も重なりもなく、元の範囲をちょうど覆う
+    assert shapely.area(shapely.intersection(simplified_south, simplified_north)) < 1e-9
+    assert abs(shapely.area(shapely.union(simplified_south, simplified_north)) - 100 * 100) < 1e-9
+
+def test_apply_level_of_detail_skips_point_layers(tmp_path, monkeypatch):
+    app = QApplication.instance() or QApplication([])
+    monkeypatch.setattr(X_Grid, 'PARSE_CACHE_DIR', str(tmp_path / 'parse_cache'))
+    for name in ('information', 'warning', 'critical'): monkeypatch.setattr(QMessageBox, name, staticmethod(lambda *args, **kwargs: None))
+    stand_path, points_path = str(tmp_path / 'stand.shp'), str(tmp_path / 'points.shp')
+    for path, geom_type, geometry in ((stand_path, 'Polygon', {'type': 'Polygon', 'coordinates': [[(0, 0), (600, 0), (600, 400), (0, 400), (0, 0)]]}), (points_path, 'Point', {'type': 'Point', 'coordinates': (300, 200)})):
+        with fiona.open(path, 'w', driver='ESRI Shapefile', schema={'geometry': geom_type, 'properties': {'name': 'str'}}, crs=CRS.from_epsg(6677)) as dst:
+            dst.write({'geometry': geometry, 'properties': {'name': 'A'}})
+    window = X_Grid.X_Grid(); window.resize(1200, 900); window.show(); app.processEvents()
+    try:
+        window.add_layers_from_file(stand_path, [None]); window.add_layers_from_file(points_path, [None]); window.update_layout_and_redraw()
+        window.view.resetTransform(); window.view.scale(0.01, 0.01); window.apply_level_of_detail()
+        layers = {layer['layer_name']: layer for layer in window.layers}
+        assert layers['stand'].get('lod_cache') and 'lod_cache' not in layers['points']
+    finally: window.close()
@@ -0,0 +1,63 @@
+import os
+import sys
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fiona
+import pytest
+from fiona.crs import CRS
+from PyQt6.QtCore import Qt, QPoint, QPointF, QEvent
+from PyQt6.QtGui import QMouseEvent
+from PyQt6.QtWidgets import QApplication, QMessageBox
+
+import X_Grid
+
+@pytest.fixture
+def window(tmp_path, monkeypatch):
+    app = QApplication.instance() or QApplication([])
+    monkeypatch.setattr(X_Grid, 'PARSE_CACHE_DIR', str(tmp_path / 'parse_cache'))
+    for name in ('information', 'warning', 'critical'): monkeypatch.setattr(QMessageBox, name, staticmethod(lambda *args, **kwargs: None))
+    path = str(tmp_path / 'stand.gpkg')
+    ring = [(0, 0), (600, 0), (600, 400), (0, 400), (0, 0)]
+    with fiona.open(path, 'w', driver='GPKG', layer='stand', schema={'geometry': 'Polygon', 'properties': {'name': 'str'}}, crs=CRS.from_epsg(6677)) as dst:
+        dst.write({'geometry': {'type': 'Polygon', 'coordinates': [ring]}, 'properties': {'name': 'A'}})
+    win = X_Grid.X_Grid(); win.resize(1200, 900); win.show(); app.processEvents()
+    win.add_layers_from_file(path, ['stand']); win.update_layout_and_redraw()
+    yield win
+    win.close()
+
+def _send_mouse(view, event_type, pos, button, buttons):
+    QApplication.sendEvent(view.viewport(), QMouseEvent(event_type, QPointF(pos), QPointF(view.viewport().mapToGlobal(pos)), button, buttons, Qt.KeyboardModifier.ControlModifier))
+
+def test_ctrl_drag_clears_results_and_landing(window):
+    in_area_cells = window.get_in_area_cells()
+    window.set_landing_cell(*in_area_cells[0]); window.run_calculation_and_draw()
+    window.subtitle_input.setText("テスト"); window.update_title_display()
+    assert window.calculation_results_visible and window.calculation_items and window.title_items
+
+    view, start = window.view, window.view.viewport().rect().center()
+    _send_mouse(view, QEvent.Type.MouseButtonPress, start, Qt.MouseButton.LeftButton, Qt.MouseButton.LeftButton)
+    _send_mouse(view, QEvent.Type.MouseMove, start + QPoint(13, 7), Qt.MouseButton.NoButton, Qt.MouseButton.LeftButton)
+    _send_mouse(view, QEvent.Type.MouseButtonRelease, start + QPoint(13, 7), Qt.MouseButton.LeftButton, Qt.MouseButton.NoButton)
+
+    assert (window.map_offset_x, window.map_offset_y) != (0.0, 0.0)
+    assert not window.calculation_results_visible
+    assert not window.calculation_items and not window.result_text_items and not window.title_items
+    assert window.pointer_item is None and window.landing_cell is None
+    scene_items = set(window.scene.items())
+    assert window.in_area_cells_outline in scene_items
+
+def test_ctrl_click_without_drag_keeps_results(window):
+    in_area_cells = window.get_in_area_cells()
+    window.set_landing_cell(*in_area_cells[0]); window.run_calculation_and_draw()
+    pointer_item, calculation_items = window.pointer_item, list(window.calculation_items)
+
+    view, start = window.view, window.view.viewport().rect().center()
+    _send_mouse(view, QEvent.Type.MouseButtonPress, start, Qt.MouseButton.LeftButton, Qt.MouseButton.LeftButton)
+    _send_mouse(view, QEvent.Type.MouseButtonRelease, start, Qt.MouseButton.LeftButton, Qt.MouseButton.NoButton)
+
+    assert (window.map_offset_x, window.map_offset_y) == (0.0, 0.0)
+    assert window.calculation_results_visible and window.calculation_items == calculation_items
+    assert window.landing_cell == in_area_cells[0] and window.pointer_item is pointer_item and pointer_item.scene() is window.scene
+    assert window.in_area_cells_outline in set(window.scene.items())
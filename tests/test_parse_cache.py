@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+import X_Grid
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(X_Grid, 'PARSE_CACHE_DIR', str(tmp_path / 'parse_cache'))
+    monkeypatch.setattr(X_Grid, '_parse_cache_mapped', set())
+    return tmp_path / 'parse_cache'
+
+def test_entry_without_meta_is_rewritten(cache_dir):
+    # 削除し損ねて meta.json だけ消えたエントリ
+    entry_path = str(cache_dir / 'entry'); os.makedirs(entry_path)
+    np.save(os.path.join(entry_path, 'coords.npy'), np.zeros((2, 2)))
+    X_Grid._write_parse_cache(entry_path, {'layer_names': ['a']})
+    assert X_Grid._read_parse_cache(entry_path) == {'layer_names': ['a']}
+
+def test_eviction_removes_leftovers_and_stale_temp_but_keeps_mapped(cache_dir):
+    arrays = {'coords': np.zeros(1024 * 1024, dtype=np.uint8)}
+    for name in ('old', 'mapped', 'new'): X_Grid._write_parse_cache(str(cache_dir / name), {}, arrays); time.sleep(0.01)
+    leftover, stale_temp, fresh_temp = str(cache_dir / 'leftover'), str(cache_dir / 'stale.tmp'), str(cache_dir / 'fresh.tmp')
+    for path in (leftover, stale_temp, fresh_temp): os.makedirs(path); np.save(os.path.join(path, 'coords.npy'), arrays['coords'])
+    old_time = time.time() - X_Grid.PARSE_CACHE_TEMP_MAX_AGE - 60; os.utime(stale_temp, (old_time, old_time))
+    os.utime(str(cache_dir / 'mapped' / 'meta.json'), (old_time, old_time))
+    X_Grid._parse_cache_mapped.add(str(cache_dir / 'mapped'))
+
+    X_Grid._evict_parse_cache(max_bytes=2 * 1024 * 1024 + 4096)
+    assert sorted(os.listdir(cache_dir)) == ['fresh.tmp', 'mapped', 'new']
+
+def test_cached_layer_round_trip(cache_dir, tmp_path, monkeypatch):
+    import fiona
+    from fiona.crs import CRS
+    path = str(tmp_path / 'stands.gpkg')
+    with fiona.open(path, 'w', driver='GPKG', layer='stands', schema={'geometry': 'Polygon', 'properties': {'strk_color': 'str', 'meter': 'float', 'fill_color': 'str'}}, crs=CRS.from_epsg(6677)) as dst:
+        for i, (color, meter) in enumerate((("#00ff00", 1.5), ("青", None))):
+            ring = [(i * 100, 0), (i * 100 + 100, 0), (i * 100 + 100, 80), (i * 100, 80), (i * 100, 0)]
+            dst.write({'geometry': {'type': 'Polygon', 'coordinates': [ring]}, 'properties': {'strk_color': color, 'meter': meter, 'fill_color': '#ff0000' if i else ''}})
+
+    loaded, errors = X_Grid._load_layers(path, ['stands'], None, 25.0)
+    assert not errors
+    # 2回目は fiona を使わずにキャッシュから復元する
+    monkeypatch.setattr(X_Grid.fiona, 'open', lambda *args, **kwargs: pytest.fail("read from source"))
+    cached, errors = X_Grid._load_layers(path, ['stands'], None, 25.0)
+    assert not errors
+    original, restored = loaded['stands'], cached['stands']
+    for key in ('layer_name', 'geom_type', 'bbox', 'area', 'encoding', 'source_fingerprint', 'read_bbox'): assert restored[key] == original[key]
+    np.testing.assert_array_equal(restored['store']['coords'], original['store']['coords'])
+    for restored_offset, original_offset in zip(restored['store']['offsets'], original['store']['offsets'], strict=True): np.testing.assert_array_equal(restored_offset, original_offset)
+    assert [X_Grid._store_value(restored['store']['columns']['strk_color'], i) for i in range(2)] == ["#00ff00", "青"]
+    assert [X_Grid._store_value(restored['store']['columns']['meter'], i) for i in range(2)] == [1.5, None]
+    assert restored['union'].equals(original['union']) and restored['hull'].equals(original['hull'])
+    np.testing.assert_array_equal(restored['style_table']['indices'], original['style_table']['indices'])
+    assert [style['fill_color'].name() for style in restored['style_table']['styles']] == [style['fill_color'].name() for style in original['style_table']['styles']]
@@ -0,0 +1,52 @@
+import os
+import sys
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fiona
+import numpy as np
+import pytest
+from fiona.crs import CRS
+from PyQt6.QtWidgets import QApplication, QMessageBox
+
+import X_Grid
+
+@pytest.fixture
+def make_window(tmp_path, monkeypatch):
+    app = QApplication.instance() or QApplication([])
+    monkeypatch.setattr(X_Grid, 'PARSE_CACHE_DIR', str(tmp_path / 'parse_cache'))
+    for name in ('information', 'warning', 'critical'): monkeypatch.setattr(QMessageBox, name, staticmethod(lambda *args, **kwargs: None))
+    windows = []
+    def make():
+        win = X_Grid.X_Grid(); win.resize(1200, 900); win.show(); app.processEvents(); windows.append(win)
+        return win
+    yield make
+    for win in windows: win.close()
+
+def test_project_round_trip(make_window, tmp_path, monkeypatch):
+    path = str(tmp_path / 'stands.gpkg')
+    with fiona.open(path, 'w', driver='GPKG', layer='stands', schema={'geometry': 'Polygon', 'properties': {'fill_color': 'str'}}, crs=CRS.from_epsg(6677)) as dst:
+        dst.write({'geometry': {'type': 'Polygon', 'coordinates': [[(0, 0), (600, 0), (650, 400), (0, 380), (0, 0)]]}, 'properties': {'fill_color': '#8000ff00'}})
+    with fiona.open(path, 'w', driver='GPKG', layer='roads', schema={'geometry': 'LineString', 'properties': {'meter': 'float'}}, crs=CRS.from_epsg(6677)) as dst:
+        dst.write({'geometry': {'type': 'LineString', 'coordinates': [(50, 50), (550, 300)]}, 'properties': {'meter': 560.0}})
+
+    saved = make_window()
+    saved.add_layers_from_file(path, ['stands', 'roads']); saved.update_layout_and_redraw()
+    saved.set_landing_cell(*saved.get_in_area_cells()[0]); saved.run_calculation_and_draw()
+    saved.subtitle_input.setText("第1林班"); saved.update_title_display()
+    project_path = str(tmp_path / 'test.xgrid'); saved.save_project(project_path)
+
+    # 元データが変わっていなければ、fiona を使わずに開く
+    monkeypatch.setattr(X_Grid.fiona, 'open', lambda *args, **kwargs: pytest.fail("read from source"))
+    opened = make_window()
+    assert opened.open_project(project_path) == ([], [])
+    assert [layer['layer_name'] for layer in opened.layers] == [layer['layer_name'] for layer in saved.layers]
+    for original, restored in zip(saved.layers, opened.layers):
+        np.testing.assert_array_equal(restored['store']['coords'], original['store']['coords'])
+        assert restored['bbox'] == original['bbox'] and restored['read_bbox'] == original['read_bbox']
+        assert [style['fill_color'].name(X_Grid.QColor.NameFormat.HexArgb) for style in restored['style_table']['styles']] == [style['fill_color'].name(X_Grid.QColor.NameFormat.HexArgb) for style in original['style_table']['styles']]
+    assert (opened.grid_rows, opened.grid_cols, opened.map_rotation) == (saved.grid_rows, saved.grid_cols, saved.map_rotation)
+    assert sorted(opened.get_in_area_cells()) == sorted(saved.get_in_area_cells())
+    assert opened.landing_cell == saved.landing_cell and opened.calculation_results_visible
+    assert opened.subtitle_input.text() == "第1林班"
@@ -0,0 +1,45 @@
+import os
+import sys
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from PyQt6.QtGui import QColor
+
+import X_Grid
+
+QML = """<qgis><renderer-v2 type="categorizedSymbol" attr="kind">
+<categories><category value="road" symbol="0" render="true"/><category value="" symbol="1" render="true"/></categories>
+<symbols>
+<symbol name="0" type="line"><layer class="SimpleLine" enabled="1"><Option type="Map">
+<Option name="line_color" value="255,0,0,255"/><Option name="line_width" value="2"/><Option name="line_width_unit" value="MapUnit"/>
+</Option></layer></symbol>
+<symbol name="1" type="line"><layer class="SimpleLine" enabled="1"><Option type="Map">
+<Option name="line_color" value="0,0,255,255"/><Option name="line_width" value="7.2"/><Option name="line_width_unit" value="Point"/>
+</Option></layer></symbol>
+</symbols></renderer-v2></qgis>"""
+
+def _store(columns):
+    return {'family': 'LineString', 'count': 2, 'coords': np.zeros((4, 2)), 'offsets': (np.array([0, 2, 4]), np.array([0, 1, 2])), 'columns': {name: X_Grid._column_array(values) for name, values in columns.items()}}
+
+def test_parse_qml_renderer_converts_width_units():
+    layer_style = X_Grid._parse_qml_renderer(QML)
+    assert layer_style['fields'] == ['kind']
+    road, other = X_Grid._match_layer_style(layer_style, {'kind': 'road'}), X_Grid._match_layer_style(layer_style, {'kind': 'path'})
+    assert (road['strk_color'], road['strk_unit'], float(road['strk_width'])) == (QColor(255, 0, 0).name(QColor.NameFormat.HexArgb), 'MAPUNIT', 2.0)
+    assert other['strk_unit'] == 'MM' and float(other['strk_width']) == pytest.approx(2.54)
+
+def test_generic_color_column_does_not_hide_qml_style():
+    layer_style = X_Grid._parse_qml_renderer(QML)
+    style_table = X_Grid._build_style_table(_store({'kind': ['road', 'path'], 'color': ['green', 'green']}), layer_style)
+    styles = [style_table['styles'][index] for index in style_table['indices']]
+    assert [style['line_color'].name() for style in styles] == ['#ff0000', '#0000ff']
+    assert styles[0]['line_width_unit'] == 'MAPUNIT'
+
+def test_styler_columns_take_precedence_over_qml():
+    layer_style = X_Grid._parse_qml_renderer(QML)
+    columns = {'kind': ['road', 'path'], 'fill_color': ['', ''], 'strk_color': ['#ff00ff00', '#ff00ff00'], 'strk_width': ['0.5', '0.5'], 'strk_style': ['solid', 'solid']}
+    style_table = X_Grid._build_style_table(_store(columns), layer_style)
+    assert {style['line_color'].name() for style in style_table['styles']} == {'#00ff00'}